@@ -4,7 +4,10 @@ from pathlib import Path
 import subprocess
 import tempfile
 import json
+import gzip
+import time
 import requests
+from collections import deque
 from urllib.parse import urlparse, urlunparse
 
 # --- Configuration Loading ---
@@ -39,6 +42,84 @@ def load_config():
 
 config = load_config()
 
+# --- Atlas Service ---
+SERVICE_TOKEN_PATH = Path(__file__).parent.parent / 'atlas_core' / 'cache' / 'service.token'
+SERVICE_ADDRESS_PATH = Path(__file__).parent.parent / 'atlas_core' / 'cache' / 'service.address'
+
+def service_headers():
+    """The Authorization header for the Atlas service, from the token `atlas serve` writes."""
+    return {"Authorization": f"Bearer {SERVICE_TOKEN_PATH.read_text().strip()}"}
+
+def atlas_service_url():
+    """URL of a running `atlas serve`, or None. While it is up, actions run there instead of in a new interpreter."""
+    service = (config or {}).get('service', {})
+    try:
+        # Where `atlas serve` actually listens (it may have been given --host/--port/--socket)
+        service = json.loads(SERVICE_ADDRESS_PATH.read_text())
+    except (OSError, ValueError):
+        pass
+    if service.get('socket'):
+        return None  # Unix sockets are for CLI clients
+    url = f"http://{service.get('host', '127.0.0.1')}:{service.get('port', 8765)}"
+    try:
+        requests.get(f"{url}/health", headers=service_headers(), timeout=0.5).raise_for_status()
+        return url
+    except (requests.exceptions.RequestException, OSError):
+        return None
+
+def run_service_job(service_url, job_request, on_update=None):
+    """Submit a job to the Atlas service and poll it until it finishes; returns the final job."""
+    headers = service_headers()
+    response = requests.post(f"{service_url}/jobs", json=job_request, headers=headers, timeout=30)
+    job = response.json()
+    if response.status_code >= 400:
+        return {"state": "failed", "error": job.get('error')}
+    while job['state'] not in ('done', 'failed', 'cancelled'):
+        if on_update:
+            on_update(job)
+        job = requests.get(f"{service_url}/jobs/{job['id']}?wait=1", headers=headers, timeout=60).json()
+    return job
+
+# --- Live Logs ---
+LOG_VIEW_LINES = 500       # lines kept on screen while a command streams
+LOG_VIEW_INTERVAL = 0.25   # seconds between re-renders
+LOG_PAGE_BYTES = 64 * 1024
+
+class LiveLog:
+    """The tail of a streaming log in a placeholder, re-rendered at most every LOG_VIEW_INTERVAL seconds."""
+
+    def __init__(self, placeholder):
+        self.placeholder = placeholder
+        self.lines = deque(maxlen=LOG_VIEW_LINES)
+        self.total = 0
+        self.rendered_at = 0.0
+
+    def add(self, line):
+        self.lines.append(line)
+        self.total += 1
+        if time.monotonic() - self.rendered_at >= LOG_VIEW_INTERVAL:
+            self.render()
+
+    def text(self):
+        hidden = self.total - len(self.lines)
+        prefix = f"... {hidden:,} earlier lines not shown ...\n" if hidden else ""
+        return prefix + "".join(self.lines)
+
+    def render(self):
+        self.placeholder.code(self.text(), language="bash")
+        self.rendered_at = time.monotonic()
+
+def show_step_log(step, key):
+    """A result step's log; a step whose output was spilled to disk can be paged through in full."""
+    st.code(step['log'], language="bash")
+    log_file = step.get('log_file')
+    if log_file and Path(log_file).exists():
+        pages = -(-step['log_bytes'] // LOG_PAGE_BYTES)
+        page = st.number_input(f"Full output: page (of {pages})", min_value=1, max_value=pages, value=1, key=key)
+        with gzip.open(log_file, 'rb') as f:
+            f.seek((page - 1) * LOG_PAGE_BYTES)
+            st.code(f.read(LOG_PAGE_BYTES).decode('utf-8', errors='replace'), language="bash")
+
 # --- UI Rendering ---
 st.set_page_config(
     page_title="Atlas Self-Healing Agent",
@@ -131,30 +212,76 @@ with tab2:
                     # Path to the core agent script
                     script_path = Path(__file__).parent.parent / "atlas_core" / "tools" / "generate_patch.py"
                     
-                    with st.spinner("Atlas is thinking... This may take a moment."):
-                        try:
-                            # We assume generate_patch.py can take a log file and outputs structured JSON
-                            # We also assume it's being run from the root of the project
-                            process = subprocess.run(
-                                ["python", str(script_path), "--log-file", str(log_file_path)],
-                                capture_output=True,
-                                text=True,
-                                check=True,
-                                cwd=Path(__file__).parent.parent # Run from the root directory
-                            )
-                            
-                            # Assuming the script prints a JSON object to stdout
-                            patch_data = json.loads(process.stdout)
-                            st.session_state['patch_data'] = patch_data
-                            st.success("Patch generated successfully!")
-
-                        except subprocess.CalledProcessError as e:
-                            st.error(f"Failed to generate patch. The agent returned an error:")
-                            st.code(e.stderr, language="bash")
-                        except json.JSONDecodeError:
-                            st.error("The agent script did not return valid JSON. Cannot display patch.")
-                        except Exception as e:
-                            st.error(f"An unexpected error occurred: {e}")
+                    fields_placeholder = st.empty()
+                    patch_placeholder = st.empty()
+                    streamed_fields = {}
+
+                    service_url = atlas_service_url()
+                    if service_url:
+                        def show_fields(job):
+                            summary = {k: v for k, v in job['fields'].items() if k != 'patch_diff'}
+                            if summary:
+                                fields_placeholder.json(summary)
+                            if 'patch_diff' in job['fields']:
+                                patch_placeholder.code(job['fields']['patch_diff'], language="diff")
+
+                        with st.spinner("The Atlas service is working on it..."):
+                            try:
+                                job = run_service_job(service_url, {"kind": "propose", "error_log_text": error_log},
+                                                      on_update=show_fields)
+                                if job['state'] == 'done':
+                                    st.session_state['patch_data'] = job['result']['patch_data']
+                                    st.success("Patch generated successfully!")
+                                else:
+                                    st.error(f"Failed to generate patch: {job['error']}")
+                            except requests.exceptions.RequestException as e:
+                                st.error(f"Lost contact with the Atlas service: {e}")
+                    else:
+                        with st.spinner("Atlas is thinking... This may take a moment."):
+                            try:
+                                # Stream the proposal so fields render as the model produces them.
+                                # The script emits ATLAS_STREAM: events and prints the final JSON object last.
+                                process = subprocess.Popen(
+                                    ["python", "-u", str(script_path), "--log-file", str(log_file_path),
+                                     "--json-output", "--stream"],
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    text=True,
+                                    cwd=Path(__file__).parent.parent, # Run from the root directory
+                                    bufsize=1,
+                                    universal_newlines=True
+                                )
+
+                                final_output = ""
+                                for line in iter(process.stdout.readline, ''):
+                                    if not line.startswith("ATLAS_STREAM:"):
+                                        final_output = line
+                                        continue
+                                    event = json.loads(line.replace("ATLAS_STREAM:", "", 1))
+                                    if event['event'] == 'field':
+                                        streamed_fields[event['field']] = event['value']
+                                        summary = {k: v for k, v in streamed_fields.items() if k != 'patch_diff'}
+                                        fields_placeholder.json(summary)
+                                        if event['field'] == 'patch_diff':
+                                            patch_placeholder.code(event['value'], language="diff")
+                                    elif event['field'] == 'patch_diff':
+                                        patch_placeholder.code(event['value'], language="diff")
+
+                                stderr_output = process.stderr.read()
+                                if process.wait() != 0:
+                                    raise subprocess.CalledProcessError(process.returncode, process.args, stderr=stderr_output)
+
+                                patch_data = json.loads(final_output)
+                                st.session_state['patch_data'] = patch_data
+                                st.success("Patch generated successfully!")
+
+                            except subprocess.CalledProcessError as e:
+                                st.error(f"Failed to generate patch. The agent returned an error:")
+                                st.code(e.stderr, language="bash")
+                            except json.JSONDecodeError:
+                                st.error("The agent script did not return valid JSON. Cannot display patch.")
+                            except Exception as e:
+                                st.error(f"An unexpected error occurred: {e}")
                 else:
                     st.warning("Please paste an error log before generating a patch.")
 
@@ -162,56 +289,77 @@ with tab2:
     st.subheader("2. Verify Patch")
     with st.container(border=True):
         verify_disabled = 'patch_data' not in st.session_state
-        
+        reuse_verification = st.checkbox("Reuse cached verification", value=True,
+                                         help="Untick to rerun the build and tests even if this patch was verified before.")
+
         if st.button("Verify Patch", disabled=verify_disabled, type="primary"):
             patch_data = st.session_state.get('patch_data')
             if patch_data:
-                # Create a temporary file for the patch diff
-                with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix=".diff", prefix="atlas-patch-") as temp_patch_file:
-                    temp_patch_file.write(patch_data['patch_diff'])
-                    patch_file_path = temp_patch_file.name
+                service_url = atlas_service_url()
+                if service_url:
+                    with st.spinner("Verifying on the Atlas service..."):
+                        try:
+                            job = run_service_job(service_url, {"kind": "verify", "patch_text": patch_data['patch_diff'],
+                                                                 "use_cache": reuse_verification})
+                            if job['state'] == 'done':
+                                st.session_state['verification_result'] = job['result']
+                                if job['result'].get("verification_status") == "pass":
+                                    st.success("✅ Verification Passed!")
+                                else:
+                                    st.error("❌ Verification Failed. See logs for details.")
+                            else:
+                                st.error(f"Verification could not run: {job['error']}")
+                        except requests.exceptions.RequestException as e:
+                            st.error(f"Lost contact with the Atlas service: {e}")
+                else:
+                    # Create a temporary file for the patch diff
+                    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix=".diff", prefix="atlas-patch-") as temp_patch_file:
+                        temp_patch_file.write(patch_data['patch_diff'])
+                        patch_file_path = temp_patch_file.name
 
-                # Path to the verification script
-                script_path = Path(__file__).parent.parent / "atlas_core" / "tools" / "verify_patch.py"
-                
-                st.write("--- Verification Log ---")
-                log_placeholder = st.empty()
-                full_log = ""
-                
-                try:
-                    # Use Popen to stream output in real-time
-                    process = subprocess.Popen(
-                        ["python", "-u", str(script_path), "--patch-file", patch_file_path],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        cwd=Path(__file__).parent.parent, # Run from the root directory
-                        bufsize=1,
-                        universal_newlines=True
-                    )
-
-                    final_json_result = None
-                    for line in iter(process.stdout.readline, ''):
-                        if line.startswith("ATLAS_JSON_RESULT:"):
-                            final_json_result = json.loads(line.replace("ATLAS_JSON_RESULT:", "").strip())
-                            break # Stop reading log here
-                        full_log += line
-                        log_placeholder.code(full_log, language="bash")
+                    # Path to the verification script
+                    script_path = Path(__file__).parent.parent / "atlas_core" / "tools" / "verify_patch.py"
                     
-                    process.wait()
-
-                    if final_json_result:
-                        st.session_state['verification_result'] = final_json_result
-                        if final_json_result.get("verification_status") == "pass":
-                            st.success("✅ Verification Passed!")
+                    st.write("--- Verification Log ---")
+                    live_log = LiveLog(st.empty())
+                    
+                    try:
+                        # Use Popen to stream output in real-time
+                        command = ["python", "-u", str(script_path), "--patch-file", patch_file_path]
+                        if not reuse_verification:
+                            command.append("--no-cache")
+                        process = subprocess.Popen(
+                            command,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT,
+                            text=True,
+                            cwd=Path(__file__).parent.parent, # Run from the root directory
+                            bufsize=1,
+                            universal_newlines=True
+                        )
+
+                        final_json_result = None
+                        for line in iter(process.stdout.readline, ''):
+                            if line.startswith("ATLAS_JSON_RESULT:"):
+                                final_json_result = json.loads(line.replace("ATLAS_JSON_RESULT:", "").strip())
+                                break # Stop reading log here
+                            live_log.add(line)
+                        live_log.render()
+                        
+                        process.wait()
+
+                        if final_json_result:
+                            st.session_state['verification_result'] = final_json_result
+                            if final_json_result.get("verification_status") == "pass":
+                                st.success("✅ Verification Passed!")
+                            else:
+                                st.error("❌ Verification Failed. See logs for details.")
                         else:
-                            st.error("❌ Verification Failed. See logs for details.")
-                    else:
-                        st.error("Verification script did not return a final result.")
+                            st.error("Verification script did not return a final result.")
 
-                except Exception as e:
-                    st.error(f"An unexpected error occurred during verification: {e}")
-                    st.code(full_log, language="bash") # Show what we got
+                    except Exception as e:
+                        st.error(f"An unexpected error occurred during verification: {e}")
+                        st.code(live_log.text(), language="bash") # Show what we got
             else:
                 st.warning("No patch data found to verify.")
 
@@ -223,9 +371,9 @@ with tab2:
                 st.error("❌ Verification Failed")
             
             with st.expander("Show Full Verification Log"):
-                for step in result.get("steps", []):
+                for index, step in enumerate(result.get("steps", [])):
                     st.write(f"**Step:** {step['name']} (Exit Code: {step['code']})")
-                    st.code(step['log'], language="bash")
+                    show_step_log(step, key=f"verification_log_page_{index}")
 
 
     # --- 3. Apply Patch
@@ -471,8 +619,7 @@ def run_apply_script(push: bool):
         command.append("--push")
 
     st.write("--- Application Log ---")
-    log_placeholder = st.empty()
-    full_log = ""
+    live_log = LiveLog(st.empty())
     
     try:
         process = subprocess.Popen(
@@ -490,8 +637,8 @@ def run_apply_script(push: bool):
             if line.startswith("ATLAS_JSON_RESULT:"):
                 final_json_result = json.loads(line.replace("ATLAS_JSON_RESULT:", "").strip())
                 break
-            full_log += line
-            log_placeholder.code(full_log, language="bash")
+            live_log.add(line)
+        live_log.render()
         
         process.wait()
 
@@ -510,7 +657,7 @@ def run_apply_script(push: bool):
 
     except Exception as e:
         st.error(f"An unexpected error occurred during application: {e}")
-        st.code(full_log, language="bash")
+        st.code(live_log.text(), language="bash")
 
 
 def run_rollback_script(commit_hash: str, push: bool):
@@ -525,8 +672,7 @@ def run_rollback_script(commit_hash: str, push: bool):
         command.append("--push")
 
     st.write("--- Rollback Log ---")
-    log_placeholder = st.empty()
-    full_log = ""
+    live_log = LiveLog(st.empty())
     
     try:
         process = subprocess.Popen(
@@ -544,8 +690,8 @@ def run_rollback_script(commit_hash: str, push: bool):
             if line.startswith("ATLAS_JSON_RESULT:"):
                 final_json_result = json.loads(line.replace("ATLAS_JSON_RESULT:", "").strip())
                 break
-            full_log += line
-            log_placeholder.code(full_log, language="bash")
+            live_log.add(line)
+        live_log.render()
         
         process.wait()
 
@@ -563,7 +709,7 @@ def run_rollback_script(commit_hash: str, push: bool):
 
     except Exception as e:
         st.error(f"An unexpected error occurred during rollback: {e}")
-        st.code(full_log, language="bash")
+        st.code(live_log.text(), language="bash")
 
 with tab6:
     st.header("Get More Models")
@@ -620,8 +766,7 @@ with tab6:
                     payload = {"name": model_to_pull, "stream": True}
                     
                     st.write(f"--- Pulling `{model_to_pull}` ---")
-                    log_placeholder = st.empty()
-                    full_log = ""
+                    live_log = LiveLog(st.empty())
                     
                     try:
                         with requests.post(pull_url, json=payload, stream=True, timeout=30) as r:
@@ -641,11 +786,10 @@ with tab6:
                                     
                                     if total > 0:
                                         progress = completed / total
-                                        full_log += f"{status} - {progress:.1%}\n"
+                                        live_log.add(f"{status} - {progress:.1%}\n")
                                     else:
-                                        full_log += f"{status}\n"
-                                    
-                                    log_placeholder.code(full_log, language="bash")
+                                        live_log.add(f"{status}\n")
+                            live_log.render()
                         
                         st.success(f"Successfully pulled `{model_to_pull}`. Refreshing model list...")
                         st.rerun()
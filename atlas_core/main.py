@@ -15,6 +15,13 @@ def main():
         epilog="""
 Examples:
   atlas propose --error-log error.txt       # Generate patch proposal
+  atlas propose --batch failed_logs/        # Propose for every log in a directory (or glob)
+  atlas propose --error-log error.txt --candidates 3  # Race 3 candidates, keep the first good one
+  atlas refine --error-log error.txt        # Propose, verify and refine until the patch passes
+  atlas index                               # Build/refresh the target repo symbol index
+  atlas serve                               # Run the Atlas service (warm process, job queue)
+  atlas propose --error-log error.txt --service --branch main  # Queue the proposal on the service
+  atlas jobs                                # List service jobs (atlas jobs <id> [--cancel])
   atlas verify --patch patch.diff           # Verify patch in worktree
   atlas apply --patch patch.diff            # Apply verified patch
   atlas rollback --commit abc123            # Rollback applied patch
@@ -26,9 +33,42 @@ Examples:
     
     # Propose command
     propose_parser = subparsers.add_parser('propose', help='Generate patch proposal from error logs')
-    propose_parser.add_argument('--error-log', required=True, help='Path to error log file')
+    propose_source = propose_parser.add_mutually_exclusive_group(required=True)
+    propose_source.add_argument('--error-log', help='Path to error log file')
+    propose_source.add_argument('--batch', help='Directory or glob of error logs to propose in one run')
     propose_parser.add_argument('--output', default='suggested_patch.diff', help='Output patch file')
     propose_parser.add_argument('--dry-run', action='store_true', help='Generate proposal without saving')
+    propose_parser.add_argument('--stream', action='store_true', help='Stream tokens and show fields as they complete')
+    propose_parser.add_argument('--no-cache', action='store_true', help='Bypass the response cache and always run inference')
+    propose_parser.add_argument('--candidates', type=int, default=1, help='Race N candidates (varied temperature/seed/model)')
+    propose_parser.add_argument('--output-dir', default='batch_patches', help='Batch mode: directory for per-log patches')
+    propose_parser.add_argument('--max-workers', type=int, help='Batch mode: override hardware.primary_gpu.max_batch_size')
+    propose_parser.add_argument('--service', action='store_true', help='Run on the Atlas service instead of in this process')
+    propose_parser.add_argument('--branch', help='Service mode: branch of the failure (sets the job priority)')
+    
+    # Refine command
+    refine_parser = subparsers.add_parser('refine', help='Propose, verify and refine a patch until it passes')
+    refine_parser.add_argument('--error-log', required=True, help='Path to error log file')
+    refine_parser.add_argument('--output', default='suggested_patch.diff', help='Output patch file')
+    refine_parser.add_argument('--max-retries', type=int, help='Override iteration.max_retries')
+    refine_parser.add_argument('--no-cache', action='store_true', help='Bypass the response cache for the first proposal')
+    refine_parser.add_argument('--service', action='store_true', help='Run on the Atlas service instead of in this process')
+    refine_parser.add_argument('--branch', help='Service mode: branch of the failure (sets the job priority)')
+    
+    # Index command
+    index_parser = subparsers.add_parser('index', help='Build or refresh the target repo symbol index')
+    index_parser.add_argument('--repo', help='target_repos entry to index (default: all with a path)')
+    index_parser.add_argument('--rebuild', action='store_true', help='Re-read every tracked file')
+    
+    # Service commands
+    serve_parser = subparsers.add_parser('serve', help='Run the Atlas service (one warm process for CLI and UI jobs)')
+    serve_parser.add_argument('--host', help='Listen address (default: service.host)')
+    serve_parser.add_argument('--port', type=int, help='Listen port (default: service.port)')
+    serve_parser.add_argument('--socket', help='Listen on a Unix socket instead of TCP')
+    jobs_parser = subparsers.add_parser('jobs', help='List Atlas service jobs, or show/cancel one')
+    jobs_parser.add_argument('job_id', nargs='?', help='Job to show')
+    jobs_parser.add_argument('--state', help='Only list jobs in this state')
+    jobs_parser.add_argument('--cancel', action='store_true', help='Cancel the job')
     
     # Verify command
     verify_parser = subparsers.add_parser('verify', help='Verify patch in isolated worktree')
@@ -56,9 +96,97 @@ Examples:
         sys.exit(1)
     
     # Import and dispatch commands
-    if args.command == 'propose':
-        from atlas_core.tools.generate_patch import propose_patch
-        propose_patch(args.error_log, args.output, args.dry_run)
+    if args.command in ('propose', 'refine') and args.service:
+        from atlas_core.tools.atlas_service import run_job
+        from atlas_core.tools.generate_patch import save_proposal
+        if args.command == 'propose' and args.batch:
+            print("❌ --service takes a single --error-log")
+            sys.exit(1)
+        params = {"error_log_text": Path(args.error_log).read_text(), "branch": args.branch,
+                  "use_cache": not args.no_cache}
+        on_update = None
+        if args.command == 'refine':
+            params.update(output=str(Path(args.output).resolve()), max_retries=args.max_retries)
+        else:
+            params.update(candidates=args.candidates, stream=args.stream)
+            if args.stream:
+                # The service streams the fields into the job; report each as it arrives
+                reported = set()
+                def on_update(job):
+                    for name in job['fields']:
+                        if name not in reported:
+                            reported.add(name)
+                            print(f"   ↳ {name} received")
+        try:
+            job = run_job(args.command, params, on_update=on_update)
+        except OSError as e:
+            print(f"❌ Atlas service not reachable: {e}", file=sys.stderr)
+            sys.exit(1)
+        except RuntimeError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"🛰️  Job {job['id']} {job['state']} (queued {job['queue_ms']:.0f} ms, "
+              f"shared by {job['submitters']} submitter(s))")
+        if job['state'] != 'done':
+            print(f"❌ {job['error']}")
+            sys.exit(1)
+        if args.command == 'refine':
+            if job['result']['status'] != 'pass':
+                sys.exit(2)
+        elif not args.dry_run:
+            save_proposal(job['result']['patch_data'], args.output, args.error_log)
+            print(f"💾 Patch saved to: {args.output}")
+    
+    elif args.command == 'propose':
+        if args.batch:
+            from atlas_core.tools.batch_propose import batch_propose
+            batch_propose(args.batch, args.output_dir, args.dry_run, use_cache=not args.no_cache,
+                          max_workers=args.max_workers)
+        else:
+            from atlas_core.tools.generate_patch import propose_patch
+            propose_patch(args.error_log, args.output, args.dry_run, stream=args.stream, use_cache=not args.no_cache,
+                          candidates=args.candidates)
+    
+    elif args.command == 'refine':
+        import asyncio
+        from atlas_core.tools.refine_loop import refine_loop
+        result = asyncio.run(refine_loop(args.error_log, output_path=args.output, max_retries=args.max_retries,
+                                         use_cache=not args.no_cache))
+        if result['status'] != 'pass':
+            sys.exit(2)
+    
+    elif args.command == 'index':
+        from atlas_core.tools.generate_patch import load_llm_config
+        from atlas_core.tools.repo_index import indexed_repos
+        repos = [r for r in indexed_repos(load_llm_config()) if args.repo in (None, r.name)]
+        if not repos:
+            print("❌ No target_repos entry with a local `path` to index.")
+            sys.exit(1)
+        for repo in repos:
+            result = repo.update(force=args.rebuild)
+            stats = repo.stats()
+            print(f"🗂️  {repo.name}: {stats['files']} files, {stats['symbols']} symbols "
+                  f"({result['parsed']} parsed in {result['duration_ms']:.0f} ms)")
+    
+    elif args.command == 'serve':
+        from atlas_core.tools.atlas_service import AtlasService
+        AtlasService().start().serve(args.host, args.port, args.socket)
+    
+    elif args.command == 'jobs':
+        import json
+        from atlas_core.tools.atlas_service import service_request
+        try:
+            if args.job_id:
+                reply = service_request('DELETE' if args.cancel else 'GET', f"/jobs/{args.job_id}")
+            else:
+                reply = service_request('GET', f"/jobs?state={args.state}" if args.state else '/jobs')
+        except OSError as e:
+            print(f"❌ Atlas service not reachable: {e}", file=sys.stderr)
+            sys.exit(1)
+        except RuntimeError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(reply, indent=2))
     
     elif args.command == 'verify':
         from atlas_core.agents.prometheus import verify_patch
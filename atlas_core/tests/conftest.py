@@ -0,0 +1,42 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Allow `pytest` from any directory to import atlas_core
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+
+def _git(repo, *args):
+    return subprocess.run(['git', *args], cwd=repo, capture_output=True, text=True, check=True).stdout
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    """A throwaway repository; call it with {path: text} to write and commit files, returns the repo path."""
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    _git(repo, 'init', '-q')
+    _git(repo, 'config', 'user.email', 'atlas@example.com')
+    _git(repo, 'config', 'user.name', 'Atlas Tests')
+
+    def commit(files: dict):
+        for path, text in files.items():
+            target = repo / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(text)
+        _git(repo, 'add', '-A')
+        _git(repo, 'commit', '-q', '-m', 'fixture')
+        return repo
+
+    return commit
+
+
+@pytest.fixture
+def git_applies():
+    """Called with (repo, patch_text): whether `git apply --check` accepts the patch."""
+    def check(repo, patch_text: str) -> bool:
+        return subprocess.run(['git', 'apply', '--check', '-'], cwd=repo, input=patch_text,
+                              capture_output=True, text=True).returncode == 0
+    return check
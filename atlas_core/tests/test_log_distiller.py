@@ -0,0 +1,47 @@
+import pytest
+
+from atlas_core.tools.log_distiller import distill_text
+
+TRACEBACK = [
+    'Traceback (most recent call last):',
+    '  File "app/x.py", line 3, in <module>',
+    '    main()',
+    '  File "app/x.py", line 2, in main',
+    '    raise ValueError("bad input")',
+    'ValueError: bad input',
+]
+
+
+def _log(stamp: str) -> str:
+    noise = [f"{stamp}downloading package {n}" for n in range(500)]
+    more = [f"{stamp}cleaning up step {n}" for n in range(500)]
+    return "\n".join(noise + [stamp + line for line in TRACEBACK] + more) + "\n"
+
+
+@pytest.mark.parametrize("stamp", ["", "2024-05-01T12:00:00.1234567Z "], ids=["plain", "timestamped"])
+def test_traceback_survives_distillation(stamp):
+    distilled, report = distill_text(_log(stamp), token_budget=500, tail_lines=10)
+
+    for line in TRACEBACK:
+        assert stamp + line in distilled
+    assert report["distilled_bytes"] < report["raw_bytes"]
+    # The traceback ends at the exception: the noise after it is not kept as error lines
+    assert f"{stamp}cleaning up step 100" not in distilled
+
+
+def test_pytest_error_lines_are_kept_with_timestamps():
+    stamp = "2024-05-01T12:00:00.1234567Z "
+    lines = [f"{stamp}collecting {n}" for n in range(300)]
+    lines += [f"{stamp}E       assert 1 == 2", f"{stamp}E        +  where 1 = f()"]
+    lines += [f"{stamp}teardown {n}" for n in range(300)]
+    distilled, _ = distill_text("\n".join(lines), token_budget=300, context_lines=1, tail_lines=5)
+
+    assert f"{stamp}E       assert 1 == 2" in distilled
+    assert f"{stamp}E        +  where 1 = f()" in distilled
+
+
+def test_repeated_lines_collapse_across_timestamps():
+    lines = [f"2024-05-01T12:00:0{n}.0000000Z retrying connection" for n in range(5)]
+    distilled, _ = distill_text("\n".join(lines), token_budget=100)
+
+    assert distilled == "2024-05-01T12:00:00.0000000Z retrying connection  [repeated 5 times]"
@@ -0,0 +1,57 @@
+from atlas_core.tools.patch_normalizer import normalize_patch
+
+BASE = "".join(f"line {n}\n" for n in range(1, 41))
+
+
+def test_shifted_hunk_is_relocated(git_repo, git_applies):
+    repo = git_repo({"app.py": BASE})
+    # The hunk really belongs at line 20; the model numbered it 5
+    patch = ("--- a/app.py\n+++ b/app.py\n@@ -5,3 +5,3 @@\n"
+             " line 19\n-line 20\n+line twenty\n line 21\n")
+
+    report = normalize_patch(patch, repo)
+
+    assert report["ok"] and report["changed"]
+    assert report["adjustments"][0]["offset"] == 14
+    assert "@@ -19,3 +19,3 @@" in report["patch"]
+    assert git_applies(repo, report["patch"])
+
+
+def test_miscounted_header_is_recomputed(git_repo, git_applies):
+    repo = git_repo({"app.py": BASE})
+    patch = ("--- a/app.py\n+++ b/app.py\n@@ -19,5 +19,6 @@\n"
+             " line 19\n-line 20\n+line twenty\n line 21\n")
+    assert not git_applies(repo, patch)
+
+    report = normalize_patch(patch, repo)
+
+    assert report["ok"] and report["changed"]
+    assert report["adjustments"][0]["new_header"] == "@@ -19,3 +19,3 @@"
+    assert git_applies(repo, report["patch"])
+
+
+def test_whitespace_drift_takes_the_base_file_lines(git_repo, git_applies):
+    repo = git_repo({"app.py": "def f():\n\tif x:\n\t\treturn 1\n\treturn 2\n"})
+    patch = ("--- a/app.py\n+++ b/app.py\n@@ -1,4 +1,4 @@\n"
+             " def f():\n     if x:\n-        return 1\n+        return 3\n     return 2\n")
+    assert not git_applies(repo, patch)
+
+    report = normalize_patch(patch, repo)
+
+    assert report["ok"]
+    assert report["adjustments"][0]["whitespace"]
+    assert "-\t\treturn 1\n" in report["patch"]
+    assert git_applies(repo, report["patch"])
+
+
+def test_unrecoverable_hunk_is_reported_and_the_patch_kept(git_repo):
+    repo = git_repo({"app.py": BASE})
+    patch = ("--- a/app.py\n+++ b/app.py\n@@ -5,3 +5,3 @@\n"
+             " nothing\n-like this\n+at all\n exists\n")
+
+    report = normalize_patch(patch, repo)
+
+    assert not report["ok"]
+    assert report["patch"] == patch
+    assert report["errors"][0]["hunk"] == 1
+    assert "no match" in report["errors"][0]["reason"]
@@ -0,0 +1,45 @@
+from atlas_core.tools.patch_precheck import precheck_patch
+
+BASE = "alpha\nbeta\ngamma\ndelta\n"
+
+
+def test_clean_patch_passes(git_repo):
+    repo = git_repo({"app.py": BASE})
+    report = precheck_patch("--- a/app.py\n+++ b/app.py\n@@ -2,2 +2,2 @@\n beta\n-gamma\n+GAMMA\n", repo)
+
+    assert report["ok"]
+    assert (report["files"], report["hunks"]) == (1, 1)
+
+
+def test_context_mismatch_names_the_line(git_repo):
+    repo = git_repo({"app.py": BASE})
+    report = precheck_patch("--- a/app.py\n+++ b/app.py\n@@ -2,2 +2,2 @@\n beta\n-gamma-ray\n+GAMMA\n", repo)
+
+    assert not report["ok"]
+    assert report["confirmed"]  # git apply --check agreed
+    problem = report["errors"][0]
+    assert (problem["file"], problem["hunk"]) == ("app.py", 1)
+    assert (problem["line"], problem["expected"], problem["found"]) == (3, "gamma-ray", "gamma")
+
+
+def test_new_file(git_repo):
+    repo = git_repo({"app.py": BASE})
+    patch = "--- /dev/null\n+++ b/new.py\n@@ -0,0 +1,2 @@\n+one\n+two\n"
+
+    assert precheck_patch(patch, repo)["ok"]
+
+    clash = precheck_patch(patch.replace("new.py", "app.py"), repo)
+    assert not clash["ok"]
+    assert "already exists" in clash["errors"][0]["reason"]
+
+
+def test_rename(git_repo):
+    repo = git_repo({"app.py": BASE, "other.py": "x\n"})
+    patch = ("diff --git a/app.py b/lib.py\nsimilarity index 75%\nrename from app.py\nrename to lib.py\n"
+             "--- a/app.py\n+++ b/lib.py\n@@ -1,2 +1,2 @@\n-alpha\n+ALPHA\n beta\n")
+
+    assert precheck_patch(patch, repo)["ok"]
+
+    clash = precheck_patch(patch.replace("lib.py", "other.py"), repo)
+    assert not clash["ok"]
+    assert "rename target other.py already exists" in clash["errors"][0]["reason"]
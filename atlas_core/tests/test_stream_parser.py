@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from atlas_core.tools.llm_client import parse_patch_response
+from atlas_core.tools.stream_parser import IncrementalJSONParser, repair_json
+
+PROPOSAL = {
+    "confidence_score": 0.8,
+    "explanation": "Guard the \"None\" case",
+    "affected_files": ["app.py"],
+    "test_commands": ["pytest"],
+    "patch_diff": "--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n-x\n+y\n",
+}
+
+
+def test_fields_complete_in_order_while_streaming():
+    text = json.dumps(PROPOSAL)
+    parser = IncrementalJSONParser()
+    completed = []
+    for start in range(0, len(text), 3):
+        completed += [name for name, _ in parser.feed(text[start:start + 3])]
+
+    assert completed == list(PROPOSAL)
+    assert parser.completed == PROPOSAL
+
+
+def test_in_progress_shows_the_partial_string():
+    text = json.dumps(PROPOSAL)
+    cut = text.index("+++ b/app.py")
+    parser = IncrementalJSONParser()
+    parser.feed(text[:cut])
+
+    assert parser.in_progress() == ("patch_diff", "--- a/app.py\n")
+
+
+def test_repair_fenced_output_with_trailing_comma():
+    value, repaired = repair_json('Here is the fix:\n```json\n{"a": 1, "b": [1, 2,],}\n```\nDone.')
+
+    assert (value, repaired) == ({"a": 1, "b": [1, 2]}, True)
+
+
+def test_repair_truncated_output():
+    text = json.dumps(PROPOSAL)
+    value, repaired = repair_json(text[:text.index("+y")])
+
+    assert repaired
+    assert value["explanation"] == PROPOSAL["explanation"]
+    assert value["patch_diff"].startswith("--- a/app.py")
+
+
+def test_repair_gives_up_without_an_object():
+    with pytest.raises(ValueError):
+        repair_json("I could not find a fix.")
+
+
+def test_parse_patch_response_coerces_types():
+    raw = dict(PROPOSAL, confidence_score="0.8", test_commands="pytest")
+    patch_data, status = parse_patch_response(json.dumps(raw))
+
+    assert status == "repaired"
+    assert patch_data["confidence_score"] == 0.8
+    assert patch_data["test_commands"] == ["pytest"]
+    assert parse_patch_response(json.dumps(PROPOSAL)) == (PROPOSAL, "clean")
+
+
+def test_parse_patch_response_requires_every_key():
+    with pytest.raises(ValueError, match="Missing required keys"):
+        parse_patch_response('{"confidence_score": 0.5}')
@@ -0,0 +1,59 @@
+from atlas_core.tools.repo_index import RepoIndex
+from atlas_core.tools.test_impact import impacted_tests, patch_paths, removed_paths
+
+FILES = {
+    "src/pkg/__init__.py": "",
+    "src/pkg/core.py": "from .util import helper\nVALUE = helper()\n",
+    "src/pkg/util.py": "def helper():\n    return 1\n",
+    "tests/test_core.py": "from pkg.core import VALUE\n\ndef test_value():\n    assert VALUE\n",
+    "tests/test_other.py": "import json\n\ndef test_other():\n    pass\n",
+}
+
+
+def _impact(repo, tmp_path, patch):
+    index = RepoIndex("test", repo, index_dir=tmp_path / "index")
+    return impacted_tests(index, patch_paths(patch), removed=removed_paths(patch))
+
+
+def test_transitive_importers_are_impacted(git_repo, tmp_path):
+    repo = git_repo(FILES)
+    patch = "--- a/src/pkg/util.py\n+++ b/src/pkg/util.py\n@@ -2 +2 @@\n-    return 1\n+    return 2\n"
+
+    impact = _impact(repo, tmp_path, patch)
+
+    assert impact["tests"] == ["tests/test_core.py"]
+    assert impact["unmapped"] == []
+    assert {"src/pkg/core.py", "src/pkg/util.py", "tests/test_core.py"} <= set(impact["imports"])
+
+
+def test_deleted_test_is_not_run(git_repo, tmp_path):
+    repo = git_repo(FILES)
+    patch = ("diff --git a/tests/test_other.py b/tests/test_other.py\ndeleted file mode 100644\n"
+             "--- a/tests/test_other.py\n+++ /dev/null\n@@ -1,4 +0,0 @@\n"
+             "-import json\n-\n-def test_other():\n-    pass\n")
+
+    impact = _impact(repo, tmp_path, patch)
+
+    assert impact["changed"] == ["tests/test_other.py"]
+    assert impact["tests"] == []
+    assert impact["unmapped"] == []
+
+
+def test_renamed_test_runs_under_its_new_name(git_repo, tmp_path):
+    repo = git_repo(FILES)
+    patch = ("diff --git a/tests/test_core.py b/tests/test_value.py\nsimilarity index 100%\n"
+             "rename from tests/test_core.py\nrename to tests/test_value.py\n")
+
+    impact = _impact(repo, tmp_path, patch)
+
+    assert impact["tests"] == ["tests/test_value.py"]
+
+
+def test_deleted_module_still_impacts_its_importers(git_repo, tmp_path):
+    repo = git_repo(FILES)
+    patch = ("diff --git a/src/pkg/util.py b/src/pkg/util.py\ndeleted file mode 100644\n"
+             "--- a/src/pkg/util.py\n+++ /dev/null\n@@ -1,2 +0,0 @@\n-def helper():\n-    return 1\n")
+
+    impact = _impact(repo, tmp_path, patch)
+
+    assert impact["tests"] == ["tests/test_core.py"]
@@ -2,34 +2,34 @@
 Atlas Patch Application Tool
 """
 import argparse
+import asyncio
 import json
-import subprocess
 import sys
 from pathlib import Path
 import tempfile
 
-def run_command(command, cwd):
-    """Runs a command and captures its output, streaming it live."""
-    process = subprocess.Popen(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        shell=True,
-        cwd=cwd
-    )
-    output = []
-    for line in iter(process.stdout.readline, ''):
-        print(line, end='') # Print to parent process stdout for live streaming
-        sys.stdout.flush()
-        output.append(line)
-    
-    process.wait()
-    return process.returncode, "".join(output)
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/apply_patch.py` (used by the Streamlit app)
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.patch_normalizer import DEFAULT_FUZZ, format_adjustments, normalize_patch
+from atlas_core.tools.process_runner import run_command_async
+from atlas_core.tools.verify_patch import load_config
 
-def apply_patch(patch_content: str, commit_message: str, push: bool):
+def apply_patch(patch_content: str, commit_message: str, push: bool) -> dict:
     """
     Applies, commits, and optionally pushes a patch.
+
+    Thin synchronous wrapper around apply_patch_async.
+    """
+    return asyncio.run(apply_patch_async(patch_content, commit_message, push))
+
+async def apply_patch_async(patch_content: str, commit_message: str, push: bool) -> dict:
+    """
+    Applies, commits, and optionally pushes a patch without blocking the event loop.
+
+    Returns:
+        The results dict also printed as ATLAS_JSON_RESULT
     """
     repo_root = Path(__file__).parent.parent.parent
     results = {
@@ -38,6 +38,18 @@ def apply_patch(patch_content: str, commit_message: str, push: bool):
     }
 
     try:
+        # Fix wrong hunk line numbers and whitespace drift the same way verification did
+        verification_config = load_config().get("verification", {})
+        if verification_config.get("normalize", True):
+            normalized = await asyncio.to_thread(
+                normalize_patch, patch_content, repo_root, "HEAD", verification_config.get("fuzz", DEFAULT_FUZZ)
+            )
+            if normalized["changed"]:
+                report = format_adjustments(normalized)
+                print(f"--- Normalizing patch ---\n{report}", end='')
+                patch_content = normalized["patch"]
+                results["steps"].append({"name": "Normalize Patch", "code": 0, "log": report})
+
         # Use a temporary file for the patch content
         with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix=".diff", prefix="apply-") as temp_patch_file:
             temp_patch_file.write(patch_content)
@@ -45,14 +57,14 @@ def apply_patch(patch_content: str, commit_message: str, push: bool):
 
         # 1. Apply patch
         print("--- Applying patch ---")
-        code, out = run_command(f"git apply {patch_file_path}", repo_root)
+        code, out = await run_command_async(f"git apply {patch_file_path}", repo_root)
         results["steps"].append({"name": "Apply Patch", "code": code, "log": out})
         if code != 0:
             raise RuntimeError("Failed to apply patch.")
 
         # 2. Add changes
         print("--- Staging changes ---")
-        code, out = run_command("git add .", repo_root)
+        code, out = await run_command_async("git add .", repo_root)
         results["steps"].append({"name": "Stage Changes (git add)", "code": code, "log": out})
         if code != 0:
             raise RuntimeError("Failed to stage changes.")
@@ -64,7 +76,7 @@ def apply_patch(patch_content: str, commit_message: str, push: bool):
             temp_msg_file.write(commit_message)
             commit_msg_path = temp_msg_file.name
 
-        code, out = run_command(f"git commit -F {commit_msg_path}", repo_root)
+        code, out = await run_command_async(f"git commit -F {commit_msg_path}", repo_root)
         results["steps"].append({"name": "Commit", "code": code, "log": out})
         if code != 0:
             raise RuntimeError("Failed to commit changes.")
@@ -73,7 +85,7 @@ def apply_patch(patch_content: str, commit_message: str, push: bool):
         if push:
             print("--- Pushing to origin ---")
             # Assuming the current branch is the one to push to
-            code, out = run_command("git push", repo_root)
+            code, out = await run_command_async("git push", repo_root)
             results["steps"].append({"name": "Push to Origin", "code": code, "log": out})
             if code != 0:
                 raise RuntimeError("Failed to push changes.")
@@ -98,6 +110,8 @@ def apply_patch(patch_content: str, commit_message: str, push: bool):
         # Final JSON output for the UI
         print(f"ATLAS_JSON_RESULT:{json.dumps(results)}")
 
+    return results
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Atlas Patch Application Tool")
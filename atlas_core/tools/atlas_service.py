@@ -0,0 +1,568 @@
+"""
+Atlas Service
+Long-running daemon that runs propose/refine/verify/apply jobs from a priority queue
+"""
+import argparse
+import asyncio
+import hmac
+import http.client
+import itertools
+import json
+import os
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/atlas_service.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools import lifecycle
+from atlas_core.tools.disk_cache import hash_key
+from atlas_core.tools.generate_patch import load_llm_config, normalize_error_log
+
+LOG_DIR = Path(__file__).parent.parent / 'logs'
+INPUT_DIR = Path(__file__).parent.parent / 'cache' / 'service'
+TOKEN_PATH = Path(__file__).parent.parent / 'cache' / 'service.token'
+# Where the running service listens, so clients find it when `serve` was given --host/--port/--socket
+ADDRESS_PATH = Path(__file__).parent.parent / 'cache' / 'service.address'
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = {"llm": 2, "verify": 2, "apply": 1}
+DEFAULT_BRANCH_PRIORITY = {"main": 0, "master": 0, "default": 10}
+DEFAULT_KEEP_FINISHED = 500
+
+# Jobs of a lane share its workers; apply touches the main working tree and runs alone by default
+JOB_LANES = {"propose": "llm", "refine": "llm", "verify": "verify", "apply": "apply"}
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+# Longest a status request may block waiting for a job to finish
+MAX_WAIT_SECONDS = 300
+
+# Host headers a TCP request may carry (besides the configured host), so a web page
+# cannot reach the API through a DNS name rebound to 127.0.0.1
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+def service_token(create: bool = False) -> str:
+    """
+    The per-install API token in atlas_core/cache/service.token (owner-only), created on
+    first `atlas serve`. Clients read it from the same file; raises OSError without one.
+    """
+    if create and not TOKEN_PATH.exists():
+        TOKEN_PATH.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(TOKEN_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+    return TOKEN_PATH.read_text().strip()
+
+
+def service_address(config: dict = None) -> dict:
+    """{"socket": path} or {"host", "port"} of the running service, else of the `service` config."""
+    try:
+        return json.loads(ADDRESS_PATH.read_text())
+    except (OSError, ValueError):
+        pass
+    service_config = (config or load_llm_config()).get('service', {})
+    if service_config.get('socket'):
+        return {"socket": service_config['socket']}
+    return {"host": service_config.get('host', DEFAULT_HOST), "port": service_config.get('port', DEFAULT_PORT)}
+
+
+class _Job:
+    """A submitted job; `public()` is what the API returns."""
+
+    def __init__(self, kind: str, params: dict, priority: int, dedup_key: str, log_path: str = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.priority = priority
+        self.dedup_key = dedup_key
+        self.log_path = log_path
+        self.state = 'queued'
+        self.submitters = 1
+        self.fields = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished_at = None
+        self.task = None
+        self.finished = threading.Event()
+
+    def public(self) -> dict:
+        """A copy of the job's status; take it under the service lock (see AtlasService.snapshot)."""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "priority": self.priority,
+            "branch": self.params.get('branch'),
+            "submitters": self.submitters,
+            "created_at": datetime.fromtimestamp(self.created).isoformat(),
+            "queue_ms": ((self.started or time.time()) - self.created) * 1000,
+            "run_ms": ((self.finished_at or time.time()) - self.started) * 1000 if self.started else None,
+            "fields": dict(self.fields),
+            "result": self.result,
+            "error": self.error
+        }
+
+
+def _read_input(params: dict, text_key: str, path_key: str) -> str:
+    if params.get(text_key) is not None:
+        return params[text_key]
+    if params.get(path_key):
+        with open(params[path_key], 'r') as f:
+            return f.read()
+    raise ValueError(f"'{text_key}' or '{path_key}' is required")
+
+
+def dedup_key(kind: str, params: dict, content: str) -> str:
+    """Jobs with the same key do the same work, so concurrent submissions share one run."""
+    if kind in ('propose', 'refine'):
+        # Normalised like the response cache: reruns of the same failure differ only in noise
+        return hash_key(kind, normalize_error_log(content), params.get('use_cache', True),
+                        params.get('candidates', 1), params.get('max_retries'), params.get('output'))
+    if kind == 'verify':
+        return hash_key(kind, content, params.get('use_cache', True))
+    return hash_key(kind, content, params.get('commit_message', ''), bool(params.get('push')))
+
+
+class AtlasService:
+    """
+    Runs Atlas jobs in one warm process: configuration, the LLM connection pool, the
+    pinned model and the repo index stay loaded between jobs.
+
+    Jobs wait in a priority queue per lane (lower priority values first; by default
+    jobs for main/master outrank other branches). A job submitted while an identical
+    one is queued or running joins it instead of running again, and raises its
+    priority if the newcomer's is higher.
+    """
+
+    def __init__(self, config: dict = None):
+        self.config = config or load_llm_config()
+        service_config = self.config.get('service', {})
+        self.workers = dict(DEFAULT_WORKERS, **service_config.get('workers', {}))
+        self.branch_priority = dict(DEFAULT_BRANCH_PRIORITY, **service_config.get('branch_priority', {}))
+        self.keep_finished = service_config.get('keep_finished', DEFAULT_KEEP_FINISHED)
+        self.jobs = {}
+        self.inflight = {}
+        self.stats = {"submitted": 0, "deduplicated": 0, "done": 0, "failed": 0, "cancelled": 0}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._queues = {}
+        self.loop = asyncio.new_event_loop()
+        self._loop_ready = threading.Event()
+
+    # Job lifecycle
+
+    def start(self):
+        """Run the job workers on a background event loop."""
+        threading.Thread(target=self._run_loop, daemon=True).start()
+        self._loop_ready.wait()
+        return self
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        for lane, count in self.workers.items():
+            self._queues[lane] = asyncio.PriorityQueue()
+            for _ in range(count):
+                self.loop.create_task(self._worker(lane))
+        self.loop.call_soon(self._loop_ready.set)
+        self.loop.run_forever()
+
+    def priority_for(self, params: dict) -> int:
+        if params.get('priority') is not None:
+            return int(params['priority'])
+        return self.branch_priority.get(params.get('branch'), self.branch_priority['default'])
+
+    def submit(self, kind: str, params: dict):
+        """
+        Queue a job, or join the identical one already queued or running.
+
+        Returns:
+            (job, deduplicated)
+        """
+        if kind not in JOB_LANES:
+            raise ValueError(f"Unknown job kind '{kind}' (expected one of {', '.join(JOB_LANES)})")
+        if kind in ('propose', 'refine'):
+            content = _read_input(params, 'error_log_text', 'error_log')
+        else:
+            content = _read_input(params, 'patch_text', 'patch')
+        if kind == 'apply':
+            if not params.get('commit_message'):
+                raise ValueError("'commit_message' is required for apply")
+            # The API has no typed confirmation, so it may only do what the config allows unattended
+            safety = self.config.get('safety', {})
+            if not safety.get('enable_auto_apply', False):
+                raise PermissionError("apply jobs need safety.enable_auto_apply")
+            if params.get('push') and not safety.get('enable_master_push', False):
+                raise PermissionError("push is disabled (safety.enable_master_push)")
+
+        key = dedup_key(kind, params, content) if params.get('dedupe', True) else None
+        priority = self.priority_for(params)
+        with self._lock:
+            self.stats['submitted'] += 1
+            existing = self.inflight.get(key) if key else None
+            if existing:
+                existing.submitters += 1
+                self.stats['deduplicated'] += 1
+                if priority < existing.priority and existing.state == 'queued':
+                    existing.priority = priority
+                    self._enqueue(existing)
+                return existing, True
+
+            log_path = params.get('error_log')
+            if kind in ('propose', 'refine') and params.get('error_log_text') is not None:
+                INPUT_DIR.mkdir(parents=True, exist_ok=True)
+                log_path = str(INPUT_DIR / f"{hash_key(content)}.log")
+                Path(log_path).write_text(content)
+            job = _Job(kind, dict(params, content=content), priority, key, log_path)
+            self.jobs[job.id] = job
+            if key:
+                self.inflight[key] = job
+            self._enqueue(job)
+            return job, False
+
+    def _enqueue(self, job: _Job):
+        entry = (job.priority, next(self._sequence), job)
+        self.loop.call_soon_threadsafe(self._queues[JOB_LANES[job.kind]].put_nowait, entry)
+
+    def cancel(self, job_id: str) -> _Job:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return job
+            if job.state == 'queued':
+                self._finish(job, 'cancelled')
+            elif job.task is not None:
+                self.loop.call_soon_threadsafe(job.task.cancel)
+        return job
+
+    async def _worker(self, lane: str):
+        queue = self._queues[lane]
+        while True:
+            _, _, job = await queue.get()
+            # Checked and switched under the lock so a concurrent cancel() either finishes
+            # the job while queued or sees it running with its task set
+            with self._lock:
+                if job.state != 'queued':
+                    continue  # cancelled, or a stale entry left behind by a priority raise
+                job.task = asyncio.ensure_future(self._execute(job))
+                job.started = time.time()
+                job.state = 'running'
+            await asyncio.wait([job.task])
+            with self._lock:
+                if job.task.cancelled():
+                    self._finish(job, 'cancelled')
+                elif job.task.exception() is not None:
+                    job.error = str(job.task.exception())
+                    self._finish(job, 'failed')
+                else:
+                    job.result = job.task.result()
+                    self._finish(job, 'done')
+
+    async def _execute(self, job: _Job):
+        params = job.params
+        use_cache = params.get('use_cache', True)
+        if job.kind == 'propose':
+            def on_field(name, value):
+                # Status requests copy the fields from HTTP threads under the same lock
+                with self._lock:
+                    job.fields[name] = value
+
+            patch_data, perf_entry = await lifecycle.propose(
+                job.log_path, self.config, stream=params.get('stream', True), on_field=on_field, use_cache=use_cache,
+                candidates=int(params.get('candidates') or 1)
+            )
+            return {"patch_data": patch_data, "perf_entry": perf_entry}
+        if job.kind == 'refine':
+            return await lifecycle.refine(job.log_path, self.config, output_path=params.get('output'),
+                                          max_retries=params.get('max_retries'), use_cache=use_cache)
+        if job.kind == 'verify':
+            patch_path = INPUT_DIR / f"{job.dedup_key or job.id}.diff"
+            INPUT_DIR.mkdir(parents=True, exist_ok=True)
+            patch_path.write_text(params['content'])
+            return await lifecycle.verify(str(patch_path), use_cache)
+        return await lifecycle.apply(params['content'], params['commit_message'], bool(params.get('push')))
+
+    def _finish(self, job: _Job, state: str):
+        """Mark a job finished (caller holds the lock), log it and drop old finished jobs."""
+        job.state = state
+        job.finished_at = time.time()
+        self.stats[state] += 1
+        if job.dedup_key and self.inflight.get(job.dedup_key) is job:
+            del self.inflight[job.dedup_key]
+        job.finished.set()
+
+        entry = {key: value for key, value in job.public().items() if key not in ('fields', 'result')}
+        LOG_DIR.mkdir(exist_ok=True)
+        with open(LOG_DIR / 'service.jsonl', 'a') as f:
+            f.write(json.dumps(dict(entry, event="job", timestamp=datetime.now().isoformat())) + '\n')
+
+        finished = [j for j in self.jobs.values() if j.state in FINISHED_STATES]
+        for old in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[old.id]
+
+    def snapshot(self, job: _Job) -> dict:
+        """job.public() taken under the lock, so a streaming job's fields cannot change mid-copy."""
+        with self._lock:
+            return job.public()
+
+    def list_jobs(self, state: str = None) -> list:
+        with self._lock:
+            return [job.public() for job in self.jobs.values() if state in (None, job.state)]
+
+    def reload_config(self):
+        """Re-read llm_config.yaml for jobs submitted from now on."""
+        self.config = load_llm_config()
+
+    def health(self) -> dict:
+        with self._lock:
+            states = {}
+            for job in self.jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {
+                "status": "ok",
+                "pid": os.getpid(),
+                "uptime_s": time.time() - self.started,
+                "queued_by_lane": {lane: queue.qsize() for lane, queue in self._queues.items()},
+                "jobs": states,
+                "stats": dict(self.stats)
+            }
+
+    # HTTP API
+
+    def serve(self, host: str = None, port: int = None, socket_path: str = None):
+        """Serve the HTTP API until interrupted (on `socket_path` if given, else host:port)."""
+        service_config = self.config.get('service', {})
+        socket_path = socket_path or service_config.get('socket')
+        host = host or service_config.get('host', DEFAULT_HOST)
+        handler = type('ServiceHandler', (_ServiceHandler,), {
+            "service": self, "token": service_token(create=True),
+            "allowed_hosts": None if socket_path else LOCAL_HOSTS + (host,) + tuple(service_config.get('allowed_hosts', []))
+        })
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            old_umask = os.umask(0o177)  # the socket is owner-only too
+            try:
+                server = _UnixHTTPServer(socket_path, handler)
+            finally:
+                os.umask(old_umask)
+            where = f"unix:{socket_path}"
+            address = {"socket": os.path.abspath(socket_path)}
+        else:
+            port = port or service_config.get('port', DEFAULT_PORT)
+            server = ThreadingHTTPServer((host, port), handler)
+            where = f"http://{host}:{port}"
+            address = {"host": host, "port": server.server_address[1]}
+        server.daemon_threads = True
+        ADDRESS_PATH.write_text(json.dumps(address))
+        print(f"🛰️  Atlas service listening on {where}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            ADDRESS_PATH.unlink(missing_ok=True)
+            if socket_path and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    """
+    GET /health, GET /jobs[?state=], GET /jobs/<id>[?wait=seconds],
+    POST /jobs {"kind": ..., params}, DELETE /jobs/<id>, POST /reload
+
+    Every request needs `Authorization: Bearer <service token>`. Requests from a
+    browser (an Origin header) or for a non-local Host are refused, and POST bodies
+    must be `application/json`, so a web page cannot submit jobs.
+    """
+
+    service = None
+    token = None
+    allowed_hosts = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status: int = 200):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _refused(self) -> bool:
+        """Send the error reply and return True unless the request may use the API."""
+        if self.headers.get('Origin') is not None:
+            self._send_json({"error": "browser requests are not accepted"}, 403)
+            return True
+        if self.allowed_hosts is not None:
+            host = (self.headers.get('Host') or '').rsplit(':', 1)[0].strip('[]')
+            if host not in self.allowed_hosts:
+                self._send_json({"error": f"unexpected Host '{host}'"}, 403)
+                return True
+        supplied = self.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {self.token}".encode()):
+            self._send_json({"error": "missing or wrong service token"}, 401)
+            return True
+        return False
+
+    def _job_id(self, path: str):
+        parts = path.strip('/').split('/')
+        return parts[1] if len(parts) == 2 and parts[0] == 'jobs' else None
+
+    def do_GET(self):
+        if self._refused():
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/health':
+            return self._send_json(self.service.health())
+        if url.path == '/jobs':
+            state = query.get('state', [None])[0]
+            return self._send_json({"jobs": self.service.list_jobs(state)})
+        job = self.service.jobs.get(self._job_id(url.path))
+        if job is None:
+            return self._send_json({"error": "job not found"}, 404)
+        wait = float(query.get('wait', [0])[0])
+        if wait:
+            job.finished.wait(min(wait, MAX_WAIT_SECONDS))
+        self._send_json(self.service.snapshot(job))
+
+    def do_POST(self):
+        if self._refused():
+            return
+        if self.headers.get_content_type() != 'application/json':
+            return self._send_json({"error": "Content-Type must be application/json"}, 415)
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except (ValueError, UnicodeDecodeError) as e:
+            return self._send_json({"error": f"invalid JSON body: {e}"}, 400)
+        if not isinstance(body, dict):
+            return self._send_json({"error": "the body must be a JSON object"}, 400)
+        if self.path == '/reload':
+            self.service.reload_config()
+            return self._send_json({"status": "reloaded"})
+        if self.path != '/jobs':
+            return self._send_json({"error": f"unknown route {self.path}"}, 404)
+        try:
+            job, deduplicated = self.service.submit(body.pop('kind', None), body)
+        except PermissionError as e:
+            return self._send_json({"error": str(e)}, 403)
+        except (ValueError, OSError) as e:
+            return self._send_json({"error": str(e)}, 400)
+        self._send_json(dict(self.service.snapshot(job), deduplicated=deduplicated), 200 if deduplicated else 201)
+
+    def do_DELETE(self):
+        if self._refused():
+            return
+        job = self.service.cancel(self._job_id(urlparse(self.path).path))
+        if job is None:
+            return self._send_json({"error": "job not found"}, 404)
+        self._send_json(self.service.snapshot(job))
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def service_request(method: str, path: str, body: dict = None, config: dict = None, timeout: float = 30) -> dict:
+    """
+    Call the running Atlas service (see service_address()) and return its JSON reply.
+
+    Raises OSError when the service is not running (or has never run, so there is no
+    token yet) and RuntimeError on an error reply.
+    """
+    address = service_address(config)
+    headers = {'Content-Type': 'application/json', 'Authorization': f"Bearer {service_token()}"}
+    if address.get('socket'):
+        connection = _UnixHTTPConnection(address['socket'], timeout=timeout)
+    else:
+        connection = http.client.HTTPConnection(address['host'], address['port'], timeout=timeout)
+    try:
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+        connection.request(method, path, body=payload, headers=headers)
+        response = connection.getresponse()
+        reply = json.loads(response.read() or b'{}')
+    finally:
+        connection.close()
+    if response.status >= 400:
+        raise RuntimeError(reply.get('error', f"HTTP {response.status}"))
+    return reply
+
+
+def run_job(kind: str, params: dict, config: dict = None, on_update=None, poll_seconds: float = 1.0) -> dict:
+    """
+    Submit a job to the service and wait for it to finish.
+
+    on_update(job) is called with each status while the job runs (a propose job's
+    `fields` fill in as the model streams them). Returns the finished job.
+    """
+    job = service_request('POST', '/jobs', dict(params, kind=kind), config)
+    while job['state'] not in FINISHED_STATES:
+        if on_update:
+            on_update(job)
+        # Without an update callback, block on the server until the job finishes
+        wait = poll_seconds if on_update else MAX_WAIT_SECONDS
+        job = service_request('GET', f"/jobs/{job['id']}?wait={wait}", config=config, timeout=wait + 30)
+    return job
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Service")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help='Run the service')
+    serve_parser.add_argument('--host')
+    serve_parser.add_argument('--port', type=int)
+    serve_parser.add_argument('--socket', help='Listen on a Unix socket instead of TCP.')
+    jobs_parser = subparsers.add_parser('jobs', help='List jobs, or show/cancel one')
+    jobs_parser.add_argument('job_id', nargs='?')
+    jobs_parser.add_argument('--state', help='Only jobs in this state.')
+    jobs_parser.add_argument('--cancel', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        AtlasService().start().serve(args.host, args.port, args.socket)
+        sys.exit(0)
+    try:
+        if args.job_id:
+            reply = service_request('DELETE' if args.cancel else 'GET', f"/jobs/{args.job_id}")
+        else:
+            reply = service_request('GET', f"/jobs?state={args.state}" if args.state else '/jobs')
+    except OSError as e:
+        print(f"❌ Atlas service not reachable: {e}", file=sys.stderr)
+        sys.exit(1)
+    except RuntimeError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(reply, indent=2))
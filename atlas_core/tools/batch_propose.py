@@ -0,0 +1,161 @@
+"""
+Atlas Batch Proposal Tool
+Proposes patches for a directory or glob of failure logs with bounded concurrency
+"""
+import argparse
+import glob
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/batch_propose.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.generate_patch import generate_proposal, load_llm_config, save_proposal
+
+LOG_SUFFIXES = ('.log', '.txt')
+
+
+def resolve_log_paths(source: str) -> list:
+    """Expand a directory (its *.log/*.txt files) or a glob pattern into a sorted list of logs."""
+    source_path = Path(source)
+    if source_path.is_dir():
+        paths = [p for p in source_path.iterdir() if p.is_file() and p.suffix in LOG_SUFFIXES]
+    else:
+        paths = [Path(p) for p in glob.glob(source, recursive=True) if Path(p).is_file()]
+    return sorted(paths)
+
+
+def _output_paths(log_paths: list, output_dir: Path) -> dict:
+    """Map each log to a unique <stem>.diff path, suffixing duplicates from different directories."""
+    outputs = {}
+    seen = {}
+    for log_path in log_paths:
+        stem = log_path.stem
+        seen[stem] = seen.get(stem, 0) + 1
+        if seen[stem] > 1:
+            stem = f"{stem}-{seen[stem]}"
+        outputs[log_path] = output_dir / f"{stem}.diff"
+    return outputs
+
+
+def batch_propose(source: str, output_dir: str = 'batch_patches', dry_run: bool = False, use_cache: bool = True,
+                  max_workers: int = None, quiet: bool = False) -> dict:
+    """
+    Generate a proposal for every log in `source`.
+
+    Proposals run concurrently in one interpreter, sharing the pooled LLM client, with
+    concurrency capped at `hardware.primary_gpu.max_batch_size` unless `max_workers`
+    is given. Each log gets its own <stem>.diff and <stem>_metadata.json.
+
+    Returns:
+        Aggregate summary (counts, wall time, proposals/minute, tokens/s, per-log results)
+    """
+    config = load_llm_config()
+    log_paths = resolve_log_paths(source)
+    if not log_paths:
+        raise FileNotFoundError(f"No error logs found for: {source}")
+
+    if max_workers is None:
+        max_workers = config.get('hardware', {}).get('primary_gpu', {}).get('max_batch_size', 1)
+    max_workers = max(1, min(max_workers, len(log_paths)))
+
+    output_dir = Path(output_dir)
+    if not dry_run:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    outputs = _output_paths(log_paths, output_dir)
+
+    if not quiet:
+        print(f"🔄 Atlas: Proposing patches for {len(log_paths)} logs ({max_workers} concurrent)...")
+
+    def run_one(log_path: Path):
+        started = time.perf_counter()
+        patch_data, perf_entry = generate_proposal(str(log_path), config, use_cache=use_cache)
+        result = {
+            "log": str(log_path),
+            "status": "ok",
+            "confidence_score": patch_data['confidence_score'],
+            "wall_seconds": time.perf_counter() - started,
+            "response_tokens": perf_entry.get('response_tokens', 0),
+            "prompt_tokens": perf_entry.get('prompt_tokens', 0),
+            "cache": perf_entry.get('cache')
+        }
+        if not dry_run:
+            output_path = str(outputs[log_path])
+            save_proposal(patch_data, output_path, str(log_path))
+            result["patch"] = output_path
+        return result
+
+    results = []
+    batch_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_one, log_path): log_path for log_path in log_paths}
+        for future in as_completed(futures):
+            log_path = futures[future]
+            try:
+                result = future.result()
+                if not quiet:
+                    print(f"   ✅ {log_path.name}: confidence {result['confidence_score']:.2f} "
+                          f"({result['wall_seconds']:.1f}s, cache {result['cache']})")
+            except Exception as e:
+                result = {"log": str(log_path), "status": "error", "error": str(e)}
+                if not quiet:
+                    print(f"   ❌ {log_path.name}: {e}")
+            results.append(result)
+    wall_seconds = time.perf_counter() - batch_started
+
+    succeeded = [r for r in results if r['status'] == 'ok']
+    response_tokens = sum(r['response_tokens'] for r in succeeded)
+    summary = {
+        "timestamp": datetime.now().isoformat(),
+        "source": source,
+        "max_workers": max_workers,
+        "total": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "cache_hits": sum(1 for r in succeeded if r.get('cache') == 'hit'),
+        "wall_seconds": wall_seconds,
+        "proposals_per_minute": len(succeeded) / (wall_seconds / 60) if wall_seconds > 0 else 0,
+        "response_tokens": response_tokens,
+        "tokens_per_second": response_tokens / wall_seconds if wall_seconds > 0 else 0,
+        "results": sorted(results, key=lambda r: r['log'])
+    }
+
+    if not dry_run:
+        with open(output_dir / 'batch_summary.json', 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    if not quiet:
+        print(f"\n📊 Batch Summary")
+        print(f"   Proposals: {summary['succeeded']}/{summary['total']} succeeded "
+              f"({summary['cache_hits']} from cache)")
+        print(f"   Wall time: {wall_seconds:.1f}s")
+        print(f"   Throughput: {summary['proposals_per_minute']:.2f} proposals/min, "
+              f"{summary['tokens_per_second']:.1f} tokens/s")
+        if not dry_run:
+            print(f"💾 Patches and summary saved to: {output_dir}")
+
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Batch Proposal Tool")
+    parser.add_argument("--logs", required=True, help="Directory of error logs or a glob pattern (quote it).")
+    parser.add_argument("--output-dir", default="batch_patches", help="Directory for per-log patches and metadata.")
+    parser.add_argument("--max-workers", type=int, help="Override hardware.primary_gpu.max_batch_size.")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache.")
+    parser.add_argument("--json-output", action="store_true", help="Print the summary as JSON to stdout.")
+    args = parser.parse_args()
+
+    try:
+        batch_summary = batch_propose(args.logs, args.output_dir, use_cache=not args.no_cache,
+                                      max_workers=args.max_workers, quiet=args.json_output)
+        if args.json_output:
+            print(json.dumps(batch_summary))
+    except Exception as e:
+        print(f"An error occurred: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,151 @@
+"""
+Atlas Disk Cache
+Content-addressed JSON cache with TTL and size-bounded LRU eviction
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+
+def hash_key(*parts) -> str:
+    """Build a cache key from any number of string parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+# Entries are written as {"created_at": <epoch>, "value": ...}, so eviction can read an
+# entry's age from its first bytes without loading the (possibly large) value
+_CREATED_AT_PREFIX = re.compile(rb'^\{"created_at": (-?[0-9][0-9.eE+-]*)')
+_PREFIX_BYTES = 64
+
+
+class DiskCache:
+    """
+    One JSON file per entry under `directory`, named by its key.
+
+    An entry's mtime is its last use: reads touch it, so evicting the oldest mtimes
+    gives LRU order without a separate index. The TTL counts from `created_at`,
+    stored first in the entry, so an entry that keeps being hit still expires, and
+    eviction reads only that prefix of each file. Hit and
+    miss counters persist in `stats.json` so they survive across CLI invocations.
+    """
+
+    STATS_FILE = 'stats.json'
+
+    # Shared by every instance so concurrent proposals do not lose counter updates
+    _lock = threading.Lock()
+
+    def __init__(self, directory, ttl_seconds: float = 0, max_entries: int = 0, max_bytes: int = 0):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, directory, cache_config: dict):
+        """Create a cache from a config section with ttl_hours/max_entries/max_size_mb."""
+        return cls(
+            directory,
+            ttl_seconds=cache_config.get('ttl_hours', 0) * 3600,
+            max_entries=cache_config.get('max_entries', 0),
+            max_bytes=int(cache_config.get('max_size_mb', 0) * 1024 * 1024)
+        )
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str):
+        """Return the cached value for `key`, or None on a miss or expired entry."""
+        path = self._path(key)
+        with self._lock:
+            try:
+                entry = self._read(path)
+                if entry is None or self._expired(entry, time.time()):
+                    path.unlink(missing_ok=True)
+                    raise FileNotFoundError(path)
+                os.utime(path)
+            except FileNotFoundError:
+                self._count('misses')
+                return None
+            self._count('hits')
+            return entry['value']
+
+    def put(self, key: str, value):
+        """Store `value` under `key` and evict expired or least recently used entries."""
+        path = self._path(key)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with self._lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"created_at": time.time(), "value": value}, f)
+            os.replace(tmp_path, path)
+            self._evict()
+
+    @staticmethod
+    def _read(path: Path):
+        """The stored {created_at, value} entry, or None if it is unreadable or predates created_at."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(entry, dict) or 'created_at' not in entry or 'value' not in entry:
+            return None
+        return entry
+
+    @staticmethod
+    def _created_at(path: Path):
+        """An entry's created_at from the start of its file, or None if it is not in the entry format."""
+        with open(path, 'rb') as f:
+            match = _CREATED_AT_PREFIX.match(f.read(_PREFIX_BYTES))
+        return float(match.group(1)) if match else None
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - entry['created_at'] > self.ttl_seconds
+
+    def stats(self) -> dict:
+        """Return the persisted hit/miss counters."""
+        try:
+            with open(self.directory / self.STATS_FILE, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"hits": 0, "misses": 0}
+
+    def _count(self, counter: str):
+        stats = self.stats()
+        stats[counter] = stats.get(counter, 0) + 1
+        with open(self.directory / self.STATS_FILE, 'w') as f:
+            json.dump(stats, f)
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for path in self.directory.glob('*.json'):
+            if path.name == self.STATS_FILE:
+                continue
+            try:
+                stat = path.stat()
+                created_at = self._created_at(path) if self.ttl_seconds else now
+            except FileNotFoundError:
+                continue
+            if created_at is None or self._expired({"created_at": created_at}, now):
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (
+            (self.max_entries and len(entries) > self.max_entries)
+            or (self.max_bytes and total_bytes > self.max_bytes)
+        ):
+            _, size, path = entries.pop(0)
+            path.unlink(missing_ok=True)
+            total_bytes -= size
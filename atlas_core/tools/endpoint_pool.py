@@ -0,0 +1,346 @@
+"""
+Atlas Endpoint Pool
+Spreads LLM requests over several Ollama hosts with health probes and failover
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlparse, urlunparse
+
+import requests
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/endpoint_pool.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.llm_client import SYSTEM_PROMPT, LLMClient, RequestCancelled, httpx
+
+LOG_DIR = Path(__file__).parent.parent / 'logs'
+
+DEFAULT_HEALTH_INTERVAL_SECONDS = 30
+DEFAULT_PROBE_TIMEOUT_SECONDS = 3
+DEFAULT_UNLOADED_PENALTY = 2
+
+# A host that does not have the model installed is only used when no other host is left
+NOT_INSTALLED_PENALTY = 1000
+
+# Weight of the latest request in each host's moving average latency
+LATENCY_EWMA_ALPHA = 0.3
+
+# Contexts remembered for routing refine turns back to the host holding their KV state
+MAX_CONTEXT_AFFINITY = 256
+
+_log_lock = threading.Lock()
+
+
+def _log_event(entry: dict):
+    """Append one probe or failover record to endpoints.jsonl."""
+    LOG_DIR.mkdir(exist_ok=True)
+    with _log_lock, open(LOG_DIR / 'endpoints.jsonl', 'a') as f:
+        f.write(json.dumps(dict(entry, timestamp=datetime.now().isoformat())) + '\n')
+
+
+def _failure_kind(error: Exception):
+    """
+    How a failed request should be treated: "down" (the host is unreachable or
+    broken), "missing" (the host does not have the model), or None (not a host
+    problem; raise it).
+    """
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          requests.exceptions.ChunkedEncodingError)):
+        return "down"
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return "down"
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status == 404:
+        return "missing"
+    if status is not None and status >= 500:
+        return "down"
+    return None
+
+
+class _Host:
+    """One server in the pool and what is known about it."""
+
+    def __init__(self, endpoint: dict):
+        self.client = LLMClient(endpoint)
+        self.name = urlparse(endpoint['url']).netloc
+        self.up = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency_ms = None
+        self.probe_ms = None
+        self.loaded = None      # models resident in memory; None when the server cannot say
+        self.installed = None   # models pulled on the host; None when the server cannot say
+        self.last_error = None
+
+    def penalty(self, model: str, unloaded_penalty: float) -> float:
+        """Extra queue depth charged for sending `model` here."""
+        if self.installed is not None and model not in self.installed:
+            return NOT_INSTALLED_PENALTY
+        if self.loaded is not None and model not in self.loaded:
+            return unloaded_penalty
+        return 0
+
+    def snapshot(self) -> dict:
+        return {
+            "host": self.name,
+            "up": self.up,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ms": self.latency_ms,
+            "probe_ms": self.probe_ms,
+            "loaded_models": sorted(self.loaded) if self.loaded is not None else None,
+            "last_error": self.last_error
+        }
+
+
+class EndpointPool:
+    """
+    Drop-in replacement for LLMClient that spreads requests over several hosts.
+
+    Every host uses the local endpoint's route and settings with its own pooled
+    connection. Each request goes to the healthy host with the fewest outstanding
+    requests, where a host without the model resident counts `unloaded_penalty`
+    extra requests (a queued request is cheaper than a cold load) and a host without
+    the model installed is a last resort. Hosts are probed in the background; a
+    host that drops a connection, times out or answers 5xx is marked down until its
+    next good probe and the request is retried on the next host.
+    """
+
+    def __init__(self, endpoint: dict, pool_config: dict):
+        self.endpoint = endpoint
+        self.url = endpoint['url']
+        self.model = endpoint['model']
+        route = urlparse(self.url).path
+        self.hosts = []
+        for host in pool_config['hosts']:
+            parsed = urlparse(host)
+            url = host if parsed.path not in ('', '/') else urlunparse((parsed.scheme, parsed.netloc, route, '', '', ''))
+            self.hosts.append(_Host(dict(endpoint, url=url)))
+
+        self.probe_timeout = pool_config.get('probe_timeout_seconds', DEFAULT_PROBE_TIMEOUT_SECONDS)
+        self.unloaded_penalty = pool_config.get('unloaded_penalty', DEFAULT_UNLOADED_PENALTY)
+        self.stats = {"requests": 0, "failovers": 0}
+        self._lock = threading.Lock()
+        self._context_hosts = OrderedDict()
+        self._stop = threading.Event()
+
+        self.probe_all()
+        interval = pool_config.get('health_interval_seconds', DEFAULT_HEALTH_INTERVAL_SECONDS)
+        if interval:
+            threading.Thread(target=self._probe_loop, args=(interval,), daemon=True).start()
+
+    def build_messages(self, prompt: str) -> list:
+        return self.hosts[0].client.build_messages(prompt)
+
+    def close(self):
+        """Stop the background probes."""
+        self._stop.set()
+
+    # Health
+
+    def probe(self, host: _Host):
+        """Check one host: Ollama's /api/ps and /api/tags, or /v1/models on other servers."""
+        session = host.client.session
+        started = time.perf_counter()
+        try:
+            response = session.get(f"{host.client.base_url}/api/ps", timeout=self.probe_timeout)
+            if response.status_code == 404:
+                session.get(f"{host.client.base_url}/v1/models", timeout=self.probe_timeout).raise_for_status()
+                loaded = installed = None
+            else:
+                response.raise_for_status()
+                loaded = {m.get('model') or m.get('name') for m in response.json().get('models', [])}
+                tags = session.get(f"{host.client.base_url}/api/tags", timeout=self.probe_timeout)
+                tags.raise_for_status()
+                installed = {m.get('model') or m.get('name') for m in tags.json().get('models', [])}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            with self._lock:
+                host.up = False
+                host.last_error = str(e)
+            return
+        with self._lock:
+            host.up = True
+            host.probe_ms = (time.perf_counter() - started) * 1000
+            host.loaded, host.installed = loaded, installed
+            host.last_error = None
+
+    def probe_all(self):
+        """Probe every host concurrently and log the pool's state."""
+        with ThreadPoolExecutor(max_workers=len(self.hosts)) as executor:
+            list(executor.map(self.probe, self.hosts))
+        _log_event({"event": "probe", "model": self.model, "hosts": self.snapshot()})
+
+    def _probe_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            self.probe_all()
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [host.snapshot() for host in self.hosts]
+
+    # Dispatch
+
+    def _acquire(self, model: str, tried: set, prefer: _Host = None) -> _Host:
+        """Pick the host for the next attempt and count the request against it."""
+        with self._lock:
+            candidates = [host for host in self.hosts if host not in tried]
+            if not candidates:
+                return None
+            # Down hosts are tried last rather than never: the probe may be stale
+            healthy = [host for host in candidates if host.up] or candidates
+            if prefer in healthy:
+                chosen = prefer
+            else:
+                chosen = min(healthy, key=lambda host: (
+                    host.outstanding + host.penalty(model, self.unloaded_penalty),
+                    host.latency_ms if host.latency_ms is not None else 0
+                ))
+            chosen.outstanding += 1
+            return chosen
+
+    def _release(self, host: _Host, model: str, started: float, error: Exception = None) -> str:
+        """Record the outcome of a request on `host`; returns the failure kind, if any."""
+        kind = _failure_kind(error) if error is not None else None
+        with self._lock:
+            host.outstanding -= 1
+            if error is None:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                host.requests += 1
+                host.latency_ms = elapsed_ms if host.latency_ms is None else (
+                    LATENCY_EWMA_ALPHA * elapsed_ms + (1 - LATENCY_EWMA_ALPHA) * host.latency_ms
+                )
+                if host.loaded is not None:
+                    host.loaded.add(model)
+            elif kind == "down":
+                host.failures += 1
+                host.up = False
+                host.last_error = str(error)
+            elif kind == "missing" and host.installed is not None:
+                host.installed.discard(model)
+        return kind
+
+    def _attempts(self, model: str, prefer: _Host = None):
+        """Yield (host, queue_depth) for each attempt until a host answers."""
+        tried = set()
+        while True:
+            host = self._acquire(model, tried, prefer)
+            if host is None:
+                return
+            tried.add(host)
+            yield host, host.outstanding
+
+    def _on_failure(self, host: _Host, model: str, started: float, error: Exception, failovers: int) -> int:
+        kind = self._release(host, model, started, error)
+        if kind is None or isinstance(error, RequestCancelled):
+            raise error
+        with self._lock:
+            self.stats['failovers'] += 1
+        _log_event({"event": "failover", "host": host.name, "model": model, "error": str(error)})
+        return failovers + 1
+
+    def _finish(self, host: _Host, model: str, started: float, queue_depth: int, failovers: int, metrics: dict):
+        self._release(host, model, started)
+        with self._lock:
+            self.stats['requests'] += 1
+            hosts_up = sum(1 for h in self.hosts if h.up)
+        metrics.update(endpoint_host=host.name, endpoint_queue_depth=queue_depth,
+                       endpoint_latency_ms=host.latency_ms, endpoint_failovers=failovers,
+                       endpoint_hosts_up=hosts_up)
+        return metrics
+
+    def chat(self, messages: list, stream: bool = False, on_field=None, on_progress=None,
+             model: str = None, options: dict = None, cancel_event=None, first_token_event=None):
+        """LLMClient.chat() on the least loaded host, failing over to the others."""
+        model = model or self.model
+        failovers, last_error = 0, None
+        for host, queue_depth in self._attempts(model):
+            started = time.perf_counter()
+            try:
+                content, raw_response, metrics = host.client.chat(
+                    messages, stream, on_field, on_progress, model, options, cancel_event, first_token_event
+                )
+            except Exception as e:
+                failovers, last_error = self._on_failure(host, model, started, e, failovers), e
+                continue
+            return content, raw_response, self._finish(host, model, started, queue_depth, failovers, metrics)
+        raise last_error
+
+    async def achat(self, messages: list, stream: bool = False, on_field=None, on_progress=None,
+                    model: str = None, options: dict = None, cancel_event=None, first_token_event=None):
+        """LLMClient.achat() on the least loaded host, failing over to the others."""
+        model = model or self.model
+        failovers, last_error = 0, None
+        for host, queue_depth in self._attempts(model):
+            started = time.perf_counter()
+            try:
+                content, raw_response, metrics = await host.client.achat(
+                    messages, stream, on_field, on_progress, model, options, cancel_event, first_token_event
+                )
+            except asyncio.CancelledError:
+                self._release(host, model, started)
+                raise
+            except Exception as e:
+                failovers, last_error = self._on_failure(host, model, started, e, failovers), e
+                continue
+            return content, raw_response, self._finish(host, model, started, queue_depth, failovers, metrics)
+        raise last_error
+
+    def generate(self, prompt: str, context: list = None, system: str = SYSTEM_PROMPT, options: dict = None):
+        """
+        LLMClient.generate() with failover. A turn that continues a `context` goes to
+        the host that returned it, where the conversation's KV state is cached; any
+        other host re-evaluates the context from scratch.
+        """
+        key = hash(tuple(context)) if context else None
+        with self._lock:
+            prefer = self._context_hosts.get(key)
+        failovers, last_error = 0, None
+        for host, queue_depth in self._attempts(self.model, prefer):
+            started = time.perf_counter()
+            try:
+                content, raw_response, metrics = host.client.generate(prompt, context, system, options)
+            except Exception as e:
+                failovers, last_error = self._on_failure(host, self.model, started, e, failovers), e
+                continue
+            if raw_response.get('context'):
+                with self._lock:
+                    self._context_hosts[hash(tuple(raw_response['context']))] = host
+                    while len(self._context_hosts) > MAX_CONTEXT_AFFINITY:
+                        self._context_hosts.popitem(last=False)
+            return content, raw_response, self._finish(host, self.model, started, queue_depth, failovers, metrics)
+        raise last_error
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Endpoint Pool")
+    parser.add_argument("--watch", type=float, help="Re-probe every N seconds instead of once.")
+    args = parser.parse_args()
+
+    from atlas_core.tools.generate_patch import load_llm_config
+
+    llm_config = load_llm_config()
+    pool_settings = dict(llm_config.get('endpoint_pool', {}), health_interval_seconds=0)
+    if not pool_settings.get('hosts'):
+        print("❌ No endpoint_pool.hosts configured in llm_config.yaml", file=sys.stderr)
+        sys.exit(1)
+    endpoint_pool = EndpointPool(llm_config['llm_endpoints']['local'], pool_settings)
+    while True:
+        for state in endpoint_pool.snapshot():
+            status = "✅" if state['up'] else "❌"
+            print(f"{status} {state['host']}: probe {state['probe_ms'] or 0:.0f}ms, "
+                  f"loaded {state['loaded_models']}{'  ' + state['last_error'] if state['last_error'] else ''}")
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+        endpoint_pool.probe_all()
@@ -0,0 +1,352 @@
+"""
+Atlas Environment Cache
+Dependency environments built once per lockfile hash and hardlinked into verification worktrees
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import platform
+import shutil
+import stat
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/env_cache.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.disk_cache import hash_key
+from atlas_core.tools.process_runner import MeasuredProcess
+
+ENV_DIR = Path(__file__).parent.parent / 'cache' / 'envs'
+
+DEFAULT_KEY_FILES = ['requirements*.txt', 'pyproject.toml', 'setup.py', 'setup.cfg', 'poetry.lock', 'Pipfile.lock']
+DEFAULT_MAX_AGE_DAYS = 14
+DEFAULT_MAX_ENVS = 5
+BUILD_POLL_SECONDS = 0.5
+
+BIN_DIR = 'Scripts' if os.name == 'nt' else 'bin'
+META_FILE = 'atlas-env.json'
+STATS_FILE = 'stats.json'
+
+# Scripts larger than this are binaries; their paths are not rewritten
+MAX_SCRIPT_BYTES = 1024 * 1024
+
+
+def env_python(env) -> Path:
+    return Path(env) / BIN_DIR / ('python.exe' if os.name == 'nt' else 'python')
+
+
+def environment_for(env) -> dict:
+    """os.environ with `env` activated, for the build and test steps."""
+    environment = dict(os.environ)
+    environment.pop('PYTHONHOME', None)
+    environment['VIRTUAL_ENV'] = str(env)
+    environment['PATH'] = str(Path(env) / BIN_DIR) + os.pathsep + environment.get('PATH', '')
+    return environment
+
+
+def _make_writable(path: Path):
+    for root, dirs, _ in os.walk(path):
+        for name in dirs:
+            if not os.path.islink(os.path.join(root, name)):
+                os.chmod(os.path.join(root, name), 0o755)
+    os.chmod(path, 0o755)
+
+
+def _remove_tree(path: Path):
+    if path.exists() or path.is_symlink():
+        _make_writable(path)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _make_read_only(path: Path):
+    """Files lose their write bits (shared by every hardlink), directories become r-x."""
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if not os.path.islink(file_path):
+                os.chmod(file_path, stat.S_IMODE(os.stat(file_path).st_mode) & ~0o222)
+        for name in dirs:
+            if not os.path.islink(os.path.join(root, name)):
+                os.chmod(os.path.join(root, name), 0o555)
+    os.chmod(path, 0o555)
+
+
+class EnvCache:
+    """
+    Environments under atlas_core/cache/envs, one per content key.
+
+    The key hashes the dependency files in the (patched) worktree that match
+    `key_files`, the setup command and the Python version, so a patch that changes
+    requirements gets its own environment. The first verification for a key runs the
+    setup command (by default a venv plus `pip install -r` of each requirements file)
+    and marks the result read-only. Later verifications hardlink it into a directory
+    beside their worktree: links cost no space, and since the shared files are
+    read-only, a step can replace files in its copy but never change them for others
+    (unless it runs as root; `link_mode: copy` copies instead). Scripts whose text
+    names the cache path are rewritten to the copy.
+    """
+
+    def __init__(self, config: dict = None, env_dir=ENV_DIR):
+        verification_config = (config or {}).get('verification', {})
+        env_config = verification_config.get('env_cache', {})
+        self.env_dir = Path(env_dir)
+        self.key_files = env_config.get('key_files', DEFAULT_KEY_FILES)
+        self.max_age_days = env_config.get('max_age_days', DEFAULT_MAX_AGE_DAYS)
+        self.max_envs = env_config.get('max_envs', DEFAULT_MAX_ENVS)
+        # Read-only bits do not stop root: "copy" isolates fully at the cost of disk and time
+        self.link_mode = env_config.get('link_mode', 'hardlink')
+        self.build_timeout = verification_config.get('build_timeout_seconds', 600)
+        self._stats_lock = threading.Lock()
+
+    def dependency_files(self, source_dir) -> list:
+        """Paths (relative, sorted) in `source_dir` matching `key_files`, skipping hidden directories."""
+        source_dir = Path(source_dir)
+        found = []
+        for root, dirs, files in os.walk(source_dir):
+            dirs[:] = [name for name in dirs if not name.startswith('.') and name not in ('node_modules', '__pycache__')]
+            for name in files:
+                if any(fnmatch.fnmatch(name, pattern) for pattern in self.key_files):
+                    found.append(Path(root, name).relative_to(source_dir).as_posix())
+        return sorted(found)
+
+    def setup_command(self, repo_config: dict, files: list, env: Path) -> str:
+        """The target repo's `env_setup_command`, or a venv with every requirements file installed."""
+        command = repo_config.get('env_setup_command')
+        if not command:
+            command = '"{python}" -m venv "{env}"' + ''.join(
+                f' && "{{env_python}}" -m pip install -q -r "{path}"'
+                for path in files if fnmatch.fnmatch(Path(path).name, 'requirements*.txt')
+            )
+        return command.format(python=sys.executable, env=env, env_python=env_python(env))
+
+    def key_for(self, source_dir, repo_config: dict, files: list) -> str:
+        digest = hashlib.sha256()
+        for path in files:
+            digest.update(path.encode('utf-8') + b'\0')
+            digest.update(Path(source_dir, path).read_bytes() + b'\0')
+        template = repo_config.get('env_setup_command', 'default')
+        return hash_key(digest.hexdigest(), template, platform.python_version(), sys.platform)[:24]
+
+    def _meta(self, env: Path):
+        try:
+            return json.loads((env / META_FILE).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_meta(self, env: Path, meta: dict):
+        meta_path = env / META_FILE
+        mode = os.stat(env).st_mode
+        os.chmod(env, 0o755)
+        try:
+            meta_path.unlink(missing_ok=True)
+            meta_path.write_text(json.dumps(meta))
+        finally:
+            os.chmod(env, stat.S_IMODE(mode))
+
+    def _build(self, env: Path, command: str, source_dir) -> dict:
+        """Run the setup command into `env` under its lock; returns {code, log, build_ms}."""
+        lock_path = env.with_suffix('.lock')
+        deadline = time.monotonic() + self.build_timeout
+        while True:
+            if self._meta(env):
+                return {"code": 0, "log": "", "build_ms": 0, "built": False}
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - lock_path.stat().st_mtime > self.build_timeout:
+                        lock_path.unlink(missing_ok=True)  # left by a build that died
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Environment {env.name} is still being built elsewhere")
+                time.sleep(BUILD_POLL_SECONDS)
+
+        os.close(fd)
+        try:
+            if self._meta(env):
+                return {"code": 0, "log": "", "build_ms": 0, "built": False}  # finished while we waited
+            _remove_tree(env)  # a half-built environment without metadata
+            started = time.perf_counter()
+            code, log, _ = MeasuredProcess(command, source_dir, timeout=self.build_timeout).run()
+            build_ms = (time.perf_counter() - started) * 1000
+            if code != 0:
+                _remove_tree(env)
+                return {"code": code, "log": log, "build_ms": build_ms, "built": False}
+            now = time.time()
+            (env / META_FILE).write_text(json.dumps({
+                "command": command, "build_ms": build_ms, "created": datetime.now().isoformat(),
+                "last_used": now, "uses": 0
+            }))
+            _make_read_only(env)
+            return {"code": 0, "log": log, "build_ms": build_ms, "built": True}
+        finally:
+            lock_path.unlink(missing_ok=True)
+
+    def link(self, env: Path, target: Path):
+        """Recreate `target` as a hardlinked copy of `env` (copied where links are not possible)."""
+        _remove_tree(target)
+        target.mkdir(parents=True)
+        for root, dirs, files in os.walk(env):
+            destination = target / os.path.relpath(root, env)
+            for name in list(dirs):
+                if os.path.islink(os.path.join(root, name)):
+                    os.symlink(os.readlink(os.path.join(root, name)), destination / name)
+                    dirs.remove(name)
+                else:
+                    (destination / name).mkdir()
+            for name in files:
+                source = os.path.join(root, name)
+                if name == META_FILE and root == str(env):
+                    continue
+                if os.path.islink(source):
+                    os.symlink(os.readlink(source), destination / name)
+                    continue
+                if self.link_mode == 'copy':
+                    shutil.copy2(source, destination / name)
+                    continue
+                try:
+                    os.link(source, destination / name)
+                except OSError:
+                    shutil.copy2(source, destination / name)
+
+        # Scripts and activate files name the environment they were built in
+        old, new = str(env).encode(), str(target).encode()
+        bin_dir = target / BIN_DIR
+        for path in (bin_dir.iterdir() if bin_dir.is_dir() else []):
+            if path.is_symlink() or not path.is_file() or path.stat().st_size > MAX_SCRIPT_BYTES:
+                continue
+            data = path.read_bytes()
+            if old in data:
+                path.unlink()  # never write through the shared link
+                path.write_bytes(data.replace(old, new))
+                path.chmod(0o755)
+
+    def prepare(self, source_dir, repo_config: dict, target) -> dict:
+        """
+        Put the environment for `source_dir`'s dependency files at `target`, building
+        it first on a miss.
+
+        Returns:
+            None when the worktree has no dependency files, else dict with code, log,
+            key, hit, setup_ms (this verification), saved_ms (vs. building again) and path
+        """
+        files = self.dependency_files(source_dir)
+        if not files:
+            return None
+        target = Path(target)
+        self.env_dir.mkdir(parents=True, exist_ok=True)
+        key = self.key_for(source_dir, repo_config, files)
+        env = self.env_dir / key
+        started = time.perf_counter()
+
+        build = self._build(env, self.setup_command(repo_config, files, env), source_dir)
+        if build["code"] != 0:
+            self._count(failures=1)
+            return {"code": build["code"], "log": build["log"], "key": key, "hit": False,
+                    "setup_ms": build["build_ms"], "saved_ms": 0, "path": None, "files": files}
+
+        self.link(env, target)
+        setup_ms = (time.perf_counter() - started) * 1000
+        meta = self._meta(env)
+        meta["last_used"] = time.time()
+        meta["uses"] = meta.get("uses", 0) + 1
+        self._write_meta(env, meta)
+
+        hit = not build["built"]
+        saved_ms = max(meta["build_ms"] - setup_ms, 0) if hit else 0
+        self._count(hits=int(hit), misses=int(not hit), saved_ms=saved_ms, setup_ms=setup_ms)
+        if not hit:
+            self.gc()
+        summary = (f"Environment {key} {'reused' if hit else 'built'} from {', '.join(files)} "
+                   f"in {setup_ms:.0f} ms" + (f" (saved {saved_ms / 1000:.1f} s)" if hit else "") + "\n")
+        return {"code": 0, "log": build["log"] + summary, "key": key, "hit": hit, "setup_ms": setup_ms,
+                "saved_ms": saved_ms, "path": str(target), "files": files}
+
+    def environments(self) -> list:
+        """(path, meta) for every complete environment, least recently used first."""
+        envs = []
+        for path in (self.env_dir.iterdir() if self.env_dir.is_dir() else []):
+            meta = self._meta(path) if path.is_dir() else None
+            if meta:
+                envs.append((path, meta))
+        return sorted(envs, key=lambda env: env[1].get('last_used', 0))
+
+    def gc(self) -> list:
+        """Delete environments unused for `max_age_days`, then the least recently used beyond `max_envs`."""
+        envs = self.environments()
+        removed = []
+        cutoff = time.time() - self.max_age_days * 86400
+        for index, (path, meta) in enumerate(envs):
+            if meta.get('last_used', 0) < cutoff or len(envs) - index > self.max_envs:
+                if path.with_suffix('.lock').exists():
+                    continue
+                _remove_tree(path)
+                removed.append(path.name)
+        return removed
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            stats = self.stats()
+            for counter, value in increments.items():
+                stats[counter] = stats.get(counter, 0) + value
+            (self.env_dir / STATS_FILE).write_text(json.dumps(stats))
+
+    def stats(self) -> dict:
+        try:
+            return json.loads((self.env_dir / STATS_FILE).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def report(self) -> dict:
+        """Hit rate, setup time saved and the environments on disk."""
+        stats = self.stats()
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        return {
+            "hits": stats.get('hits', 0),
+            "misses": stats.get('misses', 0),
+            "failures": stats.get('failures', 0),
+            "hit_rate": stats.get('hits', 0) / lookups if lookups else None,
+            "setup_saved_s": stats.get('saved_ms', 0) / 1000,
+            "setup_spent_s": stats.get('setup_ms', 0) / 1000,
+            "environments": [{"key": path.name, "uses": meta.get('uses', 0), "build_s": meta['build_ms'] / 1000,
+                              "created": meta.get('created'),
+                              "last_used": datetime.fromtimestamp(meta.get('last_used', 0)).isoformat()}
+                             for path, meta in self.environments()]
+        }
+
+
+_env_caches = {}
+
+
+def get_env_cache(config: dict) -> EnvCache:
+    """The process-wide environment cache."""
+    return _env_caches.setdefault('default', EnvCache(config))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Environment Cache")
+    parser.add_argument("--gc", action="store_true", help="Delete old and least recently used environments.")
+    parser.add_argument("--prepare", metavar="DIR", help="Build or reuse the environment for a checkout.")
+    parser.add_argument("--target", help="Where --prepare links the environment (default: <DIR>.env).")
+    args = parser.parse_args()
+
+    from atlas_core.tools.verify_patch import load_config
+    llm_config = load_config()
+    env_cache = EnvCache(llm_config)
+    if args.prepare:
+        repo_settings = next(iter(llm_config.get('target_repos', {}).values()), {})
+        prepared = env_cache.prepare(args.prepare, repo_settings, args.target or f"{Path(args.prepare).resolve()}.env")
+        print(prepared['log'] if prepared else "No dependency files found.", end='\n' if not prepared else '')
+    if args.gc:
+        print(f"🧹 Removed: {', '.join(env_cache.gc()) or 'nothing'}")
+    print(f"ATLAS_JSON_RESULT:{json.dumps(env_cache.report())}")
@@ -4,17 +4,92 @@ Propose → Verify → Refine → Apply lifecycle
 """
 
 import argparse
+import asyncio
 import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
 import requests
 import yaml
 from pathlib import Path
 from datetime import datetime
 
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/generate_patch.py` (used by the Streamlit app)
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.disk_cache import DiskCache, hash_key
+from atlas_core.tools.llm_client import PROMPT_TEMPLATE_VERSION, get_client, parse_patch_response
+from atlas_core.tools.log_distiller import estimate_tokens, read_error_context, token_budget_for
+from atlas_core.tools.model_router import route_model, with_model
+from atlas_core.tools.repo_index import build_source_context
+
+# Serialises appends to the JSONL logs when proposals run concurrently (batch mode)
+_log_lock = threading.Lock()
+
+# Volatile fragments stripped before hashing a log, so reruns of the same failure share a cache entry
+_LOG_NOISE_PATTERNS = [
+    re.compile(r'\x1b\[[0-9;]*[A-Za-z]'),                                    # ANSI colour codes
+    re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?'),  # timestamps
+    re.compile(r'\b\d{2}:\d{2}:\d{2}(?:\.\d+)?\b'),                          # clock times
+    re.compile(r'\b0x[0-9a-fA-F]{6,}\b'),                                     # memory addresses
+    re.compile(r'\b\d+(?:\.\d+)?\s?(?:ms|s|sec|seconds)\b'),                   # durations
+]
+
 def load_llm_config():
-    """Load LLM configuration from yaml"""
+    """Load LLM configuration from yaml; ATLAS_LLM_URL overrides the local endpoint URL"""
     config_path = Path(__file__).parent.parent / 'config' / 'llm_config.yaml'
     with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+        config = yaml.safe_load(f)
+    if os.environ.get('ATLAS_LLM_URL'):
+        config['llm_endpoints']['local']['url'] = os.environ['ATLAS_LLM_URL']
+    return config
+
+def normalize_error_log(error_logs: str) -> str:
+    """Strip run-specific noise (timestamps, colours, addresses, durations) from a log."""
+    for pattern in _LOG_NOISE_PATTERNS:
+        error_logs = pattern.sub('', error_logs)
+    return "\n".join(line.rstrip() for line in error_logs.splitlines()).strip()
+
+def get_response_cache(config: dict):
+    """Return the on-disk response cache, or None when disabled in config."""
+    cache_config = config.get('cache', {})
+    if not cache_config.get('enabled', False):
+        return None
+    cache_dir = Path(__file__).parent.parent / 'cache' / 'responses'
+    return DiskCache.from_config(cache_dir, cache_config)
+
+def response_cache_key(model: str, error_logs: str, source_context: str = '') -> str:
+    """Key a response by model, prompt-template version, the normalized log and any attached source."""
+    log_hash = hash_key(normalize_error_log(error_logs))
+    if source_context:
+        # The same failure against changed source is a different question
+        return hash_key(model, PROMPT_TEMPLATE_VERSION, log_hash, hash_key(source_context))
+    return hash_key(model, PROMPT_TEMPLATE_VERSION, log_hash)
+
+def build_prompt(error_logs: str, source_context: str = '') -> str:
+    """Construct the diagnostic prompt for an error log, with the source its stack frames reference."""
+    source_section = ""
+    if source_context:
+        source_section = f"""
+Relevant Source (current contents; base patch hunks on these lines):
+{source_context}
+"""
+    return f"""Analyze this CI/CD failure and propose a patch to fix it.
+
+Error Logs:
+{error_logs}
+{source_section}
+Provide a structured JSON response with:
+1. confidence_score: Your confidence this patch will work (0.0-1.0)
+2. patch_diff: Unified diff format patch
+3. explanation: Clear explanation of the fix
+4. affected_files: List of files modified
+5. test_commands: Commands to validate the fix
+"""
 
 def call_llm(prompt: str, config: dict) -> dict:
     """
@@ -23,60 +98,16 @@ def call_llm(prompt: str, config: dict) -> dict:
     Returns:
         dict with keys: confidence_score, patch_diff, explanation, affected_files, test_commands
     """
-    endpoint = config['llm_endpoints']['local']
-    
-    if not endpoint['enabled']:
-        raise RuntimeError("Local LLM endpoint not enabled in config")
-    
-    system_prompt = """You are Atlas, a CI/CD error diagnosis and patch generation expert.
-You MUST respond with valid JSON ONLY, no markdown formatting, no explanations outside the JSON.
-
-Required JSON schema:
-{
-  "confidence_score": 0.0-1.0,
-  "patch_diff": "unified diff format",
-  "explanation": "human-readable rationale",
-  "affected_files": ["list", "of", "files"],
-  "test_commands": ["command1", "command2"]
-}"""
-    
-    payload = {
-        "model": endpoint['model'],
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        "stream": False  # Disable streaming for JSON response
-    }
+    client = get_client(config)
     
     try:
-        response = requests.post(
-            endpoint['url'],
-            json=payload,
-            timeout=endpoint.get('timeout_seconds', 300)
-        )
-        response.raise_for_status()
-        
-        result = response.json()
+        content, raw_response, metrics = client.chat(client.build_messages(prompt))
         
-        # Ollama returns the response in result['message']['content']
-        if 'message' in result and 'content' in result['message']:
-            content = result['message']['content']
-        else:
-            raise ValueError(f"Unexpected Ollama response format: {result}")
-        
-        # Parse JSON response
+        # Parse and validate the JSON response, repairing fences or truncation
         try:
-            patch_data = json.loads(content)
-            
-            # Validate schema
-            required_keys = ['confidence_score', 'patch_diff', 'explanation', 'affected_files', 'test_commands']
-            if not all(key in patch_data for key in required_keys):
-                raise ValueError(f"Missing required keys. Expected: {required_keys}")
-            
-            return patch_data
+            return parse_model_output(content, prompt, raw_response, config, metrics)
         
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             print(f"❌ LLM returned invalid JSON: {e}")
             print(f"Response: {content}")
             raise
@@ -85,7 +116,22 @@ Required JSON schema:
         print(f"❌ LLM endpoint unreachable: {e}")
         raise
 
-def log_performance_and_iteration(prompt, patch_data, raw_response, config):
+def parse_model_output(content: str, prompt: str, raw_response: dict, config: dict, extra_metrics: dict) -> dict:
+    """
+    parse_patch_response() that records the outcome: `extra_metrics['parse_status']` is
+    set to "clean" or "repaired", and a failed parse is logged to performance.jsonl
+    (parse_status "failed") before the ValueError is re-raised.
+    """
+    try:
+        patch_data, parse_status = parse_patch_response(content)
+    except ValueError as e:
+        log_performance_and_iteration(prompt, {}, raw_response or {}, config,
+                                      dict(extra_metrics or {}, parse_status="failed", parse_error=str(e)))
+        raise
+    extra_metrics['parse_status'] = parse_status
+    return patch_data
+
+def log_performance_and_iteration(prompt, patch_data, raw_response, config, extra_metrics=None):
     """Logs performance metrics and the iteration details to persistent files."""
     log_dir = Path(__file__).parent.parent / 'logs'
     log_dir.mkdir(exist_ok=True)
@@ -97,6 +143,7 @@ def log_performance_and_iteration(prompt, patch_data, raw_response, config):
     duration_ns = raw_response.get('total_duration', 0)
     prompt_tokens = raw_response.get('prompt_eval_count', 0)
     response_tokens = raw_response.get('eval_count', 0)
+    prompt_eval_ns = raw_response.get('prompt_eval_duration', 0)
     
     perf_entry = {
         "timestamp": datetime.now().isoformat(),
@@ -104,11 +151,14 @@ def log_performance_and_iteration(prompt, patch_data, raw_response, config):
         "response_time_ms": duration_ns / 1_000_000,
         "prompt_tokens": prompt_tokens,
         "response_tokens": response_tokens,
+        "prompt_eval_ms": prompt_eval_ns / 1_000_000,
         "tokens_per_second": response_tokens / (duration_ns / 1_000_000_000) if duration_ns > 0 else 0,
         "confidence_score": patch_data.get('confidence_score')
     }
-    
-    with open(perf_log_path, 'a') as f:
+    if extra_metrics:
+        perf_entry.update(extra_metrics)
+
+    with _log_lock, open(perf_log_path, 'a') as f:
         f.write(json.dumps(perf_entry) + '\n')
 
     # --- Log Iteration ---
@@ -119,79 +169,232 @@ def log_performance_and_iteration(prompt, patch_data, raw_response, config):
         "prompt": prompt,
         "response": patch_data
     }
-    with open(iteration_log_path, 'a') as f:
+    with _log_lock, open(iteration_log_path, 'a') as f:
         f.write(json.dumps(iteration_entry) + '\n')
 
+    return perf_entry
+
+
+def _prepare_proposal(error_log_path: str, config: dict, use_cache: bool, quiet: bool) -> dict:
+    """
+    Read and distill the log, route it to a model, build the prompt and look it up in
+    the response cache. The returned proposal's `config` names the routed model and is
+    what the caller should send the request with.
+    """
+    model = config['llm_endpoints']['local']['model']
+    
+    # Load error context, distilled down to the failing sections for large logs
+    perf_log_path = Path(__file__).parent.parent / 'logs' / 'performance.jsonl'
+    error_logs, distill_report = read_error_context(error_log_path, model, config, perf_log_path)
+
+    # Pick the model for this prompt size from the performance history
+    route = None
+    if config.get('router', {}).get('enabled', False):
+        route = route_model(config, estimate_tokens(error_logs))
+        if route['model'] != model:
+            routed_config = with_model(config, route['model'])
+            if token_budget_for(route['model'], routed_config) != token_budget_for(model, config):
+                error_logs, distill_report = read_error_context(
+                    error_log_path, route['model'], routed_config, perf_log_path
+                )
+            config, model = routed_config, route['model']
+        if not quiet:
+            print(f"🧭 Routed to {model}: {route['reason']}")
+    if distill_report and not quiet and distill_report['distilled_bytes'] < distill_report['raw_bytes']:
+        saved_ms = distill_report['prompt_eval_ms_saved_est']
+        saved_text = f", ~{saved_ms / 1000:.1f}s prompt eval saved" if saved_ms else ""
+        print(f"✂️  Distilled log: {distill_report['raw_tokens_est']} → "
+              f"{distill_report['distilled_tokens_est']} tokens (est.){saved_text}")
+
+    # Attach the source regions the stack frames point at, from the target repo index
+    source_context, context_report = build_source_context(error_logs, config)
+    if context_report and context_report['source_regions'] and not quiet:
+        print(f"📎 Attached {context_report['source_regions']} source region(s) "
+              f"(~{context_report['source_context_tokens_est']} tokens)")
+    
+    cache = get_response_cache(config) if use_cache else None
+    cache_key = response_cache_key(model, error_logs, source_context) if cache else None
+    started = time.perf_counter()
+    cached = cache.get(cache_key) if cache else None
+    lookup_ns = int((time.perf_counter() - started) * 1_000_000_000)
+    if cached and not quiet:
+        print(f"⚡ Cache hit ({lookup_ns / 1_000_000:.1f} ms), reusing proposal from {cached['timestamp']}")
+
+    return {
+        "model": model,
+        "config": config,
+        "route": route,
+        # Construct diagnostic prompt
+        "prompt": build_prompt(error_logs, source_context),
+        "distill_report": distill_report,
+        "context_report": context_report,
+        "cache": cache,
+        "cache_key": cache_key,
+        "cached": cached,
+        "lookup_ns": lookup_ns
+    }
+
+def _finish_proposal(proposal: dict, config: dict, content: str = None, raw_llm_response: dict = None,
+                     extra_metrics: dict = None, on_field=None):
+    """Parse the model output (or the cache hit), store it and log metrics; returns (patch_data, perf_entry)."""
+    cache = proposal['cache']
+    if proposal['cached']:
+        # Identical failure seen before: reuse the stored proposal without inference
+        patch_data = proposal['cached']['patch_data']
+        raw_llm_response = {"total_duration": proposal['lookup_ns']}
+        extra_metrics = {"streamed": False, "cache": "hit"}
+        if on_field:
+            for name, value in patch_data.items():
+                on_field(name, value)
+    else:
+        if not content:
+            raise ValueError(f"Unexpected Ollama response format: {raw_llm_response}")
+            
+        extra_metrics["cache"] = "miss" if cache else "bypass"
+        patch_data = parse_model_output(content, proposal['prompt'], raw_llm_response, config, extra_metrics)
+
+        if cache:
+            cache.put(proposal['cache_key'], {
+                "timestamp": datetime.now().isoformat(),
+                "model": proposal['model'],
+                "prompt_template_version": PROMPT_TEMPLATE_VERSION,
+                "patch_data": patch_data
+            })
+
+    distill_report = proposal['distill_report']
+    if distill_report:
+        extra_metrics.update({
+            "log_raw_bytes": distill_report['raw_bytes'],
+            "log_distilled_bytes": distill_report['distilled_bytes'],
+            "log_raw_tokens_est": distill_report['raw_tokens_est'],
+            "log_distilled_tokens_est": distill_report['distilled_tokens_est'],
+            "prompt_eval_ms_saved_est": distill_report['prompt_eval_ms_saved_est']
+        })
+    if proposal['context_report']:
+        extra_metrics.update(proposal['context_report'])
+    route = proposal['route']
+    if route:
+        extra_metrics.update({
+            "route_reason": route['reason'],
+            "route_tier": route['tier'],
+            "route_slo_ms": route['slo_ms'],
+            "route_predicted_ms": route['predicted_ms'],
+            "route_quality": route['quality']
+        })
+    if cache:
+        cache_stats = cache.stats()
+        extra_metrics["cache_hits"] = cache_stats.get("hits", 0)
+        extra_metrics["cache_misses"] = cache_stats.get("misses", 0)
+    
+    # Log performance and iteration details
+    perf_entry = log_performance_and_iteration(proposal['prompt'], patch_data, raw_llm_response, config, extra_metrics)
+    return patch_data, perf_entry
+
+def generate_proposal(error_log_path: str, config: dict, stream: bool = False, on_field=None, on_progress=None,
+                      use_cache: bool = True, quiet: bool = True):
+    """
+    Run one proposal for an error log without printing results or saving files.
+
+    Returns:
+        (patch_data, perf_entry) where perf_entry is the line written to performance.jsonl
+    """
+    proposal = _prepare_proposal(error_log_path, config, use_cache, quiet)
+    config = proposal['config']
+    if proposal['cached']:
+        return _finish_proposal(proposal, config, on_field=on_field)
+
+    # The shared client keeps the connection and the model warm across proposals
+    client = get_client(config)
+    content, raw_llm_response, extra_metrics = client.chat(
+        client.build_messages(proposal['prompt']), stream=stream, on_field=on_field, on_progress=on_progress
+    )
+    return _finish_proposal(proposal, config, content, raw_llm_response, extra_metrics)
 
-def propose_patch(error_log_path: str, output_path: str = 'suggested_patch.diff', dry_run: bool = False, quiet: bool = False):
+async def generate_proposal_async(error_log_path: str, config: dict, stream: bool = False, on_field=None,
+                                  on_progress=None, use_cache: bool = True, quiet: bool = True):
+    """
+    Non-blocking generate_proposal(): file and cache work runs in a worker thread and
+    inference awaits the LLM client, so the event loop stays free for verification.
+    """
+    proposal = await asyncio.to_thread(_prepare_proposal, error_log_path, config, use_cache, quiet)
+    config = proposal['config']
+    if proposal['cached']:
+        return await asyncio.to_thread(_finish_proposal, proposal, config, on_field=on_field)
+
+    client = get_client(config)
+    content, raw_llm_response, extra_metrics = await client.achat(
+        client.build_messages(proposal['prompt']), stream=stream, on_field=on_field, on_progress=on_progress
+    )
+    return await asyncio.to_thread(_finish_proposal, proposal, config, content, raw_llm_response, extra_metrics)
+
+def save_proposal(patch_data: dict, output_path: str, error_log_path: str) -> str:
+    """Write the patch diff and its provenance metadata; returns the metadata path."""
+    # Save diff
+    with open(output_path, 'w') as f:
+        f.write(patch_data['patch_diff'])
+    
+    # Save metadata for provenance
+    metadata_path = output_path.replace('.diff', '_metadata.json')
+    now = datetime.now()
+    metadata = {
+        'timestamp': now.isoformat(),
+        # The suffix keeps proposals saved within the same second (batch_propose) distinct
+        'patch_id': f"atlas-patch-{now.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}",
+        'confidence_score': patch_data['confidence_score'],
+        'explanation': patch_data['explanation'],
+        'affected_files': patch_data['affected_files'],
+        'test_commands': patch_data['test_commands'],
+        'error_log_source': error_log_path
+    }
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata_path
+
+def propose_patch(error_log_path: str, output_path: str = 'suggested_patch.diff', dry_run: bool = False, quiet: bool = False,
+                  stream: bool = False, on_field=None, on_progress=None, use_cache: bool = True, candidates: int = 1):
     """
     Generate patch proposal from error logs
     
     Phase 1: Propose
+
+    With stream=True the response is consumed token by token; on_field/on_progress
+    receive each field as it completes (see LLMClient.chat).
+    With use_cache=False the response cache is bypassed (--no-cache).
+    With candidates > 1 several candidates are raced (see speculative.propose_speculative).
     """
     if not quiet:
         print("🔄 Atlas: Analyzing error logs...")
     
-    # Load error context
-    with open(error_log_path, 'r') as f:
-        error_logs = f.read()
-    
     # Load configuration
     config = load_llm_config()
     
-    # Construct diagnostic prompt
-    prompt = f"""Analyze this CI/CD failure and propose a patch to fix it.
-
-Error Logs:
-{error_logs}
-
-Provide a structured JSON response with:
-1. confidence_score: Your confidence this patch will work (0.0-1.0)
-2. patch_diff: Unified diff format patch
-3. explanation: Clear explanation of the fix
-4. affected_files: List of files modified
-5. test_commands: Commands to validate the fix
-"""
-    
     # Call LLM
     try:
-        # We need the raw response for metrics, so we'll adjust the call_llm logic slightly
-        endpoint = config['llm_endpoints']['local']
-        system_prompt = """You are Atlas, a CI/CD error diagnosis and patch generation expert.
-You MUST respond with valid JSON ONLY, no markdown formatting, no explanations outside the JSON.
-
-Required JSON schema:
-{
-  "confidence_score": 0.0-1.0,
-  "patch_diff": "unified diff format",
-  "explanation": "human-readable rationale",
-  "affected_files": ["list", "of", "files"],
-  "test_commands": ["command1", "command2"]
-}"""
-        payload = {
-            "model": endpoint['model'],
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            "stream": False
-        }
-        response = requests.post(
-            endpoint['url'],
-            json=payload,
-            timeout=endpoint.get('timeout_seconds', 300)
-        )
-        response.raise_for_status()
-        raw_llm_response = response.json()
-        
-        content = raw_llm_response.get('message', {}).get('content', '')
-        if not content:
-            raise ValueError(f"Unexpected Ollama response format: {raw_llm_response}")
-            
-        patch_data = json.loads(content)
-        
-        # Log performance and iteration details
-        log_performance_and_iteration(prompt, patch_data, raw_llm_response, config)
+        if stream and on_field is None and not quiet:
+            on_field = lambda name, value: print(f"   ↳ {name} received")
+
+        if candidates > 1:
+            # Imported here because the speculative module builds on this one
+            from atlas_core.tools.speculative import propose_speculative
+
+            on_score = None
+            if not quiet:
+                print(f"🏁 Racing {candidates} candidates...")
+                on_score = lambda index, variant, confidence: print(
+                    f"   ↳ candidate {index} ({variant['model']}, T={variant['temperature']}): confidence {confidence}"
+                )
+            patch_data, _, report = asyncio.run(propose_speculative(
+                error_log_path, config, candidates=candidates, use_cache=use_cache, quiet=quiet, on_score=on_score
+            ))
+            if not quiet and report['winner'] is not None:
+                outcome = "accepted" if report['accepted'] else "best available"
+                print(f"   Candidate {report['winner']} {outcome} after {report['time_to_winner_ms'] / 1000:.1f}s "
+                      f"({report['cancelled']} cancelled)")
+        else:
+            patch_data, _ = generate_proposal(
+                error_log_path, config, stream=stream, on_field=on_field, on_progress=on_progress,
+                use_cache=use_cache, quiet=quiet
+            )
 
         if not quiet:
             print(f"\n✅ Patch Generated")
@@ -204,28 +407,10 @@ Required JSON schema:
         
         # Save patch and metadata
         if not dry_run:
-            # Save diff
-            with open(output_path, 'w') as f:
-                f.write(patch_data['patch_diff'])
+            metadata_path = save_proposal(patch_data, output_path, error_log_path)
             
             if not quiet:
                 print(f"\n💾 Patch saved to: {output_path}")
-            
-            # Save metadata for provenance
-            metadata_path = output_path.replace('.diff', '_metadata.json')
-            metadata = {
-                'timestamp': datetime.now().isoformat(),
-                'patch_id': f"atlas-patch-{datetime.now().strftime('%Y%m%d-%H%M%S')}",
-                'confidence_score': patch_data['confidence_score'],
-                'explanation': patch_data['explanation'],
-                'affected_files': patch_data['affected_files'],
-                'test_commands': patch_data['test_commands'],
-                'error_log_source': error_log_path
-            }
-            with open(metadata_path, 'w') as f:
-                json.dump(metadata, f, indent=2)
-            
-            if not quiet:
                 print(f"💾 Metadata saved to: {metadata_path}")
                 print(f"\n📋 Next Steps:")
                 print(f"   1. Review patch: cat {output_path}")
@@ -243,12 +428,27 @@ if __name__ == '__main__':
     parser.add_argument("--log-file", required=True, help="Path to the error log file.")
     parser.add_argument("--output-path", default="suggested_patch.diff", help="Path to save the generated patch file.")
     parser.add_argument("--json-output", action="store_true", help="Output the patch data as a single JSON string to stdout.")
+    parser.add_argument("--stream", action="store_true", help="Stream tokens and report fields as they complete.")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache and always run inference.")
+    parser.add_argument("--candidates", type=int, default=1, help="Race N candidates and keep the first confident one that applies.")
     
     args = parser.parse_args()
 
+    on_field = on_progress = None
+    if args.stream and args.json_output:
+        # Emit incremental events for the Streamlit app; the final line is still the full JSON
+        def on_field(name, value):
+            print(f"ATLAS_STREAM:{json.dumps({'event': 'field', 'field': name, 'value': value})}", flush=True)
+
+        # Called at most every PROGRESS_INTERVAL_SECONDS by the client
+        def on_progress(name, partial):
+            print(f"ATLAS_STREAM:{json.dumps({'event': 'progress', 'field': name, 'value': partial})}", flush=True)
+
     try:
         # When json_output is true, we run in 'quiet' mode to suppress human-readable prints
-        patch_result = propose_patch(args.log_file, args.output_path, quiet=args.json_output)
+        patch_result = propose_patch(args.log_file, args.output_path, quiet=args.json_output,
+                                     stream=args.stream, on_field=on_field, on_progress=on_progress,
+                                     use_cache=not args.no_cache, candidates=args.candidates)
         
         if args.json_output:
             # Print the final JSON object to stdout for the Streamlit app to capture
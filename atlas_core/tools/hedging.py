@@ -0,0 +1,297 @@
+"""
+Atlas Hedged Requests
+Re-sends a slow request to a second endpoint and keeps whichever answer finishes first
+"""
+import asyncio
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+if __package__ in (None, ''):
+    # Allow importing this module when the tools are run as plain scripts
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.llm_client import SYSTEM_PROMPT, RequestCancelled
+from atlas_core.tools.jsonl_log import read_jsonl
+from atlas_core.tools.model_router import LOG_DIR
+
+DEFAULT_PERCENTILE = 95
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_INITIAL_DELAY_MS = 30000
+DEFAULT_MIN_DELAY_MS = 1000
+DEFAULT_WINDOW = 200
+DEFAULT_MAX_HEDGE_FRACTION = 0.1
+
+# How often a waiting request checks the caller's cancel_event
+CANCEL_POLL_SECONDS = 0.1
+
+
+def secondary_endpoint(config: dict):
+    """
+    Returns (endpoint, model) for `hedging.secondary`: the name of an
+    `llm_endpoints` entry (answering with its own model), or the URL of a second
+    server running the local model (model None: the request's model is used).
+    """
+    secondary = config.get('hedging', {}).get('secondary', 'cloud')
+    endpoints = config['llm_endpoints']
+    if secondary in endpoints:
+        endpoint = endpoints[secondary]
+        if not endpoint.get('enabled', False) or not endpoint.get('url'):
+            raise RuntimeError(f"hedging.secondary endpoint '{secondary}' is not enabled in config")
+        return endpoint, endpoint['model']
+    return dict(endpoints['local'], url=secondary), None
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class _FirstToken(threading.Event):
+    """A racer's first-token signal: records when it fired and passes it on to the caller's event."""
+
+    def __init__(self, forward=None):
+        super().__init__()
+        self.forward = forward
+        self.at = None
+
+    def set(self):
+        if self.is_set():
+            return
+        self.at = time.perf_counter()
+        super().set()
+        if self.forward is not None:
+            self.forward.set()
+
+
+class _CallbackLatch:
+    """Lets only the first racer to stream a field drive the caller's callbacks."""
+
+    def __init__(self, on_field, on_progress):
+        self.on_field = on_field
+        self.on_progress = on_progress
+        self.owner = None
+        self._lock = threading.Lock()
+
+    def _owns(self, name: str) -> bool:
+        with self._lock:
+            if self.owner is None:
+                self.owner = name
+            return self.owner == name
+
+    def callbacks(self, name: str):
+        """(on_field, on_progress) for the racer called `name`."""
+        def on_field(field, value):
+            if self._owns(name):
+                self.on_field(field, value)
+
+        def on_progress(field, partial):
+            if self._owns(name):
+                self.on_progress(field, partial)
+
+        return (on_field if self.on_field else None), (on_progress if self.on_progress else None)
+
+
+class HedgedClient:
+    """
+    Wraps the primary client (LLMClient or EndpointPool) with a hedge to a secondary one.
+
+    If the primary has not produced its first token after the `percentile` of its
+    recent time-to-first-token, the same request is sent to the secondary. The first
+    answer to complete is returned and the other request is cancelled. Racers always
+    stream, also for callers that do not: a non-streamed request could only be
+    abandoned, not closed, so the loser would keep generating on its server. Until `min_samples` latencies are known for a
+    model, the hedge waits `initial_delay_ms`. A primary failure before the hedge
+    delay hedges at once. At most `max_hedge_fraction` of the last `window`
+    requests are hedged, which keeps the steady-state load close to one request
+    per proposal. Latency history is seeded from performance.jsonl so short-lived
+    CLI runs hedge from the first request.
+    """
+
+    def __init__(self, primary, secondary, hedge_config: dict, secondary_model: str = None, log_dir=LOG_DIR):
+        self.primary = primary
+        self.secondary = secondary
+        self.secondary_model = secondary_model
+        self.url = primary.url
+        self.model = primary.model
+        self.percentile = hedge_config.get('ttft_percentile', DEFAULT_PERCENTILE)
+        self.min_samples = hedge_config.get('min_samples', DEFAULT_MIN_SAMPLES)
+        self.initial_delay_ms = hedge_config.get('initial_delay_ms', DEFAULT_INITIAL_DELAY_MS)
+        self.min_delay_ms = hedge_config.get('min_delay_ms', DEFAULT_MIN_DELAY_MS)
+        self.window = hedge_config.get('window', DEFAULT_WINDOW)
+        self.max_hedges = max(1, int(hedge_config.get('max_hedge_fraction', DEFAULT_MAX_HEDGE_FRACTION) * self.window))
+
+        self.stats = {"requests": 0, "hedges": 0, "hedge_wins": 0}
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._recent_hedges = deque(maxlen=self.window)
+        for entry in read_jsonl(Path(log_dir) / 'performance.jsonl'):
+            if entry.get('cache') == 'hit' or entry.get('hedge_winner') == 'secondary' or entry.get('refine_iteration'):
+                continue
+            # Racers always stream, so only time-to-first-token predicts the hedge delay
+            latency = entry.get('time_to_first_token_ms') if entry.get('streamed') else None
+            if latency and entry.get('model'):
+                self._add_sample(entry['model'], True, latency)
+
+    def build_messages(self, prompt: str) -> list:
+        return self.primary.build_messages(prompt)
+
+    def generate(self, prompt: str, context: list = None, system: str = SYSTEM_PROMPT, options: dict = None):
+        """Not hedged: a continued context only exists on the server that produced it."""
+        return self.primary.generate(prompt, context, system, options)
+
+    def _add_sample(self, model: str, stream: bool, latency_ms: float):
+        self._samples.setdefault((model, stream), deque(maxlen=self.window)).append(latency_ms)
+
+    def hedge_delay_ms(self, model: str, stream: bool) -> float:
+        """How long the primary may go without a first token before the request is hedged."""
+        with self._lock:
+            samples = list(self._samples.get((model, stream), ()))
+        if len(samples) < self.min_samples:
+            return self.initial_delay_ms
+        return max(self.min_delay_ms, percentile(samples, self.percentile))
+
+    def _hedge_allowed(self) -> bool:
+        with self._lock:
+            return sum(self._recent_hedges) < self.max_hedges
+
+    def _record(self, model: str, stream: bool, started: float, primary_first_token: _FirstToken,
+                primary_failed: bool, hedged: bool, winner: str):
+        with self._lock:
+            if not primary_failed:
+                # A primary cancelled before its first token contributes a lower bound
+                end = primary_first_token.at or time.perf_counter()
+                self._add_sample(model, stream, (end - started) * 1000)
+            self.stats['requests'] += 1
+            self.stats['hedges'] += hedged
+            self.stats['hedge_wins'] += winner == 'secondary'
+            self._recent_hedges.append(hedged)
+
+    def _metrics(self, metrics: dict, delay_ms: float, hedged: bool, winner: str) -> dict:
+        metrics.update(hedged=hedged, hedge_delay_ms=delay_ms, hedge_winner=winner if hedged else None,
+                       client_hedges=self.stats['hedges'], client_hedge_wins=self.stats['hedge_wins'])
+        if winner == 'secondary':
+            metrics.update(hedge_endpoint=self.secondary.url, hedge_model=self.secondary_model or self.model)
+        return metrics
+
+    def chat(self, messages: list, stream: bool = False, on_field=None, on_progress=None,
+             model: str = None, options: dict = None, cancel_event=None, first_token_event=None):
+        """LLMClient.chat() with a hedge to the secondary endpoint."""
+        model = model or self.model
+        delay_ms = self.hedge_delay_ms(model, True)
+        latch = _CallbackLatch(on_field if stream else None, on_progress if stream else None)
+        results = queue.Queue()
+        racers = {}
+
+        def launch(name, client, racer_model):
+            cancel, first_token = threading.Event(), _FirstToken(first_token_event)
+            racer_on_field, racer_on_progress = latch.callbacks(name)
+
+            def run():
+                try:
+                    results.put((name, client.chat(messages, True, racer_on_field, racer_on_progress,
+                                                   racer_model, options, cancel, first_token), None))
+                except Exception as e:
+                    results.put((name, None, e))
+
+            racers[name] = (cancel, first_token)
+            threading.Thread(target=run, daemon=True).start()
+
+        started = time.perf_counter()
+        deadline = started + delay_ms / 1000
+        launch('primary', self.primary, model)
+        hedged = False
+        errors = {}
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelled(self.url)
+                primary_waiting = not racers['primary'][1].is_set()
+                if not hedged and primary_waiting and (time.perf_counter() >= deadline or 'primary' in errors):
+                    if self._hedge_allowed():
+                        hedged = True
+                        launch('secondary', self.secondary, self.secondary_model or model)
+                    elif 'primary' in errors:
+                        raise errors['primary']
+                    else:
+                        deadline = float('inf')
+
+                wait = CANCEL_POLL_SECONDS if hedged or not primary_waiting else \
+                    min(CANCEL_POLL_SECONDS, max(deadline - time.perf_counter(), 0))
+                try:
+                    name, result, error = results.get(timeout=wait)
+                except queue.Empty:
+                    continue
+                if error is None:
+                    break
+                errors[name] = error
+                if len(errors) == len(racers) and (hedged or racers['primary'][1].is_set()):
+                    raise errors['primary']
+        finally:
+            for cancel, _ in racers.values():
+                cancel.set()
+
+        self._record(model, True, started, racers['primary'][1], 'primary' in errors, hedged, name)
+        content, raw_response, metrics = result
+        return content, raw_response, self._metrics(metrics, delay_ms, hedged, name)
+
+    async def achat(self, messages: list, stream: bool = False, on_field=None, on_progress=None,
+                    model: str = None, options: dict = None, cancel_event=None, first_token_event=None):
+        """LLMClient.achat() with a hedge to the secondary endpoint; cancelling the task cancels both requests."""
+        model = model or self.model
+        delay_ms = self.hedge_delay_ms(model, True)
+        latch = _CallbackLatch(on_field if stream else None, on_progress if stream else None)
+        tasks = {}
+        first_tokens = {}
+
+        def launch(name, client, racer_model):
+            first_tokens[name] = _FirstToken(first_token_event)
+            racer_on_field, racer_on_progress = latch.callbacks(name)
+            task = asyncio.create_task(client.achat(messages, True, racer_on_field, racer_on_progress,
+                                                    racer_model, options, None, first_tokens[name]))
+            tasks[task] = name
+
+        started = time.perf_counter()
+        deadline = started + delay_ms / 1000
+        launch('primary', self.primary, model)
+        hedged = False
+        errors = {}
+        winner = None
+        try:
+            while winner is None:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelled(self.url)
+                primary_waiting = not first_tokens['primary'].is_set()
+                if not hedged and primary_waiting and (time.perf_counter() >= deadline or 'primary' in errors):
+                    if self._hedge_allowed():
+                        hedged = True
+                        launch('secondary', self.secondary, self.secondary_model or model)
+                    elif 'primary' in errors:
+                        raise errors['primary']
+                    else:
+                        deadline = float('inf')
+
+                pending = [task for task in tasks if not task.done()]
+                wait = CANCEL_POLL_SECONDS if hedged or not primary_waiting else \
+                    min(CANCEL_POLL_SECONDS, max(deadline - time.perf_counter(), 0))
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    errors[tasks[task]] = task.exception()
+                if winner is None and len(errors) == len(tasks) and (hedged or first_tokens['primary'].is_set()):
+                    raise errors['primary']
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    task.cancel()
+            await asyncio.gather(*(task for task in tasks if task is not winner), return_exceptions=True)
+
+        name = tasks[winner]
+        self._record(model, True, started, first_tokens['primary'], 'primary' in errors, hedged, name)
+        content, raw_response, metrics = winner.result()
+        return content, raw_response, self._metrics(metrics, delay_ms, hedged, name)
@@ -0,0 +1,39 @@
+"""
+Atlas JSONL Logs
+Shared reader for the append-only logs under atlas_core/logs
+"""
+import json
+import threading
+from pathlib import Path
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def read_jsonl(path) -> list:
+    """
+    Parsed lines of a JSONL log, re-read only when the file changes.
+
+    Lines that do not parse (one cut short by a crash or a concurrent writer) are
+    skipped. The returned list is shared between callers: do not modify it.
+    """
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return []
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+    entries = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    with _cache_lock:
+        _cache[path] = (stamp, entries)
+    return entries
@@ -0,0 +1,54 @@
+"""
+Atlas Async Lifecycle API
+Non-blocking Propose → Verify → Apply so one process can keep the GPU and the CPU busy
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+if __package__ in (None, ''):
+    # Allow importing this module when the tools are run as plain scripts
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.apply_patch import apply_patch_async
+from atlas_core.tools.generate_patch import generate_proposal_async, load_llm_config
+from atlas_core.tools.refine_loop import refine_loop
+from atlas_core.tools.speculative import propose_speculative
+from atlas_core.tools.verify_patch import verify_patch_async
+
+
+async def propose(error_log_path: str, config: dict = None, stream: bool = False, on_field=None,
+                  on_progress=None, use_cache: bool = True, candidates: int = 1):
+    """
+    Generate a patch proposal for an error log. With candidates > 1 several are raced
+    (see speculative.propose_speculative); the callbacks then do not fire.
+
+    Returns:
+        (patch_data, perf_entry)
+    """
+    if config is None:
+        config = await asyncio.to_thread(load_llm_config)
+    if candidates > 1:
+        patch_data, perf_entry, _ = await propose_speculative(error_log_path, config, candidates=candidates,
+                                                              use_cache=use_cache)
+        return patch_data, perf_entry
+    return await generate_proposal_async(
+        error_log_path, config, stream=stream, on_field=on_field, on_progress=on_progress, use_cache=use_cache
+    )
+
+
+async def refine(error_log_path: str, config: dict = None, output_path: str = None, max_retries: int = None,
+                 use_cache: bool = True, quiet: bool = True) -> dict:
+    """Propose, verify and refine until the patch passes or retries run out; returns the loop result."""
+    return await refine_loop(error_log_path, config, output_path=output_path, max_retries=max_retries,
+                             use_cache=use_cache, quiet=quiet)
+
+
+async def verify(patch_file_path: str, use_cache: bool = True) -> dict:
+    """Verify a patch file in an isolated worktree (or reuse an identical earlier run); returns the ATLAS_JSON_RESULT dict."""
+    return await verify_patch_async(patch_file_path, use_cache)
+
+
+async def apply(patch_content: str, commit_message: str, push: bool = False) -> dict:
+    """Apply and commit (optionally push) a verified patch; returns the ATLAS_JSON_RESULT dict."""
+    return await apply_patch_async(patch_content, commit_message, push)
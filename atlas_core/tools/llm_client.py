@@ -0,0 +1,549 @@
+"""
+Atlas LLM Client
+Pooled, keep-alive connection to the LLM endpoint shared by every propose call
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from pathlib import Path
+from urllib.parse import urlparse, urlunparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # Optional: the async API falls back to a worker thread
+    httpx = None
+
+if __package__ in (None, ''):
+    # Allow importing this module when the tools are run as plain scripts
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.stream_parser import IncrementalJSONParser, repair_json
+
+# Decoding the partial value costs time proportional to its length, so on_progress
+# is called at most this often rather than on every streamed delta
+PROGRESS_INTERVAL_SECONDS = 0.25
+
+SYSTEM_PROMPT = """You are Atlas, a CI/CD error diagnosis and patch generation expert.
+You MUST respond with valid JSON ONLY, no markdown formatting, no explanations outside the JSON.
+
+Required JSON schema:
+{
+  "confidence_score": 0.0-1.0,
+  "patch_diff": "unified diff format",
+  "explanation": "human-readable rationale",
+  "affected_files": ["list", "of", "files"],
+  "test_commands": ["command1", "command2"]
+}"""
+
+REQUIRED_KEYS = ['confidence_score', 'patch_diff', 'explanation', 'affected_files', 'test_commands']
+
+# JSON schema the server constrains decoding to; property order keeps confidence_score streaming first
+PATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "confidence_score": {"type": "number"},
+        "patch_diff": {"type": "string"},
+        "explanation": {"type": "string"},
+        "affected_files": {"type": "array", "items": {"type": "string"}},
+        "test_commands": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": REQUIRED_KEYS,
+    "additionalProperties": False
+}
+
+# Payload fields carrying the schema (Ollama native / OpenAI-compatible) and the statuses of a server rejecting them
+SCHEMA_FIELDS = ('format', 'response_format')
+SCHEMA_REJECTED_STATUS = (400, 422)
+
+# Bump when SYSTEM_PROMPT or the diagnostic prompt in generate_patch.py changes; part of the response cache key
+PROMPT_TEMPLATE_VERSION = 1
+
+class RequestCancelled(Exception):
+    """Raised when a streamed request is abandoned through its cancel_event."""
+
+
+def parse_patch_response(content: str):
+    """
+    Parse and validate a patch proposal from model output.
+
+    Output that is not plain JSON (fenced, wrapped in prose or truncated) goes through
+    repair_json(); a numeric string confidence_score and a bare string where a list is
+    expected are coerced. Returns (patch_data, parse_status) with parse_status "clean"
+    or "repaired"; raises ValueError if no valid proposal can be recovered.
+    """
+    if not content or not content.strip():
+        raise ValueError("Empty model response")
+    patch_data, repaired = repair_json(content)
+    if not isinstance(patch_data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(patch_data).__name__}")
+    missing = [key for key in REQUIRED_KEYS if key not in patch_data]
+    if missing:
+        raise ValueError(f"Missing required keys {missing}. Expected: {REQUIRED_KEYS}")
+
+    if isinstance(patch_data['confidence_score'], str):
+        try:
+            patch_data['confidence_score'] = float(patch_data['confidence_score'])
+        except ValueError:
+            raise ValueError(f"confidence_score is not a number: {patch_data['confidence_score']!r}")
+        repaired = True
+    for key in ('affected_files', 'test_commands'):
+        if isinstance(patch_data[key], str):
+            patch_data[key] = [patch_data[key]] if patch_data[key] else []
+            repaired = True
+    return patch_data, "repaired" if repaired else "clean"
+
+
+# A response whose model load took longer than this is counted as a cold load
+DEFAULT_COLD_LOAD_THRESHOLD_MS = 1000
+
+
+class LLMClient:
+    """
+    Reusable client for one LLM endpoint.
+
+    Holds a pooled requests.Session so consecutive proposals reuse the same TCP
+    connection, and passes Ollama's `keep_alive` so the model stays resident between
+    runs. Connection reuse and cold model loads are counted in `stats`.
+    """
+
+    def __init__(self, endpoint: dict):
+        self.endpoint = endpoint
+        self.url = endpoint['url']
+        self.model = endpoint['model']
+        self.timeout = endpoint.get('timeout_seconds', 300)
+        self.keep_alive = endpoint.get('keep_alive', '30m')
+        self.pin_model = endpoint.get('pin_model', True)
+        self.cold_load_threshold_ms = endpoint.get('cold_load_threshold_ms', DEFAULT_COLD_LOAD_THRESHOLD_MS)
+        self.structured_output = endpoint.get('structured_output', True)
+
+        parsed = urlparse(self.url)
+        self.base_url = urlunparse((parsed.scheme, parsed.netloc, '', '', '', ''))
+        self.is_openai_compatible = '/v1/' in parsed.path
+
+        pool_size = endpoint.get('connection_pool_size', 4)
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+        self.headers = {}
+        if endpoint.get('api_key_env') and os.environ.get(endpoint['api_key_env']):
+            self.headers['Authorization'] = f"Bearer {os.environ[endpoint['api_key_env']]}"
+        self.session.headers.update(self.headers)
+
+        self._lock = threading.Lock()
+        self._model_pinned = False
+        self._async_clients = weakref.WeakKeyDictionary()
+        self.stats = {"requests": 0, "connections_reused": 0, "cold_loads": 0, "schema_fallbacks": 0}
+
+    def build_messages(self, prompt: str) -> list:
+        """Wrap a user prompt with the shared Atlas system prompt."""
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    def build_payload(self, messages: list, stream: bool = False, model: str = None, options: dict = None) -> dict:
+        """
+        Build the chat payload for this endpoint.
+
+        `model` overrides the configured model for this request; `options` holds sampling
+        settings such as temperature and seed. With `structured_output` the response is
+        constrained to PATCH_SCHEMA.
+        """
+        payload = {
+            "model": model or self.model,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": self.keep_alive
+        }
+        if options:
+            if self.is_openai_compatible:
+                payload.update(options)
+            else:
+                payload['options'] = dict(options)
+        if stream and self.is_openai_compatible:
+            # Ask the OpenAI-compatible endpoint to include token usage in the final chunk
+            payload['stream_options'] = {"include_usage": True}
+        if self.structured_output:
+            if self.is_openai_compatible:
+                payload['response_format'] = {
+                    "type": "json_schema",
+                    "json_schema": {"name": "atlas_patch", "strict": True, "schema": PATCH_SCHEMA}
+                }
+            else:
+                payload['format'] = PATCH_SCHEMA
+        return payload
+
+    def _schema_rejected(self, response, payload: dict) -> bool:
+        """
+        True if the server refused the request's output schema; the schema is then
+        removed from `payload` so the caller can resend it unconstrained.
+        """
+        if response.status_code not in SCHEMA_REJECTED_STATUS or not any(f in payload for f in SCHEMA_FIELDS):
+            return False
+        for field in SCHEMA_FIELDS:
+            payload.pop(field, None)
+        return True
+
+    def _schema_unsupported(self):
+        """Stop asking for structured output once a request succeeded without it; repair parsing takes over."""
+        with self._lock:
+            if self.structured_output:
+                self.structured_output = False
+                self.stats['schema_fallbacks'] += 1
+
+    def ensure_model_loaded(self):
+        """
+        Pin the model on an Ollama server before the first request of this process.
+
+        The OpenAI-compatible route ignores `keep_alive`, so the model is loaded through
+        the native /api/generate route instead. Servers that are not Ollama are left alone.
+        """
+        if not self.pin_model or self._model_pinned:
+            return
+        with self._lock:
+            if self._model_pinned:
+                return
+            self._model_pinned = True
+            try:
+                response = self.session.get(f"{self.base_url}/api/ps", timeout=10)
+                if response.status_code != 200:
+                    return
+                models = response.json().get('models', [])
+                loaded = {m.get('name') for m in models} | {m.get('model') for m in models}
+                if self.model in loaded:
+                    return
+
+                response = self.session.post(
+                    f"{self.base_url}/api/generate",
+                    json={"model": self.model, "keep_alive": self.keep_alive},
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                self.stats['cold_loads'] += 1
+            except (requests.exceptions.RequestException, ValueError):
+                # Pinning is an optimisation; the chat request will surface real errors
+                return
+
+    def chat(self, messages: list, stream: bool = False, on_field=None, on_progress=None,
+             model: str = None, options: dict = None, cancel_event=None, first_token_event=None):
+        """
+        Send a chat request and return (content, raw_response, metrics).
+
+        raw_response is normalised to Ollama's native shape (message.content,
+        total_duration, prompt_eval_count, eval_count) whichever route is configured.
+        With stream=True, on_field(name, value) fires as each top-level JSON field
+        closes and on_progress(name, partial_text) while a field is being written (at
+        most every PROGRESS_INTERVAL_SECONDS).
+        Setting `cancel_event` (a threading.Event) closes a streamed request early,
+        which stops generation on the server, and raises RequestCancelled.
+        `first_token_event` is set when the first content token arrives (when the whole
+        response arrives without streaming).
+        """
+        self.ensure_model_loaded()
+
+        payload = self.build_payload(messages, stream=stream, model=model, options=options)
+        pool = self._adapter.poolmanager.connection_from_url(self.url)
+        connections_before = pool.num_connections
+        started = time.perf_counter()
+
+        structured = any(field in payload for field in SCHEMA_FIELDS)
+        response = self.session.post(self.url, json=payload, stream=stream, timeout=self.timeout)
+        if self._schema_rejected(response, payload):
+            response.close()
+            response = self.session.post(self.url, json=payload, stream=stream, timeout=self.timeout)
+            if response.ok:
+                self._schema_unsupported()
+            structured = False
+
+        if stream:
+            accumulator = _StreamAccumulator(started, on_field, on_progress)
+            with response:
+                response.raise_for_status()
+                reused = pool.num_connections == connections_before
+                for raw_line in response.iter_lines():
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise RequestCancelled(self.url)
+                    if not accumulator.add_line(raw_line.decode('utf-8')):
+                        break
+                    if first_token_event is not None and accumulator.time_to_first_token_ms is not None:
+                        first_token_event.set()
+            content, raw_response, ttft_ms = accumulator.result()
+        else:
+            response.raise_for_status()
+            reused = pool.num_connections == connections_before
+            if first_token_event is not None:
+                first_token_event.set()
+            raw_response = self._normalise(response.json(), started)
+            content = raw_response['message']['content']
+            ttft_ms = None
+
+        return content, raw_response, self._metrics(stream, raw_response, reused, ttft_ms, structured)
+
+    async def achat(self, messages: list, stream: bool = False, on_field=None, on_progress=None,
+                    model: str = None, options: dict = None, cancel_event=None, first_token_event=None):
+        """
+        Non-blocking chat(): same arguments and return value.
+
+        Uses a pooled httpx.AsyncClient per event loop when httpx is installed, and
+        otherwise runs the pooled synchronous session in a worker thread. Cancelling
+        the awaiting task closes the request in both cases (the thread path through
+        `cancel_event`, created here if not given).
+        """
+        if httpx is None:
+            cancel_event = cancel_event or threading.Event()
+            try:
+                return await asyncio.to_thread(
+                    self.chat, messages, stream, on_field, on_progress, model, options, cancel_event,
+                    first_token_event
+                )
+            except asyncio.CancelledError:
+                cancel_event.set()
+                raise
+
+        await asyncio.to_thread(self.ensure_model_loaded)
+        client = self._async_client()
+        payload = self.build_payload(messages, stream=stream, model=model, options=options)
+        structured = any(field in payload for field in SCHEMA_FIELDS)
+        started = time.perf_counter()
+
+        if stream:
+            accumulator = _StreamAccumulator(started, on_field, on_progress)
+            while True:
+                async with client.stream('POST', self.url, json=payload) as response:
+                    if self._schema_rejected(response, payload):
+                        structured = False
+                        continue
+                    response.raise_for_status()
+                    if not structured and self.structured_output:
+                        self._schema_unsupported()
+                    async for line in response.aiter_lines():
+                        if cancel_event is not None and cancel_event.is_set():
+                            raise RequestCancelled(self.url)
+                        if not accumulator.add_line(line):
+                            break
+                        if first_token_event is not None and accumulator.time_to_first_token_ms is not None:
+                            first_token_event.set()
+                break
+            content, raw_response, ttft_ms = accumulator.result()
+        else:
+            response = await client.post(self.url, json=payload)
+            if self._schema_rejected(response, payload):
+                structured = False
+                response = await client.post(self.url, json=payload)
+                if response.is_success:
+                    self._schema_unsupported()
+            response.raise_for_status()
+            if first_token_event is not None:
+                first_token_event.set()
+            raw_response = self._normalise(response.json(), started)
+            content = raw_response['message']['content']
+            ttft_ms = None
+
+        # httpx does not expose connection reuse, so it is reported as unknown
+        return content, raw_response, self._metrics(stream, raw_response, None, ttft_ms, structured)
+
+    def generate(self, prompt: str, context: list = None, system: str = SYSTEM_PROMPT, options: dict = None):
+        """
+        One non-streamed turn on Ollama's native /api/generate route.
+
+        Passing the `context` returned by the previous turn continues that conversation
+        from the server's cached state, so only the new `prompt` is sent and evaluated.
+        Returns (content, raw_response, metrics) like chat(); raw_response['context']
+        is the context for the next turn.
+        """
+        self.ensure_model_loaded()
+
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": self.keep_alive
+        }
+        if context:
+            payload['context'] = context
+        elif system:
+            payload['system'] = system
+        if options:
+            payload['options'] = dict(options)
+        if self.structured_output:
+            payload['format'] = PATCH_SCHEMA
+        structured = 'format' in payload
+
+        url = f"{self.base_url}/api/generate"
+        pool = self._adapter.poolmanager.connection_from_url(url)
+        connections_before = pool.num_connections
+        response = self.session.post(url, json=payload, timeout=self.timeout)
+        if self._schema_rejected(response, payload):
+            structured = False
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+            if response.ok:
+                self._schema_unsupported()
+        response.raise_for_status()
+        reused = pool.num_connections == connections_before
+
+        raw_response = response.json()
+        if 'response' not in raw_response:
+            raise ValueError(f"Unexpected LLM response format: {raw_response}")
+        content = raw_response['response']
+        raw_response['message'] = {"role": "assistant", "content": content}
+        return content, raw_response, self._metrics(False, raw_response, reused, None, structured)
+
+    def _async_client(self):
+        """One pooled httpx.AsyncClient per running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            limits = httpx.Limits(max_connections=self.endpoint.get('connection_pool_size', 4))
+            client = httpx.AsyncClient(timeout=self.timeout, limits=limits, headers=self.headers)
+            self._async_clients[loop] = client
+        return client
+
+    def _metrics(self, stream: bool, raw_response: dict, reused, ttft_ms, structured: bool = False) -> dict:
+        """Update the running counters and build the per-request metrics."""
+        load_ms = raw_response.get('load_duration', 0) / 1_000_000
+        cold_load = load_ms > self.cold_load_threshold_ms
+        with self._lock:
+            self.stats['requests'] += 1
+            if reused:
+                self.stats['connections_reused'] += 1
+            if cold_load:
+                self.stats['cold_loads'] += 1
+
+        metrics = {
+            "streamed": stream,
+            "connection_reused": reused,
+            "cold_load": cold_load,
+            "load_duration_ms": load_ms,
+            "client_requests": self.stats['requests'],
+            "client_connections_reused": self.stats['connections_reused'],
+            "client_cold_loads": self.stats['cold_loads'],
+            "structured_output": structured,
+            "client_schema_fallbacks": self.stats['schema_fallbacks']
+        }
+        if stream:
+            metrics["time_to_first_token_ms"] = ttft_ms
+        return metrics
+
+    def _normalise(self, result: dict, started: float) -> dict:
+        """Map an OpenAI-style completion onto Ollama's native response fields."""
+        if 'message' in result and 'content' in result['message']:
+            return result
+        if 'choices' in result and result['choices']:
+            usage = result.get('usage', {})
+            return {
+                "message": result['choices'][0].get('message', {"content": ""}),
+                "total_duration": int((time.perf_counter() - started) * 1_000_000_000),
+                "prompt_eval_count": usage.get('prompt_tokens', 0),
+                "eval_count": usage.get('completion_tokens', 0)
+            }
+        raise ValueError(f"Unexpected LLM response format: {result}")
+
+
+class _StreamAccumulator:
+    """Collects a streamed chat response line by line (Ollama NDJSON or OpenAI-style SSE)."""
+
+    def __init__(self, started: float, on_field=None, on_progress=None):
+        self.started = started
+        self.on_field = on_field
+        self.on_progress = on_progress
+        self.parser = IncrementalJSONParser()
+        self.pieces = []
+        self.raw_response = {}
+        self.time_to_first_token_ms = None
+        self._last_progress = 0.0
+
+    def add_line(self, line: str) -> bool:
+        """Consume one line of the stream; returns False once the stream signals completion."""
+        if not line:
+            return True
+        if line.startswith('data:'):
+            line = line[len('data:'):].strip()
+            if line == '[DONE]':
+                return False
+        chunk = json.loads(line)
+
+        if 'choices' in chunk:
+            # OpenAI-compatible chunk
+            choices = chunk.get('choices') or [{}]
+            delta = choices[0].get('delta', {}).get('content') or ''
+            usage = chunk.get('usage')
+            if usage:
+                self.raw_response['prompt_eval_count'] = usage.get('prompt_tokens', 0)
+                self.raw_response['eval_count'] = usage.get('completion_tokens', 0)
+        else:
+            # Ollama native chunk; the final one carries the timing metrics
+            delta = chunk.get('message', {}).get('content', '')
+            if chunk.get('done'):
+                self.raw_response.update({k: v for k, v in chunk.items() if k != 'message'})
+
+        if not delta:
+            return True
+        if self.time_to_first_token_ms is None:
+            self.time_to_first_token_ms = (time.perf_counter() - self.started) * 1000
+
+        self.pieces.append(delta)
+        for name, value in self.parser.feed(delta):
+            if self.on_field:
+                self.on_field(name, value)
+        if self.on_progress:
+            now = time.monotonic()
+            if now - self._last_progress >= PROGRESS_INTERVAL_SECONDS:
+                self._last_progress = now
+                name, partial = self.parser.in_progress()
+                if name:
+                    self.on_progress(name, partial)
+        return True
+
+    def result(self):
+        """Returns (content, raw_response, time_to_first_token_ms)."""
+        if not self.raw_response.get('total_duration'):
+            self.raw_response['total_duration'] = int((time.perf_counter() - self.started) * 1_000_000_000)
+        content = "".join(self.pieces)
+        self.raw_response['message'] = {"role": "assistant", "content": content}
+        return content, self.raw_response, self.time_to_first_token_ms
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(config: dict) -> LLMClient:
+    """
+    Return the process-wide client for the local endpoint, creating it on first use.
+
+    With `endpoint_pool` enabled this is an EndpointPool spreading requests over the
+    configured hosts, and with `hedging` enabled it is wrapped in a HedgedClient; both
+    offer the same methods as LLMClient.
+    """
+    endpoint = config['llm_endpoints']['local']
+    if not endpoint.get('enabled', True):
+        raise RuntimeError("Local LLM endpoint not enabled in config")
+
+    pool_config = config.get('endpoint_pool', {})
+    hedge_config = config.get('hedging', {})
+    use_pool = pool_config.get('enabled', False) and pool_config.get('hosts')
+    use_hedging = hedge_config.get('enabled', False)
+    key = (endpoint['url'], endpoint['model'], tuple(pool_config['hosts']) if use_pool else None,
+           hedge_config.get('secondary') if use_hedging else None)
+    with _clients_lock:
+        if key not in _clients:
+            # Imported here: endpoint_pool and hedging build on this module
+            if use_pool:
+                from atlas_core.tools.endpoint_pool import EndpointPool
+                client = EndpointPool(endpoint, pool_config)
+            else:
+                client = LLMClient(endpoint)
+            if use_hedging:
+                from atlas_core.tools.hedging import HedgedClient, secondary_endpoint
+                secondary, secondary_model = secondary_endpoint(config)
+                client = HedgedClient(client, LLMClient(secondary), hedge_config, secondary_model)
+            _clients[key] = client
+        return _clients[key]
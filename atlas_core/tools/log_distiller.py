@@ -0,0 +1,267 @@
+"""
+Atlas Log Distiller
+Shrinks CI error logs to the failing sections before they are sent to the LLM
+"""
+import argparse
+import io
+import json
+import re
+import sys
+from collections import deque
+from pathlib import Path
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/log_distiller.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.jsonl_log import read_jsonl
+
+# Rough characters-per-token ratio for code and log text
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 3000
+MAX_LINE_CHARS = 500
+
+# Line priorities: higher survives longer when the budget is tight
+PRIORITY_TAIL = 1
+PRIORITY_CONTEXT = 2
+PRIORITY_ERROR = 3
+
+_TIMESTAMP_PREFIX = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?Z\s?')
+_ANSI = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+_TRACEBACK_START = re.compile(r'^\s*Traceback \(most recent call last\):')
+_STEP_HEADER = re.compile(r'^(##\[group\]|::group::|={5,} .* ={5,}$|_{5,} .* _{5,}$|Step \d+/\d+|> Task :)')
+_ERROR_LINE = re.compile(
+    r'##\[error\]|::error|\b[Ee]rror(?:\[\w+\])?:|\berror [A-Z]+\d+:|\bFAIL(?:ED)?\b|\bERROR\b|Error\b|'
+    r'Exception\b|^E {2,}|npm ERR!|fatal:|exit code [1-9]|undefined reference|cannot find symbol|'
+    r'No such file or directory'
+)
+# Substrings every _ERROR_LINE match contains; a plain `in` check skips the regex on ordinary lines
+_ERROR_HINTS = ('rror', 'FAIL', 'ERR', 'xception', 'fatal', 'exit code', 'undefined reference',
+                'cannot find symbol', 'No such file')
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for budgeting before the model tokenizes the prompt."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def token_budget_for(model: str, config: dict) -> int:
+    """Token budget for the distilled log, per model with a default fallback."""
+    budgets = config.get('distillation', {}).get('token_budgets', {})
+    return budgets.get(model, budgets.get('default', DEFAULT_TOKEN_BUDGET))
+
+
+def _is_error_line(text: str) -> bool:
+    if text.startswith('E ') or any(hint in text for hint in _ERROR_HINTS):
+        return bool(_ERROR_LINE.search(text))
+    return False
+
+
+def _collapse_repeats(lines):
+    """
+    Run-length collapse consecutive identical lines, yielding (line_number, text, content, count).
+
+    `text` is the line without ANSI codes, as displayed; `content` also drops the runner's
+    timestamp prefix (`2024-05-01T12:00:00.1234567Z ` on GitHub Actions) and is what the
+    line is classified by, so indentation and line starts are those of the tool's output.
+    """
+    previous = None
+    previous_key = None
+    first_line_number = 0
+    count = 0
+    for line_number, line in enumerate(lines, start=1):
+        text = _ANSI.sub('', line.rstrip('\r\n'))
+        content = _TIMESTAMP_PREFIX.sub('', text)
+        key = content.strip()
+        if key == previous_key and previous is not None:
+            count += 1
+            continue
+        if previous is not None:
+            yield first_line_number, *previous, count
+        previous, previous_key, first_line_number, count = (text, content), key, line_number, 1
+    if previous is not None:
+        yield first_line_number, *previous, count
+
+
+def distill_log(log_path, token_budget: int = DEFAULT_TOKEN_BUDGET, context_lines: int = 3, tail_lines: int = 40):
+    """Stream a log file through distill_lines(); same return value."""
+    with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+        return distill_lines(f, token_budget, context_lines, tail_lines)
+
+
+def distill_text(text: str, token_budget: int = DEFAULT_TOKEN_BUDGET, context_lines: int = 3, tail_lines: int = 40):
+    """Distill captured command output already held in memory; same return value as distill_log()."""
+    return distill_lines(io.StringIO(text), token_budget, context_lines, tail_lines)
+
+
+def distill_lines(lines, token_budget: int = DEFAULT_TOKEN_BUDGET, context_lines: int = 3, tail_lines: int = 40):
+    """
+    Keep only the lines of a log (any iterable of lines) that explain the failure.
+
+    Keeps tracebacks, compiler/test error lines with `context_lines` of context, the
+    header of the step they occurred in, and the last `tail_lines` lines. Repeated
+    lines are collapsed. If the result exceeds `token_budget`, the lowest-priority and
+    then the oldest lines are dropped first, since the final error is usually the one
+    that failed the job.
+
+    Returns:
+        (distilled_text, report) where report holds raw and distilled sizes
+    """
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    selected = {}
+    selected_chars = 0
+    before = deque(maxlen=context_lines)
+    tail = deque(maxlen=tail_lines)
+    after_remaining = 0
+    in_traceback = False
+    step_header = None
+    raw_bytes = 0
+    raw_lines = 0
+
+    def keep(line_number, text, count, priority):
+        nonlocal selected_chars
+        if len(text) > MAX_LINE_CHARS:
+            text = text[:MAX_LINE_CHARS] + ' [...truncated]'
+        if count > 1:
+            text = f"{text}  [repeated {count} times]"
+        existing = selected.get(line_number)
+        if existing:
+            if existing[1] < priority:
+                selected[line_number] = (existing[0], priority, count)
+            return
+        selected[line_number] = (text, priority, count)
+        selected_chars += len(text) + 1
+        if selected_chars > budget_chars * 2:
+            _prune(budget_chars)
+
+    def _prune(target_chars):
+        # Bound memory on huge logs: drop lowest priority, then oldest, lines
+        nonlocal selected_chars
+        for line_number in sorted(selected, key=lambda n: (selected[n][1], n)):
+            if selected_chars <= target_chars:
+                break
+            selected_chars -= len(selected.pop(line_number)[0]) + 1
+
+    def counted_lines():
+        nonlocal raw_bytes, raw_lines
+        for line in lines:
+            raw_bytes += len(line.encode('utf-8'))
+            raw_lines += 1
+            yield line
+
+    for line_number, text, content, count in _collapse_repeats(counted_lines()):
+        tail.append((line_number, text, count))
+
+        if _STEP_HEADER.search(content):
+            step_header = (line_number, text, count)
+
+        if _TRACEBACK_START.search(content):
+            in_traceback = True
+
+        is_error = in_traceback or _is_error_line(content)
+        if is_error:
+            if step_header:
+                keep(*step_header, PRIORITY_CONTEXT)
+            for context in before:
+                keep(*context, PRIORITY_CONTEXT)
+            before.clear()
+            keep(line_number, text, count, PRIORITY_ERROR)
+            after_remaining = context_lines
+        elif after_remaining > 0:
+            keep(line_number, text, count, PRIORITY_CONTEXT)
+            after_remaining -= 1
+        else:
+            before.append((line_number, text, count))
+
+        # A traceback ends at the first unindented line after its frames (the exception)
+        if in_traceback and content.strip() and not content[:1].isspace() \
+                and not _TRACEBACK_START.search(content) and not content.startswith('During handling'):
+            in_traceback = False
+
+    for line_number, text, count in tail:
+        keep(line_number, text, count, PRIORITY_TAIL)
+    _prune(budget_chars)
+
+    output = []
+    previous_line_number = 0
+    for line_number in sorted(selected):
+        text, _, count = selected[line_number]
+        if line_number > previous_line_number + 1:
+            output.append(f"[... {line_number - previous_line_number - 1} lines omitted ...]")
+        output.append(text)
+        previous_line_number = line_number + count - 1
+    if raw_lines > previous_line_number:
+        output.append(f"[... {raw_lines - previous_line_number} lines omitted ...]")
+
+    distilled = "\n".join(output)
+    report = {
+        "raw_bytes": raw_bytes,
+        "raw_lines": raw_lines,
+        "raw_tokens_est": raw_bytes // CHARS_PER_TOKEN,
+        "distilled_bytes": len(distilled.encode('utf-8')),
+        "distilled_tokens_est": estimate_tokens(distilled),
+        "token_budget": token_budget
+    }
+    return distilled, report
+
+
+def prompt_eval_rate(model: str, perf_log_path, window: int = 50):
+    """Recent prompt-eval throughput (tokens/s) for `model` from performance.jsonl, or None."""
+    tokens = duration_ms = 0
+    samples = [e for e in read_jsonl(perf_log_path) if e.get('model') == model and e.get('prompt_eval_ms')][-window:]
+    for entry in samples:
+        tokens += entry.get('prompt_tokens', 0)
+        duration_ms += entry['prompt_eval_ms']
+    return tokens / (duration_ms / 1000) if duration_ms else None
+
+
+def read_error_context(log_path, model: str, config: dict, perf_log_path=None):
+    """
+    Load an error log for prompting, distilled unless disabled in config.
+
+    Returns:
+        (error_logs, report) where report is None when distillation is disabled
+    """
+    distill_config = config.get('distillation', {})
+    if not distill_config.get('enabled', False):
+        with open(log_path, 'r') as f:
+            return f.read(), None
+
+    token_budget = token_budget_for(model, config)
+    raw_bytes = Path(log_path).stat().st_size
+    if raw_bytes // CHARS_PER_TOKEN <= token_budget:
+        # Small logs go through verbatim; nothing to gain from distilling them
+        with open(log_path, 'r') as f:
+            distilled = f.read()
+        report = {
+            "raw_bytes": raw_bytes,
+            "raw_tokens_est": raw_bytes // CHARS_PER_TOKEN,
+            "distilled_bytes": raw_bytes,
+            "distilled_tokens_est": raw_bytes // CHARS_PER_TOKEN,
+            "token_budget": token_budget
+        }
+    else:
+        distilled, report = distill_log(
+            log_path,
+            token_budget=token_budget,
+            context_lines=distill_config.get('context_lines', 3),
+            tail_lines=distill_config.get('tail_lines', 40)
+        )
+
+    report['prompt_eval_ms_saved_est'] = None
+    rate = prompt_eval_rate(model, perf_log_path) if perf_log_path else None
+    if rate:
+        saved_tokens = report['raw_tokens_est'] - report['distilled_tokens_est']
+        report['prompt_eval_ms_saved_est'] = saved_tokens / rate * 1000
+    return distilled, report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Log Distiller")
+    parser.add_argument("--log-file", required=True, help="Path to the error log file.")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET, help="Token budget for the distilled log.")
+    parser.add_argument("--report", action="store_true", help="Print the size report instead of the distilled log.")
+    args = parser.parse_args()
+
+    text, size_report = distill_log(Path(args.log_file), token_budget=args.token_budget)
+    print(json.dumps(size_report, indent=2) if args.report else text)
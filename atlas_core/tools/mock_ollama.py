@@ -0,0 +1,618 @@
+"""
+Atlas Mock Ollama Server
+Stand-in LLM server that replays recorded responses with configurable latency, token rate and failures
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/mock_ollama.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.disk_cache import hash_key
+from atlas_core.tools.llm_client import _StreamAccumulator
+from atlas_core.tools.log_distiller import CHARS_PER_TOKEN, estimate_tokens
+
+FAILURE_MODES = ('error', 'disconnect', 'hang', 'invalid_json')
+
+# Returned when no recording matches: a well-formed proposal so the pipeline runs end to end
+CANNED_RESPONSE = json.dumps({
+    "confidence_score": 0.75,
+    "patch_diff": "",
+    "explanation": "Mock response: no recording matched this request.",
+    "affected_files": [],
+    "test_commands": []
+})
+
+
+def request_messages(route: str, body: dict) -> list:
+    """The conversation a request carries, in chat-message form for every route."""
+    if route == '/api/generate':
+        messages = []
+        if body.get('system'):
+            messages.append({"role": "system", "content": body['system']})
+        messages.append({"role": "user", "content": body.get('prompt', '')})
+        return messages
+    return body.get('messages', [])
+
+
+def request_key(route: str, body: dict) -> str:
+    """Replay key for a request: its conversation, independent of model, route and sampling options."""
+    messages = request_messages(route, body)
+    return hash_key(*(f"{m.get('role')}:{m.get('content')}" for m in messages), bool(body.get('context')))
+
+
+def load_recordings(path) -> dict:
+    """{key: [recorded response, ...]} from a recordings JSONL file."""
+    recordings = {}
+    if not path:
+        return recordings
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recordings.setdefault(entry['key'], []).append(entry['response'])
+    return recordings
+
+
+def _chunked(wfile, data: bytes):
+    wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+    wfile.flush()
+
+
+class MockOllamaServer:
+    """
+    In-process HTTP server speaking the Ollama (/api/chat, /api/generate, /api/tags,
+    /api/ps, /api/pull) and OpenAI-compatible (/v1/chat/completions, /v1/models)
+    shapes that Atlas uses, streamed or not.
+
+    Responses are replayed from recordings by conversation; unmatched requests fall
+    back to the recordings in order, then to a canned proposal. With timing="fixed"
+    each response waits `latency_ms` (plus prompt evaluation at
+    `prompt_tokens_per_second`) and then emits tokens at `tokens_per_second`; with
+    timing="recorded" the recorded durations are reproduced. `failure_rate` of
+    requests fail with one of `failure_modes`, drawn from a seeded generator so runs
+    are repeatable.
+    """
+
+    def __init__(self, recordings_path=None, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 0,
+                 tokens_per_second: float = None, prompt_tokens_per_second: float = None, timing: str = 'fixed',
+                 cold_load_ms: float = 0, failure_rate: float = 0.0, failure_modes=FAILURE_MODES,
+                 hang_seconds: float = 600, models=None, seed: int = None):
+        self.recordings = load_recordings(recordings_path)
+        self._fallback = [response for responses in self.recordings.values() for response in responses]
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.timing = timing
+        self.cold_load_ms = cold_load_ms
+        self.failure_rate = failure_rate
+        self.failure_modes = tuple(failure_modes)
+        self.hang_seconds = hang_seconds
+        self.models = list(models or [])
+        # Unknown models get a 404 only when the model list was given explicitly
+        self.strict_models = bool(models)
+        self.loaded = set()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_fallback = 0
+        self._server = None
+        self.stats = {"requests": 0, "replayed": 0, "fallback": 0, "canned": 0, "failures": 0,
+                      "simulated_ms": 0.0, "by_route": {}}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        """Start serving on a background thread; port 0 picks a free port."""
+        handler = type('MockHandler', (_MockHandler,), {"mock": self})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, route: str, outcome: str = None):
+        """Count a request on `route`, or one of its outcomes (replayed, fallback, canned, failures)."""
+        with self._lock:
+            if outcome is None:
+                self.stats['requests'] += 1
+                self.stats['by_route'][route] = self.stats['by_route'].get(route, 0) + 1
+            else:
+                self.stats[outcome] += 1
+
+    def pick_failure(self):
+        """The failure mode to inject for this request, or None."""
+        with self._lock:
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                return self._random.choice(self.failure_modes)
+        return None
+
+    def respond(self, route: str, body: dict) -> dict:
+        """Choose the response for a request and the timing to play it back with."""
+        recorded = self.recordings.get(request_key(route, body))
+        with self._lock:
+            if recorded:
+                outcome, response = 'replayed', recorded[0]
+            elif self._fallback:
+                outcome, response = 'fallback', self._fallback[self._next_fallback % len(self._fallback)]
+                self._next_fallback += 1
+            else:
+                outcome, response = 'canned', {"content": CANNED_RESPONSE}
+            model = body.get('model', '')
+            cold = model not in self.loaded
+            self.loaded.add(model)
+
+        content = response['content']
+        pieces = [content[i:i + CHARS_PER_TOKEN] for i in range(0, len(content), CHARS_PER_TOKEN)] or ['']
+        prompt_tokens = response.get('prompt_eval_count') or sum(
+            estimate_tokens(m.get('content') or '') for m in request_messages(route, body)
+        )
+        eval_count = response.get('eval_count') or len(pieces)
+
+        if self.timing == 'recorded' and response.get('eval_duration'):
+            prompt_ms = response.get('prompt_eval_duration', 0) / 1_000_000
+            token_interval = response['eval_duration'] / 1_000_000_000 / len(pieces)
+        else:
+            prompt_ms = self.latency_ms
+            if self.prompt_tokens_per_second:
+                prompt_ms += prompt_tokens / self.prompt_tokens_per_second * 1000
+            token_interval = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        load_ms = self.cold_load_ms if cold else 0
+
+        return {
+            "outcome": outcome,
+            "model": model,
+            "content": content,
+            "pieces": pieces,
+            "load_ms": load_ms,
+            "prompt_ms": prompt_ms,
+            "token_interval": token_interval,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": eval_count
+        }
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """Request handler bound to a MockOllamaServer through the `mock` class attribute."""
+
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (timeout) or cancelled (speculative candidates)
+            pass
+
+    def _send_json(self, data: dict, status: int = 200):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _model_list(self):
+        return sorted(self.mock.models or self.mock.loaded or {'mock'})
+
+    def do_GET(self):
+        self.mock.count(self.path)
+        if self.path == '/api/tags':
+            self._send_json({"models": [{"name": m, "model": m, "size": 0, "digest": "mock", "details": {}}
+                                        for m in self._model_list()]})
+        elif self.path == '/api/ps':
+            self._send_json({"models": [{"name": m, "model": m} for m in sorted(self.mock.loaded) if m]})
+        elif self.path == '/v1/models':
+            self._send_json({"object": "list", "data": [{"id": m, "object": "model"} for m in self._model_list()]})
+        else:
+            self._send_json({"error": f"unknown route {self.path}"}, 404)
+
+    def do_POST(self):
+        route = self.path
+        self.mock.count(route)
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+        if route == '/api/pull':
+            return self._pull(body)
+        if route not in ('/api/chat', '/api/generate', '/v1/chat/completions'):
+            return self._send_json({"error": f"unknown route {route}"}, 404)
+        model = body.get('model', '')
+        if self.mock.strict_models and model not in self.mock.models:
+            return self._send_json({"error": f"model '{model}' not found, try pulling it first"}, 404)
+        if route == '/api/generate' and not body.get('prompt'):
+            # Load/keep-alive request
+            with self.mock._lock:
+                cold = model not in self.mock.loaded
+                self.mock.loaded.add(model)
+            load_ms = self.mock.cold_load_ms if cold else 0
+            time.sleep(load_ms / 1000)
+            return self._send_json({"model": model, "response": "", "done": True,
+                                    "load_duration": int(load_ms * 1_000_000)})
+
+        failure = self.mock.pick_failure()
+        if failure:
+            self.mock.count(route, 'failures')
+        if failure == 'error':
+            return self._send_json({"error": "mock: injected server error"}, 500)
+        if failure == 'hang':
+            time.sleep(self.mock.hang_seconds)
+        if failure == 'disconnect' and not body.get('stream', route != '/v1/chat/completions'):
+            self.close_connection = True
+            return
+
+        plan = self.mock.respond(route, body)
+        self.mock.count(route, plan['outcome'])
+        if failure == 'invalid_json':
+            plan['content'] = plan['content'][:len(plan['content']) // 2]
+            plan['pieces'] = plan['pieces'][:len(plan['pieces']) // 2] or ['']
+
+        # Ollama streams by default; the OpenAI route does not
+        stream = body.get('stream', route != '/v1/chat/completions')
+        started = time.perf_counter()
+        time.sleep((plan['load_ms'] + plan['prompt_ms']) / 1000)
+        if stream:
+            self._stream(route, body, plan, started, cut_short=failure == 'disconnect')
+        else:
+            time.sleep(plan['token_interval'] * len(plan['pieces']))
+            self._send_json(self._final(route, plan, started, include_content=True))
+        with self.mock._lock:
+            self.mock.stats['simulated_ms'] += (time.perf_counter() - started) * 1000
+
+    def _timings(self, plan: dict, started: float) -> dict:
+        total_ns = int((time.perf_counter() - started) * 1_000_000_000)
+        load_ns = int(plan['load_ms'] * 1_000_000)
+        prompt_ns = int(plan['prompt_ms'] * 1_000_000)
+        return {
+            "total_duration": total_ns,
+            "load_duration": load_ns,
+            "prompt_eval_count": plan['prompt_eval_count'],
+            "prompt_eval_duration": prompt_ns,
+            "eval_count": plan['eval_count'],
+            "eval_duration": max(total_ns - load_ns - prompt_ns, 0)
+        }
+
+    def _final(self, route: str, plan: dict, started: float, include_content: bool) -> dict:
+        """The closing object of a response (the whole response when not streaming)."""
+        content = plan['content'] if include_content else ''
+        created = datetime.now().isoformat()
+        if route == '/v1/chat/completions':
+            response = {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": plan['model'],
+                "usage": {"prompt_tokens": plan['prompt_eval_count'], "completion_tokens": plan['eval_count'],
+                          "total_tokens": plan['prompt_eval_count'] + plan['eval_count']}
+            }
+            if include_content:
+                response["choices"] = [{"index": 0, "message": {"role": "assistant", "content": content},
+                                        "finish_reason": "stop"}]
+            else:
+                response.update(object="chat.completion.chunk", choices=[])
+            return response
+
+        response = dict(self._timings(plan, started), model=plan['model'], created_at=created,
+                        done=True, done_reason="stop")
+        if route == '/api/generate':
+            response["response"] = content
+            # Opaque context tokens: enough for callers that send them back on the next turn
+            response["context"] = list(range(plan['prompt_eval_count'] + plan['eval_count']))
+        else:
+            response["message"] = {"role": "assistant", "content": content}
+        return response
+
+    def _stream(self, route: str, body: dict, plan: dict, started: float, cut_short: bool = False):
+        openai = route == '/v1/chat/completions'
+        self._start_stream('text/event-stream' if openai else 'application/x-ndjson')
+        pieces = plan['pieces'][:len(plan['pieces']) // 2] if cut_short else plan['pieces']
+        for piece in pieces:
+            time.sleep(plan['token_interval'])
+            if openai:
+                chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "model": plan['model'],
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                line = f"data: {json.dumps(chunk)}\n\n"
+            elif route == '/api/generate':
+                line = json.dumps({"model": plan['model'], "response": piece, "done": False}) + "\n"
+            else:
+                line = json.dumps({"model": plan['model'], "message": {"role": "assistant", "content": piece},
+                                   "done": False}) + "\n"
+            _chunked(self.wfile, line.encode('utf-8'))
+        if cut_short:
+            self.close_connection = True
+            return
+
+        if openai:
+            if body.get('stream_options', {}).get('include_usage'):
+                usage_chunk = self._final(route, plan, started, include_content=False)
+                _chunked(self.wfile, f"data: {json.dumps(usage_chunk)}\n\n".encode('utf-8'))
+            _chunked(self.wfile, b"data: [DONE]\n\n")
+        else:
+            _chunked(self.wfile, (json.dumps(self._final(route, plan, started, include_content=False)) + "\n")
+                     .encode('utf-8'))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _pull(self, body: dict):
+        model = body.get('model') or body.get('name', '')
+        with self.mock._lock:
+            if model not in self.mock.models:
+                self.mock.models.append(model)
+        if not body.get('stream', True):
+            return self._send_json({"status": "success"})
+        self._start_stream('application/x-ndjson')
+        for status in ({"status": "pulling manifest"},
+                       {"status": "pulling mock", "digest": "sha256:mock", "total": 1, "completed": 1},
+                       {"status": "verifying sha256 digest"}, {"status": "writing manifest"},
+                       {"status": "success"}):
+            _chunked(self.wfile, (json.dumps(status) + "\n").encode('utf-8'))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class RecordingProxy:
+    """
+    Forwards requests to a real server and appends each chat/generate exchange to a
+    recordings JSONL file that MockOllamaServer can replay.
+    """
+
+    def __init__(self, upstream: str, recordings_path, host: str = '127.0.0.1', port: int = 0):
+        self.upstream = upstream.rstrip('/')
+        self.recordings_path = Path(recordings_path)
+        self.host = host
+        self.port = port
+        self.session = requests.Session()
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        handler = type('RecordingHandler', (_RecordingHandler,), {"proxy": self})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def record(self, route: str, body: dict, raw_response: dict, content: str):
+        entry = {
+            "key": request_key(route, body),
+            "route": route,
+            "model": body.get('model'),
+            "prompt_preview": (request_messages(route, body)[-1].get('content') or '')[:200],
+            "recorded_at": datetime.now().isoformat(),
+            "response": {
+                "content": content,
+                **{field: raw_response.get(field) for field in (
+                    'prompt_eval_count', 'eval_count', 'prompt_eval_duration', 'eval_duration',
+                    'load_duration', 'total_duration') if raw_response.get(field) is not None}
+            }
+        }
+        with self._lock:
+            self.recordings_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.recordings_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+            self.recorded += 1
+
+
+class _RecordingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    proxy = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        upstream = self.proxy.session.get(self.proxy.upstream + self.path, timeout=30)
+        self._relay_whole(upstream)
+
+    def _relay_whole(self, upstream):
+        self.send_response(upstream.status_code)
+        self.send_header('Content-Type', upstream.headers.get('Content-Type', 'application/json'))
+        self.send_header('Content-Length', str(len(upstream.content)))
+        self.end_headers()
+        self.wfile.write(upstream.content)
+
+    def do_POST(self):
+        route = self.path
+        raw_body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.loads(raw_body or b'{}')
+        upstream = self.proxy.session.post(self.proxy.upstream + route, data=raw_body, stream=True, timeout=None,
+                                           headers={'Content-Type': 'application/json'})
+        recordable = route in ('/api/chat', '/api/generate', '/v1/chat/completions') and upstream.ok \
+            and (route != '/api/generate' or body.get('prompt'))
+        stream = body.get('stream', route != '/v1/chat/completions')
+        if not stream or not recordable:
+            self._relay_whole(upstream)
+            if recordable:
+                result = upstream.json()
+                if 'choices' in result:
+                    usage = result.get('usage', {})
+                    result = {"message": result['choices'][0]['message'],
+                              "prompt_eval_count": usage.get('prompt_tokens'),
+                              "eval_count": usage.get('completion_tokens')}
+                content = result.get('response', result.get('message', {}).get('content', ''))
+                self.proxy.record(route, body, result, content)
+            return
+
+        self.send_response(upstream.status_code)
+        self.send_header('Content-Type', upstream.headers.get('Content-Type', 'application/x-ndjson'))
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        accumulator = _StreamAccumulator(time.perf_counter())
+        generated = []
+        final = {}
+        for raw_line in upstream.iter_lines():
+            _chunked(self.wfile, raw_line + b"\n")
+            line = raw_line.decode('utf-8')
+            if route == '/api/generate' and line:
+                chunk = json.loads(line)
+                generated.append(chunk.get('response', ''))
+                if chunk.get('done'):
+                    final = chunk
+            else:
+                accumulator.add_line(line)
+        self.wfile.write(b"0\r\n\r\n")
+
+        if route == '/api/generate':
+            self.proxy.record(route, body, final, "".join(generated))
+        else:
+            content, raw_response, _ = accumulator.result()
+            self.proxy.record(route, body, raw_response, content)
+
+
+def bench(log_file: str, runs: int = 10, recordings_path=None, stream: bool = False, **server_options) -> dict:
+    """
+    Time `runs` proposals for `log_file` against an in-process mock server.
+
+    Atlas overhead is each proposal's wall time minus the time the server spent
+    producing its response. Proposals are logged under the model "mock/<model>" so
+    they never feed the model router, and the response cache and router are off.
+    """
+    from atlas_core.tools.generate_patch import generate_proposal, load_llm_config
+    from atlas_core.tools.model_router import with_model
+
+    config = load_llm_config()
+    endpoint = config['llm_endpoints']['local']
+    route = '/v1/chat/completions' if '/v1/' in endpoint['url'] else '/api/chat'
+
+    with MockOllamaServer(recordings_path, **server_options) as server:
+        config = with_model(config, f"mock/{endpoint['model']}")
+        config['llm_endpoints']['local'].update(url=f"{server.base_url}{route}", pin_model=False)
+        config['router'] = dict(config.get('router', {}), enabled=False)
+        config['endpoint_pool'] = dict(config.get('endpoint_pool', {}), enabled=False)
+        config['hedging'] = dict(config.get('hedging', {}), enabled=False)
+
+        walls, overheads = [], []
+        for _ in range(runs):
+            simulated_before = server.stats['simulated_ms']
+            started = time.perf_counter()
+            generate_proposal(log_file, config, stream=stream, use_cache=False)
+            wall_ms = (time.perf_counter() - started) * 1000
+            walls.append(wall_ms)
+            overheads.append(wall_ms - (server.stats['simulated_ms'] - simulated_before))
+        stats = dict(server.stats)
+
+    def percentile(values, fraction):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "runs": runs,
+        "route": route,
+        "stream": stream,
+        "wall_ms_p50": statistics.median(walls),
+        "wall_ms_p95": percentile(walls, 0.95),
+        "overhead_ms_p50": statistics.median(overheads),
+        "overhead_ms_p95": percentile(overheads, 0.95),
+        "server": stats
+    }
+
+
+def _server_options(args) -> dict:
+    return {
+        "latency_ms": args.latency_ms,
+        "tokens_per_second": args.tokens_per_second,
+        "prompt_tokens_per_second": args.prompt_tokens_per_second,
+        "timing": args.timing,
+        "cold_load_ms": args.cold_load_ms,
+        "failure_rate": args.failure_rate,
+        "failure_modes": args.failure_modes.split(','),
+        "seed": args.seed
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Mock Ollama Server")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='Serve recorded (or canned) responses')
+    record_parser = subparsers.add_parser('record', help='Proxy a real server and record its responses')
+    bench_parser = subparsers.add_parser('bench', help='Measure Atlas overhead against an in-process mock')
+
+    for sub in (serve_parser, bench_parser):
+        sub.add_argument('--recordings', help='Recordings JSONL to replay.')
+        sub.add_argument('--latency-ms', type=float, default=0, help='Delay before the first token.')
+        sub.add_argument('--tokens-per-second', type=float, help='Generation rate (default: instant).')
+        sub.add_argument('--prompt-tokens-per-second', type=float, help='Add prompt evaluation time at this rate.')
+        sub.add_argument('--timing', choices=['fixed', 'recorded'], default='fixed',
+                         help='Use the options above, or reproduce recorded durations.')
+        sub.add_argument('--cold-load-ms', type=float, default=0, help='Load time for the first request per model.')
+        sub.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests that fail.')
+        sub.add_argument('--failure-modes', default=','.join(FAILURE_MODES), help='Comma-separated failure modes.')
+        sub.add_argument('--seed', type=int, help='Seed for failure injection.')
+    for sub in (serve_parser, record_parser):
+        sub.add_argument('--host', default='127.0.0.1')
+        sub.add_argument('--port', type=int, default=11435)
+    serve_parser.add_argument('--models', help='Comma-separated models to report; others get 404.')
+    record_parser.add_argument('--upstream', default='http://127.0.0.1:11434', help='Real server to forward to.')
+    record_parser.add_argument('--recordings', required=True, help='Recordings JSONL to append to.')
+    bench_parser.add_argument('--log-file', required=True, help='Error log to propose for.')
+    bench_parser.add_argument('--runs', type=int, default=10)
+    bench_parser.add_argument('--stream', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        print(json.dumps(bench(args.log_file, args.runs, args.recordings, args.stream, **_server_options(args)),
+                         indent=2))
+        sys.exit(0)
+
+    if args.command == 'serve':
+        service = MockOllamaServer(args.recordings, host=args.host, port=args.port,
+                                   models=args.models.split(',') if args.models else None, **_server_options(args))
+        print(f"🧪 Mock Ollama serving {len(service._fallback)} recordings on http://{args.host}:{args.port}")
+    else:
+        service = RecordingProxy(args.upstream, args.recordings, host=args.host, port=args.port)
+        print(f"⏺️  Recording {args.upstream} → {args.recordings} via http://{args.host}:{args.port}")
+    service.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        service.stop()
@@ -0,0 +1,222 @@
+"""
+Atlas Model Router
+Picks the model for each request from historical latency, confidence and verification results
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+from pathlib import Path
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/model_router.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.jsonl_log import read_jsonl
+
+LOG_DIR = Path(__file__).parent.parent / 'logs'
+
+DEFAULT_LATENCY_SLO_MS = {0: 30000, 2000: 90000, 6000: 240000}
+DEFAULT_MIN_QUALITY = 0.6
+DEFAULT_MIN_SAMPLES = 3
+DEFAULT_WINDOW = 200
+DEFAULT_EXPLORE_RATE = 0.1
+
+# Pseudo-count pulling a model's pass rate towards its mean confidence while it has little history
+QUALITY_PRIOR_WEIGHT = 2
+
+def slo_for(prompt_tokens: int, router_config: dict):
+    """Returns (tier, slo_ms): the tier is the highest threshold not above the prompt size."""
+    tiers = router_config.get('latency_slo_ms') or DEFAULT_LATENCY_SLO_MS
+    tier = max((int(threshold) for threshold in tiers if int(threshold) <= prompt_tokens), default=0)
+    slo_ms = {int(threshold): value for threshold, value in tiers.items()}.get(tier)
+    return tier, slo_ms
+
+
+def candidate_models(config: dict) -> list:
+    """The models the router may choose from, configured model first."""
+    router_config = config.get('router', {})
+    models = list(router_config.get('models') or [])
+    if not models:
+        models = [config['llm_endpoints']['local']['model']]
+        models += config.get('hardware', {}).get('primary_gpu', {}).get('recommended_models', [])
+    return list(dict.fromkeys(models))
+
+
+def model_stats(config: dict, log_dir=LOG_DIR) -> dict:
+    """
+    Per-model history from performance.jsonl and iterations.jsonl.
+
+    Cache hits are ignored since they say nothing about the model's speed. Each
+    tier's confidence and first-try verification results are kept separately so a
+    model that does well on short logs but not on long ones is judged per size.
+    `parse_repair_rate` and `parse_failure_rate` cover every answer of the model,
+    refine turns included.
+    """
+    router_config = config.get('router', {})
+    window = router_config.get('window', DEFAULT_WINDOW)
+    tiers = router_config.get('latency_slo_ms') or DEFAULT_LATENCY_SLO_MS
+
+    per_model = {}
+    parses = {}
+    for entry in read_jsonl(Path(log_dir) / 'performance.jsonl'):
+        if entry.get('parse_status') and entry.get('cache') != 'hit' and entry.get('hedge_winner') != 'secondary':
+            parses.setdefault(entry.get('model'), []).append(entry['parse_status'])
+        if entry.get('cache') == 'hit' or not entry.get('model') or not entry.get('response_time_ms'):
+            continue
+        if entry.get('refine_iteration'):
+            continue  # follow-up turns carry only the delta prompt
+        if entry.get('hedge_winner') == 'secondary':
+            continue  # answered by the hedge endpoint, not this model's server
+        per_model.setdefault(entry['model'], {"perf": [], "verified": []})["perf"].append(entry)
+    for entry in read_jsonl(Path(log_dir) / 'iterations.jsonl'):
+        if entry.get('event') == 'refine' and entry.get('iteration') == 0 and entry.get('model'):
+            per_model.setdefault(entry['model'], {"perf": [], "verified": []})["verified"].append(entry)
+
+    stats = {}
+    for model, history in per_model.items():
+        perf = history['perf'][-window:]
+        verified = history['verified'][-window:]
+        prompt_tokens = sum(e.get('prompt_tokens', 0) for e in perf if e.get('prompt_eval_ms'))
+        prompt_eval_ms = sum(e['prompt_eval_ms'] for e in perf if e.get('prompt_eval_ms'))
+        rates = [e['tokens_per_second'] for e in perf if e.get('tokens_per_second')]
+
+        by_tier = {}
+        for entry in perf + verified:
+            tier, _ = slo_for(entry.get('prompt_tokens', 0), {"latency_slo_ms": tiers})
+            bucket = by_tier.setdefault(tier, {"confidence": [], "passes": 0, "verified": 0})
+            if entry.get('event') == 'refine':
+                bucket['verified'] += 1
+                bucket['passes'] += entry.get('verification_status') == 'pass'
+            elif isinstance(entry.get('confidence_score'), (int, float)):
+                bucket['confidence'].append(entry['confidence_score'])
+
+        parsed = parses.get(model, [])[-window:]
+        stats[model] = {
+            "samples": len(perf),
+            "prompt_eval_tokens_per_second": prompt_tokens / (prompt_eval_ms / 1000) if prompt_eval_ms else None,
+            "tokens_per_second": statistics.median(rates) if rates else None,
+            "median_response_tokens": statistics.median(e.get('response_tokens', 0) for e in perf) if perf else 0,
+            "median_response_time_ms": statistics.median(e['response_time_ms'] for e in perf) if perf else None,
+            "parse_repair_rate": parsed.count('repaired') / len(parsed) if parsed else None,
+            "parse_failure_rate": parsed.count('failed') / len(parsed) if parsed else None,
+            "tiers": by_tier
+        }
+    return stats
+
+
+def predicted_latency_ms(stats: dict, prompt_tokens: int):
+    """Prompt evaluation plus typical generation time for a prompt of this size, or None."""
+    if stats['tokens_per_second'] and stats['prompt_eval_tokens_per_second']:
+        return (prompt_tokens / stats['prompt_eval_tokens_per_second']
+                + stats['median_response_tokens'] / stats['tokens_per_second']) * 1000
+    # Endpoints that do not report prompt-eval time: fall back to the observed wall time
+    return stats['median_response_time_ms']
+
+
+def quality(stats: dict, tier: int):
+    """
+    Verification pass rate in this size tier, smoothed towards mean confidence.
+
+    Falls back to the model's figures across all tiers when the tier has no data.
+    Returns (score, basis) or (None, None) without any data.
+    """
+    buckets = [stats['tiers'][tier]] if tier in stats['tiers'] else list(stats['tiers'].values())
+    confidence = [c for bucket in buckets for c in bucket['confidence']]
+    passes = sum(bucket['passes'] for bucket in buckets)
+    verified = sum(bucket['verified'] for bucket in buckets)
+    prior = statistics.mean(confidence) if confidence else None
+    if verified:
+        prior = 0.5 if prior is None else prior
+        return (passes + prior * QUALITY_PRIOR_WEIGHT) / (verified + QUALITY_PRIOR_WEIGHT), "pass_rate"
+    if prior is not None:
+        return prior, "confidence"
+    return None, None
+
+
+def route_model(config: dict, prompt_tokens: int, log_dir=LOG_DIR) -> dict:
+    """
+    Choose the model for a prompt of `prompt_tokens` estimated tokens.
+
+    The fastest model predicted to meet the prompt size's latency SLO with quality at
+    least `router.min_quality` wins, so short logs go to fast models and only long
+    or hard ones reach slower, stronger models. If no model qualifies, the best
+    quality model within the SLO is used; if none meets the SLO, the fastest one.
+    Models with fewer than `router.min_samples` proposals are skipped; without any
+    usable history the configured model is kept. So that they ever get that history,
+    a `router.explore_rate` share of requests goes to the other candidate with the
+    fewest proposals while any is short of `min_samples`; exploration stops once all have them.
+
+    Returns:
+        dict with model, reason, tier, slo_ms, predicted_ms and quality
+    """
+    router_config = config.get('router', {})
+    min_quality = router_config.get('min_quality', DEFAULT_MIN_QUALITY)
+    min_samples = router_config.get('min_samples', DEFAULT_MIN_SAMPLES)
+    tier, slo_ms = slo_for(prompt_tokens, router_config)
+    default_model = config['llm_endpoints']['local']['model']
+    decision = {"tier": tier, "slo_ms": slo_ms, "prompt_tokens_est": prompt_tokens}
+
+    history = model_stats(config, log_dir)
+    samples = {model: history[model]['samples'] if model in history else 0 for model in candidate_models(config)}
+    # The configured model needs no exploring: it is the fallback while history is short
+    untried = [model for model, count in samples.items() if count < min_samples and model != default_model]
+    if untried and random.random() < router_config.get('explore_rate', DEFAULT_EXPLORE_RATE):
+        model = min(untried, key=samples.get)
+        return dict(decision, model=model, predicted_ms=None, quality=None, explore=True,
+                    reason=f"exploring: {model} has {samples[model]} of {min_samples} proposals of history")
+
+    options = []
+    for model in candidate_models(config):
+        stats = history.get(model)
+        if not stats or stats['samples'] < min_samples:
+            continue
+        latency = predicted_latency_ms(stats, prompt_tokens)
+        if latency is None:
+            continue
+        score, basis = quality(stats, tier)
+        options.append({"model": model, "predicted_ms": latency, "quality": score, "quality_basis": basis})
+
+    if not options:
+        return dict(decision, model=default_model, predicted_ms=None, quality=None,
+                    reason=f"no model has {min_samples}+ proposals of history; using configured model")
+
+    options.sort(key=lambda option: option['predicted_ms'])
+    within_slo = [o for o in options if slo_ms is None or o['predicted_ms'] <= slo_ms]
+    good = [o for o in within_slo if o['quality'] is not None and o['quality'] >= min_quality]
+    slo_text = f"{slo_ms / 1000:.0f}s SLO" if slo_ms else "no SLO"
+    if good:
+        chosen = good[0]
+        reason = (f"fastest model within the {slo_text} for ~{prompt_tokens} tokens "
+                  f"with {chosen['quality_basis']} {chosen['quality']:.2f} >= {min_quality}")
+    elif within_slo:
+        chosen = max(within_slo, key=lambda o: o['quality'] or 0)
+        reason = (f"no model reaches quality {min_quality} within the {slo_text}; "
+                  f"best available {chosen['quality_basis']} {chosen['quality'] or 0:.2f}")
+    else:
+        chosen = options[0]
+        reason = f"no model is predicted to meet the {slo_text} for ~{prompt_tokens} tokens; fastest"
+
+    return dict(decision, model=chosen['model'], predicted_ms=chosen['predicted_ms'], quality=chosen['quality'],
+                reason=reason, alternatives=[o['model'] for o in options if o is not chosen])
+
+
+def with_model(config: dict, model: str) -> dict:
+    """A copy of `config` whose local endpoint uses `model`."""
+    endpoints = dict(config['llm_endpoints'])
+    endpoints['local'] = dict(endpoints['local'], model=model)
+    return dict(config, llm_endpoints=endpoints)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Model Router")
+    parser.add_argument("--prompt-tokens", type=int, default=1000, help="Estimated prompt size to route.")
+    args = parser.parse_args()
+
+    from atlas_core.tools.generate_patch import load_llm_config
+
+    llm_config = load_llm_config()
+    for name, model_history in model_stats(llm_config).items():
+        print(f"📈 {name}: {json.dumps({k: v for k, v in model_history.items() if k != 'tiers'})}")
+    print(f"🧭 {json.dumps(route_model(llm_config, args.prompt_tokens))}")
@@ -0,0 +1,121 @@
+"""
+Atlas Output Capture
+Bounded in-memory capture of command output, with the full stream spilled to disk
+"""
+import argparse
+import gzip
+import sys
+import time
+from pathlib import Path
+
+OUTPUT_DIR = Path(__file__).parent.parent / 'cache' / 'output'
+
+CHUNK_SIZE = 64 * 1024
+HEAD_BYTES = 64 * 1024
+TAIL_BYTES = 256 * 1024
+KEEP_FILES = 50
+
+
+def _prune(directory: Path, keep: int):
+    """Delete all but the `keep` newest spill files."""
+    files = sorted(directory.glob('*.log.gz'), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in files[keep:]:
+        path.unlink(missing_ok=True)
+
+
+class OutputCapture:
+    """
+    The head and tail of a byte stream, with everything in between kept on disk only.
+
+    Output up to `head_bytes + tail_bytes` stays in memory as-is. Past that, the
+    whole stream (from byte 0) is written to a gzip file under atlas_core/cache/output
+    and memory holds only the first `head_bytes` and a ring of the last `tail_bytes`.
+    text() joins the two around a marker naming the omitted size and the file;
+    read() pages through the full stream by byte offset.
+    """
+
+    def __init__(self, name: str = 'output', head_bytes: int = HEAD_BYTES, tail_bytes: int = TAIL_BYTES,
+                 output_dir=OUTPUT_DIR):
+        self.name = name
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.output_dir = Path(output_dir)
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self.spill_path = None
+        self._spill = None
+
+    def write(self, data: bytes):
+        self.total_bytes += len(data)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data:
+            return
+        if self._spill:
+            self._spill.write(data)
+        self.tail += data
+        if len(self.tail) > self.tail_bytes:
+            if not self._spill:
+                self._open_spill()
+            if len(self.tail) > 2 * self.tail_bytes:
+                del self.tail[:-self.tail_bytes]  # trimmed in batches, so each byte is moved about once
+
+    def _open_spill(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        slug = ''.join(c if c.isalnum() or c in '-_' else '-' for c in self.name)[:40]
+        self.spill_path = self.output_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{id(self):x}-{slug}.log.gz"
+        self._spill = gzip.open(self.spill_path, 'wb', compresslevel=1)
+        self._spill.write(bytes(self.head))
+        self._spill.write(bytes(self.tail))
+        _prune(self.output_dir, KEEP_FILES)
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_bytes > len(self.head) + min(len(self.tail), self.tail_bytes)
+
+    def text(self) -> str:
+        """The captured output, with the middle replaced by a marker once it outgrew memory."""
+        if not self.truncated:
+            return (bytes(self.head) + bytes(self.tail)).decode('utf-8', errors='replace')
+        tail = bytes(self.tail[-self.tail_bytes:])
+        omitted = self.total_bytes - len(self.head) - len(tail)
+        marker = f"\n... [{omitted:,} bytes omitted; full output: {self.spill_path}] ...\n"
+        return bytes(self.head).decode('utf-8', errors='replace') + marker + tail.decode('utf-8', errors='replace')
+
+    def read(self, offset: int, size: int = CHUNK_SIZE) -> bytes:
+        """`size` bytes of the full stream starting at `offset`."""
+        if self.spill_path is None:
+            return (bytes(self.head) + bytes(self.tail))[offset:offset + size]
+        if self._spill:
+            self._spill.flush()
+        return read_log(self.spill_path, offset, size)
+
+    def summary(self) -> dict:
+        """log_bytes and log_file for a result step, when the output outgrew memory."""
+        if self.spill_path is None:
+            return {}
+        return {"log_bytes": self.total_bytes, "log_file": str(self.spill_path)}
+
+    def close(self):
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+
+
+def read_log(path, offset: int, size: int = CHUNK_SIZE) -> bytes:
+    """Page through a spilled output file by offset into the uncompressed stream."""
+    with gzip.open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Output Capture")
+    parser.add_argument("log_file", help="A spilled .log.gz output file.")
+    parser.add_argument("--offset", type=int, default=0, help="Byte offset into the full output.")
+    parser.add_argument("--size", type=int, default=CHUNK_SIZE, help="Bytes to print.")
+    args = parser.parse_args()
+    sys.stdout.write(read_log(args.log_file, args.offset, args.size).decode('utf-8', errors='replace'))
@@ -0,0 +1,288 @@
+"""
+Atlas Patch Normalizer
+Relocates the hunks of a model diff against the base files and rewrites it as a clean patch
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/patch_normalizer.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.patch_precheck import parse_unified_diff, read_base_files
+
+DEFAULT_FUZZ = 2
+DEFAULT_FILE_MODE = '100644'
+
+
+def _loose(line: str) -> str:
+    """A line with whitespace differences (indentation, tabs, trailing blanks, CR) removed."""
+    return ' '.join(line.split())
+
+
+def _trimmed(lines: list, fuzz: int):
+    """
+    Versions of a hunk body with up to `fuzz` leading and trailing context lines
+    dropped, least trimmed first: yields (lines, leading, trailing).
+    """
+    leading_context = next((i for i, line in enumerate(lines) if line[0] != ' '), len(lines))
+    trailing_context = next((i for i, line in enumerate(reversed(lines)) if line[0] != ' '), len(lines))
+    for total in range(fuzz * 2 + 1):
+        for leading in range(min(total, fuzz, leading_context) + 1):
+            trailing = total - leading
+            if trailing > min(fuzz, trailing_context) or leading + trailing > len(lines):
+                continue
+            body = lines[leading:len(lines) - trailing]
+            if any(line[0] != '+' for line in body) or not any(line[0] != '+' for line in lines):
+                yield body, leading, trailing
+
+
+def _locate(base: list, old_block: list, expected: int, earliest: int, loose: bool):
+    """Start index of the match for `old_block` nearest to `expected` at or after `earliest`; None if none."""
+    if loose:
+        base = [_loose(line) for line in base]
+        old_block = [_loose(line) for line in old_block]
+    last = len(base) - len(old_block)
+    if last < earliest:
+        return None
+    expected = min(max(expected, earliest), last)
+    for distance in range(max(expected - earliest, last - expected) + 1):
+        for start in (expected - distance, expected + distance):
+            if earliest <= start <= last and base[start:start + len(old_block)] == old_block:
+                return start
+    return None
+
+
+def place_hunk(base: list, hunk: dict, expected: int, earliest: int, fuzz: int, final_newline: bool = True):
+    """
+    Find where `hunk` belongs in `base`: an exact match first, then one ignoring
+    whitespace, then the same with 1..fuzz edge context lines dropped, each time the
+    match nearest to `expected` that does not overlap an earlier hunk.
+
+    Returns (start, body, adjustment) or None; body is the hunk's (tag, text, no_newline)
+    lines with context and removed lines taken from the base file (`final_newline`
+    False marks its last line), and adjustment records `offset`, `fuzz` and `whitespace`.
+    """
+    lines = [(tag, text, index in hunk['no_newline']) for index, (tag, text) in enumerate(hunk['lines'])]
+    for body, leading, trailing in _trimmed(lines, fuzz):
+        old_block = [text for tag, text, _ in body if tag != '+']
+        if not old_block:
+            # Pure insertion: nothing to match, so trust the header
+            start = min(max(expected, earliest), len(base))
+            return start, body, {"offset": start - expected, "fuzz": 0, "whitespace": False}
+        for loose in (False, True):
+            start = _locate(base, old_block, expected + leading, earliest, loose)
+            if start is None:
+                continue
+            # Take context and removed lines verbatim from the base so the result applies exactly
+            line_ending = '\r' if all(line.endswith('\r') for line in base[start:start + len(old_block)]) else ''
+            rebuilt, cursor = [], start
+            for tag, text, no_newline in body:
+                if tag == '+':
+                    if line_ending and not text.endswith('\r'):
+                        text += line_ending
+                    rebuilt.append((tag, text, no_newline))
+                else:
+                    rebuilt.append((tag, base[cursor], not final_newline and cursor == len(base) - 1))
+                    cursor += 1
+            return start, rebuilt, {"offset": start - (expected + leading), "fuzz": max(leading, trailing),
+                                    "whitespace": loose}
+    return None
+
+
+def _resolve_path(path, base_files: dict, raw_paths: dict):
+    """
+    The repo path a header names. Headers written without the a/ b/ prefixes lose their
+    first directory to -p1 stripping; the full path is used when only that one exists.
+    """
+    if path is None or base_files.get(path) is not None:
+        return path
+    raw = raw_paths.get(path)
+    if raw and base_files.get(raw) is not None:
+        return raw
+    return path
+
+
+def _raw_header_paths(text: str) -> dict:
+    """Maps each -p1-stripped ---/+++ path to the path as written, for headers without prefixes."""
+    paths = {}
+    for line in text.split('\n'):
+        if line.startswith(('--- ', '+++ ')):
+            written = line[4:].split('\t')[0].strip()
+            if '/' in written and not written.startswith(('a/', 'b/')):
+                paths[written.split('/', 1)[1]] = written
+    return paths
+
+
+def _hunk_header(start: int, body: list, delta: int, section: str) -> str:
+    """The @@ line for a hunk placed at base index `start`, `delta` lines after earlier hunks' changes."""
+    old_count = sum(1 for tag, _, _ in body if tag != '+')
+    new_count = sum(1 for tag, _, _ in body if tag != '-')
+    # Unified diff numbering: an empty side names the line before it
+    old_start = start + 1 if old_count else start
+    new_start = start + delta + 1 if new_count else start + delta
+    return f"@@ -{old_start},{old_count} +{new_start},{new_count} @@{section}"
+
+
+def _emit_file(old_path, new_path, mode, hunks: list) -> list:
+    """Diff lines for one file: canonical git headers followed by the rebuilt hunks."""
+    path = new_path or old_path
+    out = [f"diff --git a/{old_path or path} b/{path}"]
+    if old_path is None:
+        out.append(f"new file mode {mode or DEFAULT_FILE_MODE}")
+    elif new_path is None:
+        out.append(f"deleted file mode {mode or DEFAULT_FILE_MODE}")
+    out.append(f"--- a/{old_path}" if old_path else "--- /dev/null")
+    out.append(f"+++ b/{new_path}" if new_path else "+++ /dev/null")
+
+    for start, body, section, delta in hunks:
+        out.append(_hunk_header(start, body, delta, section))
+        for tag, text, no_newline in body:
+            out.append(tag + text)
+            if no_newline:
+                out.append("\\ No newline at end of file")
+    return out
+
+
+def normalize_patch(patch_text: str, repo_path, rev: str = 'HEAD', fuzz: int = DEFAULT_FUZZ) -> dict:
+    """
+    Rewrite a model diff so that `git apply` takes it.
+
+    Hunks are placed by their content rather than their `@@` numbers (exact, then
+    whitespace-insensitive, then with up to `fuzz` edge context lines dropped), headers
+    and line counts are recomputed, context and removed lines are copied from the base
+    file, and prefix-less paths are resolved. Renamed and binary file sections are passed
+    through unchanged.
+
+    Returns:
+        dict with ok, changed, `patch` (the clean diff; the original when nothing needed
+        fixing or a hunk cannot be placed), `adjustments` per hunk, `paths` resolved,
+        `errors` and duration_ms
+    """
+    started = time.perf_counter()
+    files = parse_unified_diff(patch_text)
+    raw_lines = patch_text.split('\n')
+    raw_paths = _raw_header_paths(patch_text)
+    wanted = [f[key] for f in files for key in ('old_path', 'new_path') if f[key]]
+    base_files = read_base_files(repo_path, wanted + [raw_paths[p] for p in wanted if p in raw_paths], rev)
+
+    out = []
+    adjustments = []
+    renamed = []
+    errors = []
+    if not files:
+        errors.append({"file": None, "hunk": None, "reason": "no file changes found in the diff"})
+    for position, file_patch in enumerate(files):
+        if file_patch['binary'] or (file_patch['old_path'] and file_patch['new_path']
+                                    and file_patch['old_path'] != file_patch['new_path']):
+            end = files[position + 1]['line'] - 1 if position + 1 < len(files) else len(raw_lines)
+            section = raw_lines[file_patch['line'] - 1:end]
+            while section and not section[-1]:
+                section.pop()
+            out.extend(section)
+            continue
+
+        old_path = _resolve_path(file_patch['old_path'], base_files, raw_paths)
+        if old_path != file_patch['old_path']:
+            renamed.append({"file": old_path, "written": file_patch['old_path']})
+        new_path = old_path if file_patch['new_path'] == file_patch['old_path'] else file_patch['new_path']
+        final_newline = True
+        if old_path is None:
+            base = []
+        elif base_files.get(old_path) is None:
+            errors.append({"file": old_path, "hunk": None, "reason": f"{old_path} does not exist at {rev}"})
+            continue
+        else:
+            base = base_files[old_path].split('\n')
+            final_newline = base[-1] == ''
+            if final_newline:
+                base.pop()
+
+        placed = []
+        earliest = shift = delta = 0
+        for index, hunk in enumerate(file_patch['hunks'], start=1):
+            if 'corrupt' in hunk:
+                errors.append({"file": old_path or new_path, "hunk": index, "reason": hunk['corrupt']})
+                continue
+            header_start = hunk['old_start'] - (1 if hunk['old_count'] else 0)
+            expected = header_start + shift
+            result = place_hunk(base, hunk, expected, earliest, fuzz, final_newline)
+            if result is None:
+                errors.append({"file": old_path or new_path, "hunk": index, "header": hunk['header'],
+                               "reason": f"no match for the hunk's context within fuzz {fuzz}"})
+                continue
+            start, body, adjustment = result
+            section = hunk['header'].split('@@', 2)[2] if hunk['header'].count('@@') >= 2 else ''
+            placed.append((start, body, section, delta))
+            new_header = _hunk_header(start, body, delta, section)
+            shift += adjustment['offset']
+            adjustment['offset'] += expected - header_start  # reported against the header's own numbers
+            earliest = start + sum(1 for tag, _, _ in body if tag != '+')
+            delta += sum(1 for tag, _, _ in body if tag == '+') - sum(1 for tag, _, _ in body if tag == '-')
+            if adjustment['offset'] or adjustment['fuzz'] or adjustment['whitespace'] or new_header != hunk['header']:
+                adjustments.append(dict(adjustment, file=old_path or new_path, hunk=index, header=hunk['header'],
+                                        new_header=new_header))
+        if placed:
+            out.extend(_emit_file(old_path, new_path, file_patch['mode'], placed))
+
+    ok = not errors
+    changed = ok and bool(adjustments or renamed)
+    return {
+        "ok": ok,
+        "changed": changed,
+        "patch": "\n".join(out) + "\n" if changed else patch_text,
+        "adjustments": adjustments,
+        "paths": renamed,
+        "errors": errors,
+        "duration_ms": (time.perf_counter() - started) * 1000
+    }
+
+
+def format_adjustments(report: dict) -> str:
+    """One line per relocated or repaired hunk, plus any hunk that could not be placed."""
+    if not report['ok']:
+        lines = [f"Normalization failed: {len(report['errors'])} problem(s)"]
+        for problem in report['errors']:
+            where = problem['file'] or "patch"
+            if problem['hunk']:
+                where += f" hunk {problem['hunk']}"
+            lines.append(f"{where}: {problem['reason']}")
+        return "\n".join(lines) + "\n"
+    if not report['changed']:
+        return "Patch already clean\n"
+    lines = [f"Normalized patch: {len(report['adjustments'])} hunk(s) adjusted"]
+    for fixed in report['paths']:
+        lines.append(f"{fixed['file']}: header path {fixed['written']} resolved without the a/ b/ prefix")
+    for adjustment in report['adjustments']:
+        notes = []
+        if adjustment['offset']:
+            notes.append(f"moved {adjustment['offset']:+d} lines")
+        if adjustment['whitespace']:
+            notes.append("whitespace differences")
+        if adjustment['fuzz']:
+            notes.append(f"fuzz {adjustment['fuzz']}")
+        if not notes:
+            notes.append("line counts recomputed")
+        lines.append(f"{adjustment['file']} hunk {adjustment['hunk']}: {', '.join(notes)} "
+                     f"({adjustment['header']} → {adjustment['new_header']})")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Patch Normalizer")
+    parser.add_argument("--patch-file", required=True, help="Path to the patch diff file to normalize.")
+    parser.add_argument("--repo", default=str(Path(__file__).resolve().parents[2]), help="Repository holding the base files.")
+    parser.add_argument("--rev", default="HEAD", help="Revision holding the base files (default: HEAD).")
+    parser.add_argument("--fuzz", type=int, default=DEFAULT_FUZZ, help="Edge context lines that may be ignored.")
+    parser.add_argument("--output", help="Write the normalized patch here instead of stdout.")
+    args = parser.parse_args()
+
+    normalized = normalize_patch(Path(args.patch_file).read_text(), args.repo, args.rev, args.fuzz)
+    print(format_adjustments(normalized), end='', file=sys.stderr)
+    if args.output:
+        Path(args.output).write_text(normalized['patch'])
+    else:
+        print(normalized['patch'], end='')
+    sys.exit(0 if normalized['ok'] else 1)
@@ -0,0 +1,314 @@
+"""
+Atlas Patch Pre-check
+Checks a unified diff against the base blobs in-process, before any worktree is created
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$')
+NULL_PATH = '/dev/null'
+
+
+def _strip_path(raw: str):
+    """The repo path of a ---/+++ header, as `git apply` (-p1) resolves it; None for /dev/null."""
+    path = raw.split('\t')[0].strip()
+    if path.startswith('"') and path.endswith('"'):
+        path = json.loads(path)
+    if path == NULL_PATH:
+        return None
+    return path.split('/', 1)[1] if '/' in path else path
+
+
+def parse_unified_diff(text: str) -> list:
+    """
+    Split a unified diff into per-file patches.
+
+    Each entry has old_path / new_path (None for an added or deleted file), `binary`,
+    the `mode` of an added or deleted file, its first `line` in the diff, and `hunks`:
+    the header and its line in the diff, the old and new ranges, `lines` as (tag, text)
+    pairs with tag ' ', '-' or '+', and `no_newline`, the indexes of lines followed by
+    "\\ No newline at end of file". Counts that disagree with the header are left for
+    check_patch() to report.
+    """
+    files = []
+    current = None
+    hunk = None
+    lines = text.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+
+    for number, line in enumerate(lines, start=1):
+        next_line = lines[number] if number < len(lines) else ''
+        if hunk is not None:
+            # Model diffs often miscount their hunks, so the next file is found by its headers
+            file_header = line.startswith('--- ') and next_line.startswith('+++ ') and (
+                hunk['remaining'] <= 0 or (number + 1 < len(lines) and lines[number + 1].startswith('@@')))
+            if line[:1] in (' ', '-', '+') and not file_header:
+                hunk['lines'].append((line[0], line[1:]))
+                if line[0] != '+':
+                    hunk['remaining'] -= 1
+                continue
+            if line == '' and (hunk['remaining'] > 0 or (
+                    next_line[:1] in (' ', '-', '+') and not next_line.startswith(('--- ', '+++ ')))):
+                # Editors and models often strip the space off blank context lines
+                hunk['lines'].append((' ', ''))
+                hunk['remaining'] -= 1
+                continue
+        if line.startswith('\\'):
+            # "\ No newline at end of file" applies to the line before it
+            if hunk is not None and hunk['lines']:
+                hunk['no_newline'].append(len(hunk['lines']) - 1)
+            continue
+
+        hunk = None
+        if line.startswith('diff --git '):
+            current = {"old_path": None, "new_path": None, "binary": False, "mode": None, "hunks": [], "line": number}
+            files.append(current)
+        elif line.startswith('--- '):
+            if current is None or current['hunks'] or current.get('headers'):
+                current = {"old_path": None, "new_path": None, "binary": False, "mode": None, "hunks": [], "line": number}
+                files.append(current)
+            current['old_path'] = _strip_path(line[4:])
+            current['headers'] = True
+        elif line.startswith('+++ ') and current is not None:
+            current['new_path'] = _strip_path(line[4:])
+        elif line.startswith('rename from ') and current is not None:
+            current['old_path'] = line[len('rename from '):]
+        elif line.startswith('rename to ') and current is not None:
+            current['new_path'] = line[len('rename to '):]
+        elif line.startswith(('new file mode ', 'deleted file mode ')) and current is not None:
+            current['mode'] = line.rsplit(' ', 1)[1]
+        elif line.startswith(('GIT binary patch', 'Binary files ')) and current is not None:
+            current['binary'] = True
+        elif line.startswith('@@') and current is not None:
+            match = HUNK_HEADER.match(line)
+            if not match:
+                current['hunks'].append({"header": line, "line": number, "corrupt": "unreadable hunk header"})
+                continue
+            old_start, old_count, new_start, new_count, _ = match.groups()
+            old_count = 1 if old_count is None else int(old_count)
+            hunk = {
+                "header": line, "line": number, "old_start": int(old_start), "old_count": old_count,
+                "new_start": int(new_start), "new_count": 1 if new_count is None else int(new_count),
+                "lines": [], "no_newline": [], "remaining": old_count
+            }
+            current['hunks'].append(hunk)
+
+    for file_patch in files:
+        file_patch.pop('headers', None)
+        for parsed in file_patch['hunks']:
+            parsed.pop('remaining', None)
+    return files
+
+
+def read_base_files(repo_path, paths, rev: str = 'HEAD') -> dict:
+    """
+    Contents of `paths` at `rev` through one `git cat-file --batch` process.
+
+    Returns {path: text}, with None for paths that do not exist at `rev`.
+    """
+    paths = list(dict.fromkeys(paths))
+    if not paths:
+        return {}
+    process = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=repo_path,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    writer = threading.Thread(
+        target=lambda: (process.stdin.write(''.join(f"{rev}:{p}\n" for p in paths).encode()), process.stdin.close())
+    )
+    writer.start()
+    contents = {}
+    try:
+        for path in paths:
+            header = process.stdout.readline().split()
+            if len(header) < 3 or header[1] != b'blob':
+                contents[path] = None
+                continue
+            data = process.stdout.read(int(header[2]))
+            process.stdout.read(1)  # trailing newline
+            contents[path] = data.decode('utf-8', errors='surrogateescape')
+    finally:
+        writer.join()
+        process.stdout.close()
+        process.wait()
+    return contents
+
+
+def _find_block(base: list, block: list, expected: int):
+    """Index where `block` matches `base`, searching outwards from `expected`; None if nowhere."""
+    if not block:
+        return min(max(expected, 0), len(base))
+    last = len(base) - len(block)
+    for distance in range(max(expected, last - expected) + 1):
+        for start in (expected - distance, expected + distance):
+            if 0 <= start <= last and base[start:start + len(block)] == block:
+                return start
+    return None
+
+
+def _first_mismatch(base: list, block: list, start: int):
+    """(line number, expected, found) of the first line of `block` that differs from `base` at `start`."""
+    for offset, expected in enumerate(block):
+        index = start + offset
+        found = base[index] if 0 <= index < len(base) else None
+        if found != expected:
+            return index + 1, expected, found
+    return None, None, None
+
+
+def check_patch(patch_text: str, repo_path, rev: str = 'HEAD') -> dict:
+    """
+    Check that every hunk of `patch_text` applies to the files at `rev`.
+
+    Mirrors `git apply --check` without a worktree: the old side of each hunk (context
+    and removed lines) must appear in the base file, at the header's position or
+    shifted like git's offset search; hunk line counts must match their headers; added
+    files must not exist yet and modified or deleted ones must. Binary patches are
+    left to git.
+
+    Returns:
+        dict with ok, files, hunks, duration_ms and `errors`, each naming the file,
+        the hunk (1-based) and its header, the line and what was expected and found
+    """
+    started = time.perf_counter()
+    files = parse_unified_diff(patch_text)
+    errors = []
+    offsets = []
+
+    def error(file_patch, reason, hunk=None, index=None, **details):
+        errors.append(dict({
+            "file": file_patch['old_path'] or file_patch['new_path'],
+            "hunk": index,
+            "header": hunk['header'] if hunk else None,
+            "reason": reason
+        }, **details))
+
+    if not files or not any(f['hunks'] or f['binary'] or f['old_path'] != f['new_path'] for f in files):
+        errors.append({"file": None, "hunk": None, "header": None, "reason": "no file changes found in the diff"})
+    base_files = read_base_files(repo_path, [f['old_path'] for f in files if f['old_path']], rev)
+    new_files = read_base_files(repo_path, [f['new_path'] for f in files
+                                            if f['new_path'] and f['new_path'] != f['old_path']], rev)
+
+    for file_patch in files:
+        old_path, new_path = file_patch['old_path'], file_patch['new_path']
+        if file_patch['binary']:
+            continue
+        errors_before = len(errors)
+        if old_path is None:
+            if new_files.get(new_path) is not None:
+                error(file_patch, f"{new_path} already exists at {rev}")
+            base = []
+        else:
+            text = base_files.get(old_path)
+            if text is None:
+                error(file_patch, f"{old_path} does not exist at {rev}")
+                continue
+            if new_path and new_path != old_path and new_files.get(new_path) is not None:
+                error(file_patch, f"rename target {new_path} already exists at {rev}")
+            base = text.split('\n')
+            if base and base[-1] == '':
+                base.pop()
+
+        shift = 0
+        for index, hunk in enumerate(file_patch['hunks'], start=1):
+            if 'corrupt' in hunk:
+                error(file_patch, hunk['corrupt'], hunk, index, line=None)
+                continue
+            old_block = [text for tag, text in hunk['lines'] if tag != '+']
+            new_lines = sum(1 for tag, _ in hunk['lines'] if tag != '-')
+            if len(old_block) != hunk['old_count'] or new_lines != hunk['new_count']:
+                error(file_patch, f"corrupt hunk: header expects {hunk['old_count']} old / {hunk['new_count']} new "
+                      f"lines, body has {len(old_block)} / {new_lines}", hunk, index, line=None)
+                continue
+            # An empty old side (added file, or insertion) is positioned after line old_start
+            expected = hunk['old_start'] - (1 if hunk['old_count'] else 0) + shift
+            start = _find_block(base, old_block, expected)
+            if start is None:
+                line, expected_text, found = _first_mismatch(base, old_block, expected)
+                error(file_patch, "hunk does not match the base file", hunk, index,
+                      line=line, expected=expected_text, found=found)
+                continue
+            if start != expected:
+                offsets.append({"file": old_path, "hunk": index, "offset": start - expected})
+                shift += start - expected
+        if old_path is not None and new_path is None and len(errors) == errors_before:
+            removed = sum(1 for hunk in file_patch['hunks'] for tag, _ in hunk['lines'] if tag == '-')
+            if removed != len(base):
+                error(file_patch, f"deletion removes {removed} of {len(base)} lines")
+
+    return {
+        "ok": not errors,
+        "files": len(files),
+        "hunks": sum(len(f['hunks']) for f in files),
+        "offsets": offsets,
+        "errors": errors,
+        "duration_ms": (time.perf_counter() - started) * 1000
+    }
+
+
+def git_check_cached(patch_text: str, repo_path, rev: str = 'HEAD'):
+    """
+    `git apply --check --cached` against a throwaway index holding `rev`; the working
+    tree and the real index are not touched. Returns (applies, git output).
+    """
+    with tempfile.TemporaryDirectory(prefix='atlas-precheck-') as temp_dir:
+        env = dict(os.environ, GIT_INDEX_FILE=str(Path(temp_dir) / 'index'))
+        read = subprocess.run(['git', 'read-tree', rev], cwd=repo_path, env=env, capture_output=True, text=True)
+        if read.returncode != 0:
+            return False, read.stderr
+        patch = patch_text if patch_text.endswith('\n') else patch_text + '\n'
+        result = subprocess.run(['git', 'apply', '--check', '--cached'], cwd=repo_path, env=env,
+                                input=patch, capture_output=True, text=True)
+        return result.returncode == 0, result.stdout + result.stderr
+
+
+def precheck_patch(patch_text: str, repo_path, rev: str = 'HEAD') -> dict:
+    """
+    check_patch(), with a rejection confirmed by git_check_cached() so an unusual diff
+    the in-process check misjudges is never turned away. `confirmed` records whether
+    git agreed with a rejection; its output is added as `git_output`.
+    """
+    started = time.perf_counter()
+    report = check_patch(patch_text, repo_path, rev)
+    if not report['ok']:
+        applies, output = git_check_cached(patch_text, repo_path, rev)
+        report.update(ok=applies, confirmed=not applies, git_output=output,
+                      duration_ms=(time.perf_counter() - started) * 1000)
+    return report
+
+
+def format_report(report: dict) -> str:
+    """Human-readable summary of check_patch(), one line per mismatch (also fed back to the model when refining)."""
+    if report['ok']:
+        shifted = f", {len(report['offsets'])} hunk(s) offset" if report['offsets'] else ""
+        overruled = " (git apply --check accepted it)" if report['errors'] else ""
+        return f"Pre-check passed: {report['files']} file(s), {report['hunks']} hunk(s){shifted}{overruled}\n"
+    lines = [f"Pre-check failed: {len(report['errors'])} problem(s) in {report['files']} file(s)"]
+    for problem in report['errors']:
+        where = problem['file'] or "patch"
+        if problem['hunk']:
+            where += f" hunk {problem['hunk']} ({problem['header']})"
+        lines.append(f"{where}: {problem['reason']}")
+        if problem.get('line'):
+            lines.append(f"  line {problem['line']}: expected {problem['expected']!r}, found {problem['found']!r}")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Patch Pre-check")
+    parser.add_argument("--patch-file", required=True, help="Path to the patch diff file to check.")
+    parser.add_argument("--repo", default=str(Path(__file__).resolve().parents[2]), help="Repository to check against.")
+    parser.add_argument("--rev", default="HEAD", help="Revision holding the base files (default: HEAD).")
+    args = parser.parse_args()
+
+    check = precheck_patch(Path(args.patch_file).read_text(), args.repo, args.rev)
+    print(format_report(check), end='')
+    print(f"ATLAS_JSON_RESULT:{json.dumps(check)}")
+    sys.exit(0 if check['ok'] else 1)
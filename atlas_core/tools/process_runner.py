@@ -0,0 +1,283 @@
+"""
+Atlas Process Runner
+Non-blocking command execution shared by the async lifecycle API
+"""
+import asyncio
+import codecs
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from atlas_core.tools.output_capture import CHUNK_SIZE, OutputCapture
+
+
+class _Echo:
+    """
+    Streams output chunks to stdout as they arrive. With a label, only whole lines are
+    printed, each prefixed with it, so concurrent steps do not interleave mid-line.
+    """
+
+    def __init__(self, label: str = None, lock=None):
+        self.label = label
+        self.lock = lock or threading.Lock()
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.pending = ''
+
+    def feed(self, data: bytes):
+        text = self.decoder.decode(data)
+        if self.label:
+            text = self.pending + text
+            complete, newline, self.pending = text.rpartition('\n')
+            if not newline:
+                return
+            text = ''.join(f"[{self.label}] {line}\n" for line in complete.split('\n'))
+        self._write(text)
+
+    def flush(self):
+        text = self.pending + self.decoder.decode(b'', final=True)
+        self.pending = ''
+        if text:
+            self._write(f"[{self.label}] {text}\n" if self.label else text)
+
+    def _write(self, text: str):
+        with self.lock:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+
+async def run_command_async(command, cwd, echo: bool = True):
+    """
+    Runs a shell command on the event loop, streaming its output live.
+
+    Output is read in chunks into an OutputCapture, so a command printing hundreds of
+    megabytes keeps only its head and tail in memory.
+
+    Returns:
+        (returncode, combined stdout/stderr output)
+    """
+    process = await asyncio.create_subprocess_shell(
+        command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        cwd=cwd
+    )
+    capture = OutputCapture(command)
+    printer = _Echo() if echo else None
+    try:
+        while True:
+            data = await process.stdout.read(CHUNK_SIZE)
+            if not data:
+                break
+            capture.write(data)
+            if printer:
+                printer.feed(data)  # Print to parent process stdout for live streaming
+        if printer:
+            printer.flush()
+        await process.wait()
+    finally:
+        capture.close()
+    return process.returncode, capture.text()
+
+
+def run_command(command, cwd, echo: bool = True):
+    """Blocking run_command_async() for synchronous tools: (returncode, output)."""
+    code, output, _ = MeasuredProcess(command, cwd, echo=echo).run()
+    return code, output
+
+
+# Grace period between asking a cancelled step's process group to stop and killing it
+KILL_GRACE_SECONDS = 3
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def _limited_command(command: str, limits: dict) -> str:
+    """
+    Prefix a shell command with `ulimit` calls for memory_mb (address space) and cpu_seconds.
+
+    The shell applies the limits to itself before running the command, so every process
+    of the tree inherits them; if the shell cannot set a limit the step exits 126.
+    """
+    settings = []
+    if limits.get('memory_mb'):
+        settings.append(f"ulimit -v {int(limits['memory_mb']) * 1024}")
+    if limits.get('cpu_seconds'):
+        seconds = int(limits['cpu_seconds'])
+        settings.append(f"ulimit -t {seconds + KILL_GRACE_SECONDS}")
+        settings.append(f"ulimit -S -t {seconds}")
+    return f"{' && '.join(settings)} || exit 126\n{command}"
+
+
+class MeasuredProcess:
+    """
+    A shell command in its own process group, with a deadline and resource accounting.
+
+    run() blocks (call it from a worker thread) and returns (returncode, output, usage)
+    where usage holds cpu_ms and peak_rss_mb for the shell and every child it waited
+    for, taken from os.wait4(). Output goes through an OutputCapture (`capture`), so
+    only its head and tail are returned once it outgrows memory. kill() stops the whole process tree from another
+    thread, after which run() returns with the output collected so far; the same
+    happens when `timeout` seconds pass (timed_out is then set). `limits` sets
+    rlimits on each process of the tree with `ulimit` in the step's shell: memory_mb
+    and cpu_seconds. Where os.wait4 is unavailable (Windows) the usage values are None
+    and limits are not applied.
+    """
+
+    def __init__(self, command, cwd, label: str = None, echo: bool = True, print_lock=None,
+                 timeout: float = None, limits: dict = None, env: dict = None):
+        self.printer = _Echo(label, print_lock) if echo else None
+        self.capture = OutputCapture(label or command)
+        self.timeout = timeout
+        self.killed = False
+        self.timed_out = False
+        self._timers = []
+        posix = hasattr(os, 'killpg')
+        if posix and limits and any(limits.values()):
+            command = _limited_command(command, limits)
+        self.process = subprocess.Popen(
+            command, shell=True, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            start_new_session=posix
+        )
+
+    def _after(self, seconds: float, action):
+        timer = threading.Timer(seconds, action)
+        timer.daemon = True
+        timer.start()
+        self._timers.append(timer)
+
+    def _expire(self):
+        self.timed_out = True
+        self.kill()
+
+    def run(self):
+        if self.timeout:
+            self._after(self.timeout, self._expire)
+        fd = self.process.stdout.fileno()
+        try:
+            while True:
+                data = os.read(fd, CHUNK_SIZE)
+                if not data:
+                    break
+                self.capture.write(data)
+                if self.printer:
+                    self.printer.feed(data)
+            if self.printer:
+                self.printer.flush()
+            self.process.stdout.close()
+
+            usage = {"cpu_ms": None, "peak_rss_mb": None}
+            if hasattr(os, 'wait4'):
+                _, status, rusage = os.wait4(self.process.pid, 0)
+                self.process.returncode = os.waitstatus_to_exitcode(status)
+                usage = {"cpu_ms": (rusage.ru_utime + rusage.ru_stime) * 1000,
+                         "peak_rss_mb": rusage.ru_maxrss * _RSS_UNIT / (1024 * 1024)}
+            else:
+                self.process.wait()
+        finally:
+            for timer in self._timers:
+                timer.cancel()
+            self.capture.close()
+        output = self.capture.text()
+        if self.timed_out and self.process.returncode != 0:
+            output += f"\n⏱️ Killed after the {self.timeout}s timeout\n"
+        return self.process.returncode, output, usage
+
+    def kill(self):
+        """Terminate the process tree; on POSIX SIGTERM to its group, then SIGKILL after KILL_GRACE_SECONDS."""
+        if self.killed or self.process.returncode is not None:
+            return
+        self.killed = True
+        if not hasattr(os, 'killpg'):
+            subprocess.run(['taskkill', '/T', '/F', '/PID', str(self.process.pid)], capture_output=True)
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+
+        def escalate():
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+        self._after(KILL_GRACE_SECONDS, escalate)
+
+
+async def run_steps_async(steps: list, cwd, max_parallel: int = None, echo: bool = True, env: dict = None) -> list:
+    """
+    Run shell steps concurrently in dependency order, stopping at the first failure.
+
+    Each step is {"name", "command", "needs": [names of steps that must pass first]}
+    and optionally a `timeout` in seconds and rlimits under `limits` (see MeasuredProcess).
+    Every step runs with the environment variables `env` (default: this process's).
+    Up to `max_parallel` steps (default: the CPU count) run at once; output is prefixed
+    with the step name while more than one can run. When a step fails, the running
+    ones are killed (their partial output is kept and they are marked `cancelled`)
+    and the ones not yet started are skipped. A step past its timeout is killed and
+    fails with `timed_out`.
+
+    Returns:
+        a result per step that ran, in the order given: name, code, log, wall_ms,
+        cpu_ms, peak_rss_mb and, for killed steps, cancelled or timed_out
+    """
+    names = {step['name'] for step in steps}
+    for step in steps:
+        unknown = set(step.get('needs', [])) - names
+        if unknown:
+            raise ValueError(f"Step '{step['name']}' needs unknown step(s): {', '.join(sorted(unknown))}")
+
+    limit = max(1, max_parallel or os.cpu_count() or 1)
+    labelled = limit > 1 and len(steps) > 1
+    print_lock = threading.Lock()
+    pending = list(steps)
+    running = {}
+    results = {}
+    failed = False
+
+    def launch(step):
+        if echo:
+            with print_lock:
+                print(f"--- Running {step['name']} ---")
+        process = MeasuredProcess(step['command'], cwd, step['name'] if labelled else None, echo, print_lock,
+                                  step.get('timeout'), step.get('limits'), env)
+        task = asyncio.ensure_future(asyncio.to_thread(process.run))
+        running[task] = (step, process, time.perf_counter())
+
+    try:
+        while running or (pending and not failed):
+            if not failed:
+                for step in list(pending):
+                    if len(running) >= limit:
+                        break
+                    if all(results.get(need, {}).get('code') == 0 for need in step.get('needs', [])):
+                        pending.remove(step)
+                        launch(step)
+            if not running:
+                break  # what is left needs a step that did not pass
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                step, process, started = running.pop(task)
+                code, log, usage = task.result()
+                result = {"name": step['name'], "code": code, "log": log, **process.capture.summary(),
+                          "wall_ms": (time.perf_counter() - started) * 1000, **usage}
+                if process.timed_out and code != 0:
+                    result["timed_out"] = True
+                elif process.killed and code != 0:
+                    result["cancelled"] = True
+                results[step['name']] = result
+                if code != 0 and not result.get("cancelled") and not failed:
+                    failed = True
+                    for _, other, _ in running.values():
+                        other.kill()
+    finally:
+        # Cancelled from outside: stop every process group before leaving
+        for _, process, _ in running.values():
+            process.kill()
+
+    return [results[step['name']] for step in steps if step['name'] in results]
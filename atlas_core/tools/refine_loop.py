@@ -0,0 +1,275 @@
+"""
+Atlas Refine Loop Tool
+Propose → Verify → Refine until the patch passes, feeding each failure back to the model
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/refine_loop.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.generate_patch import (
+    _finish_proposal, _log_lock, _prepare_proposal, load_llm_config, log_performance_and_iteration,
+    parse_model_output, save_proposal
+)
+from atlas_core.tools.llm_client import PROMPT_TEMPLATE_VERSION, get_client
+from atlas_core.tools.log_distiller import distill_text, estimate_tokens
+from atlas_core.tools.verify_patch import verify_patch_async
+
+DEFAULT_STEP_LOG_TOKEN_BUDGET = 1500
+
+REFINE_PROMPT_TEMPLATE = """Your previous patch failed verification at step "{step}" (exit code {code}). Review the failure and propose a corrected patch.
+
+Failure Output:
+{failure_output}
+
+Return a new JSON response with the corrected patch."""
+
+
+def build_refine_prompt(step: dict, config: dict) -> str:
+    """
+    Build the follow-up turn for a failed verification step.
+
+    Only the failing step's trimmed output is sent: the original prompt and the
+    previous patch are already part of the conversation.
+    """
+    refine_config = config.get('refine', {})
+    distill_config = config.get('distillation', {})
+    failure_output, _ = distill_text(
+        step.get('log', ''),
+        token_budget=refine_config.get('step_log_token_budget', DEFAULT_STEP_LOG_TOKEN_BUDGET),
+        context_lines=distill_config.get('context_lines', 3),
+        tail_lines=distill_config.get('tail_lines', 40)
+    )
+    return REFINE_PROMPT_TEMPLATE.format(step=step['name'], code=step['code'], failure_output=failure_output)
+
+
+def failed_step(verification: dict):
+    """The step that failed verification, or None (steps cancelled by its failure are skipped)."""
+    for step in reversed(verification.get('steps', [])):
+        if step.get('code') != 0 and not step.get('cancelled'):
+            return step
+    return None
+
+
+class _Conversation:
+    """
+    The model-side state carried between refine turns.
+
+    In "generate" mode only the new turn is sent, together with the context tokens
+    Ollama returned for the previous one, so the server resumes from its KV state.
+    In "chat" mode the whole conversation is re-sent; servers with prompt caching
+    (Ollama, llama.cpp) skip evaluating the unchanged prefix, but it is still transmitted.
+    """
+
+    def __init__(self, client, mode: str):
+        self.client = client
+        self.mode = mode
+        self.context = None
+        self.messages = []
+
+    def start(self, prompt: str):
+        """Run the first turn; falls back from "auto" to the mode the server supports."""
+        if self.mode in ('auto', 'generate'):
+            try:
+                return self._generate(prompt)
+            except requests.exceptions.HTTPError as e:
+                if self.mode == 'generate' or e.response is None or e.response.status_code != 404:
+                    raise
+            self.mode = 'chat'
+        self.messages = self.client.build_messages(prompt)
+        return self._chat()
+
+    def resume(self, prompt: str, patch_data: dict):
+        """Continue a conversation whose first answer came from the response cache."""
+        # No server-side context exists for a cached answer, so rebuild it as chat history
+        self.mode = 'chat'
+        self.messages = self.client.build_messages(prompt)
+        self.messages.append({"role": "assistant", "content": json.dumps(patch_data)})
+
+    def follow_up(self, prompt: str):
+        """Send one refine turn."""
+        if self.mode == 'generate':
+            return self._generate(prompt)
+        self.messages.append({"role": "user", "content": prompt})
+        return self._chat()
+
+    def sent_tokens_est(self, prompt: str) -> int:
+        """Estimated prompt tokens transmitted for a turn (before any server-side prefix reuse)."""
+        if self.mode == 'generate':
+            return estimate_tokens(prompt)
+        return sum(estimate_tokens(message['content']) for message in self.messages)
+
+    def _generate(self, prompt: str):
+        content, raw_response, metrics = self.client.generate(prompt, context=self.context)
+        self.mode = 'generate'
+        self.context = raw_response.get('context')
+        return content, raw_response, metrics
+
+    def _chat(self):
+        content, raw_response, metrics = self.client.chat(self.messages)
+        self.messages.append({"role": "assistant", "content": content})
+        return content, raw_response, metrics
+
+
+def _log_refine_iteration(entry: dict):
+    """Append one refine iteration summary to iterations.jsonl."""
+    log_dir = Path(__file__).parent.parent / 'logs'
+    log_dir.mkdir(exist_ok=True)
+    with _log_lock, open(log_dir / 'iterations.jsonl', 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+async def refine_loop(error_log_path: str, config: dict = None, output_path: str = None, max_retries: int = None,
+                      use_cache: bool = True, quiet: bool = False) -> dict:
+    """
+    Propose a patch, verify it, and refine it with the failing step's output until it
+    passes or `iteration.max_retries` refinements have been spent.
+
+    Each iteration's timing, token counts and verification result are appended to
+    iterations.jsonl (event "refine"). A patch that passes after refinement replaces
+    the response cache entry for the log. The final patch is saved to `output_path`
+    when given.
+
+    Returns:
+        dict with status ("pass" or "escalate"), reason, iterations, patch_data and the
+        last verification result
+    """
+    if config is None:
+        config = await asyncio.to_thread(load_llm_config)
+    iteration_config = config.get('iteration', {})
+    if max_retries is None:
+        max_retries = iteration_config.get('max_retries', 3)
+    threshold = iteration_config.get('confidence_threshold', 0.5)
+
+    proposal = await asyncio.to_thread(_prepare_proposal, error_log_path, config, use_cache, quiet)
+    # Every turn stays on the routed model: the conversation context is model-specific
+    config = proposal['config']
+    client = get_client(config)
+    conversation = _Conversation(client, config.get('refine', {}).get('context_reuse', 'auto'))
+
+    started = time.perf_counter()
+    if proposal['cached']:
+        patch_data, perf_entry = await asyncio.to_thread(_finish_proposal, proposal, config)
+        conversation.resume(proposal['prompt'], patch_data)
+    else:
+        content, raw_response, metrics = await asyncio.to_thread(conversation.start, proposal['prompt'])
+        metrics['context_mode'] = conversation.mode
+        patch_data, perf_entry = await asyncio.to_thread(
+            _finish_proposal, proposal, config, content, raw_response, metrics
+        )
+    propose_ms = (time.perf_counter() - started) * 1000
+    sent_tokens = estimate_tokens(proposal['prompt'])
+
+    status, reason = "escalate", "max_retries"
+    verification = None
+    with tempfile.TemporaryDirectory(prefix='atlas-refine-') as patch_dir:
+        for iteration in range(max_retries + 1):
+            if iteration > 0:
+                step = failed_step(verification)
+                refine_prompt = build_refine_prompt(step, config)
+                if not quiet:
+                    print(f"\n🔁 Refine {iteration}/{max_retries}: sending \"{step['name']}\" failure back to the model")
+                started = time.perf_counter()
+                content, raw_response, metrics = await asyncio.to_thread(conversation.follow_up, refine_prompt)
+                propose_ms = (time.perf_counter() - started) * 1000
+                sent_tokens = conversation.sent_tokens_est(refine_prompt)
+                metrics = dict(metrics, refine_iteration=iteration, context_mode=conversation.mode)
+                patch_data = await asyncio.to_thread(
+                    parse_model_output, content, refine_prompt, raw_response, config, metrics
+                )
+                perf_entry = await asyncio.to_thread(
+                    log_performance_and_iteration, refine_prompt, patch_data, raw_response, config, metrics
+                )
+
+            patch_path = Path(patch_dir) / f"atlas-refine-{iteration}.diff"
+            patch_path.write_text(patch_data.get('patch_diff', ''))
+            started = time.perf_counter()
+            verification = await verify_patch_async(str(patch_path))
+            verify_ms = (time.perf_counter() - started) * 1000
+            step = failed_step(verification)
+
+            await asyncio.to_thread(_log_refine_iteration, {
+                "timestamp": datetime.now().isoformat(),
+                "event": "refine",
+                "model": config['llm_endpoints']['local']['model'],
+                "error_log_source": error_log_path,
+                "iteration": iteration,
+                "context_mode": conversation.mode,
+                "propose_ms": propose_ms,
+                "verify_ms": verify_ms,
+                "prompt_tokens": perf_entry.get('prompt_tokens', 0),
+                "response_tokens": perf_entry.get('response_tokens', 0),
+                "sent_tokens_est": sent_tokens,
+                "confidence_score": patch_data.get('confidence_score'),
+                "verification_status": verification['verification_status'],
+                "failed_step": step['name'] if step else None
+            })
+
+            if verification['verification_status'] == 'pass':
+                status, reason = "pass", None
+                break
+            # An infrastructure step (worktree setup) failed: the model cannot fix that by changing its patch
+            if step is None or step.get('infra'):
+                reason = "verification_error"
+                break
+            if iteration > 0 and patch_data.get('confidence_score', 0) < threshold:
+                reason = "low_confidence"
+                break
+
+    if status == "pass" and iteration > 0 and proposal['cache']:
+        # The verified refinement is a better answer for this failure than the first proposal
+        await asyncio.to_thread(proposal['cache'].put, proposal['cache_key'], {
+            "timestamp": datetime.now().isoformat(),
+            "model": proposal['model'],
+            "prompt_template_version": PROMPT_TEMPLATE_VERSION,
+            "patch_data": patch_data,
+            "verified": True
+        })
+
+    if output_path:
+        await asyncio.to_thread(save_proposal, patch_data, output_path, error_log_path)
+
+    if not quiet:
+        if status == "pass":
+            print(f"\n✅ Patch passed verification after {iteration} refinement(s)")
+        else:
+            print(f"\n⚠️  Escalating to manual review ({reason}) after {iteration} refinement(s)")
+        if output_path:
+            print(f"💾 Patch saved to: {output_path}")
+
+    return {
+        "status": status,
+        "reason": reason,
+        "iterations": iteration + 1,
+        "context_mode": conversation.mode,
+        "patch_data": patch_data,
+        "verification": verification
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Refine Loop Tool")
+    parser.add_argument("--log-file", required=True, help="Path to the error log file.")
+    parser.add_argument("--output-path", default="suggested_patch.diff", help="Path to save the final patch file.")
+    parser.add_argument("--max-retries", type=int, help="Override iteration.max_retries.")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache for the first proposal.")
+    args = parser.parse_args()
+
+    try:
+        loop_result = asyncio.run(refine_loop(args.log_file, output_path=args.output_path,
+                                              max_retries=args.max_retries, use_cache=not args.no_cache))
+        print(f"ATLAS_JSON_RESULT:{json.dumps(loop_result)}")
+        sys.exit(0 if loop_result['status'] == 'pass' else 2)
+    except Exception as e:
+        print(f"An error occurred: {e}", file=sys.stderr)
+        sys.exit(1)
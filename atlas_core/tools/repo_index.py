@@ -0,0 +1,594 @@
+"""
+Atlas Repository Index Tool
+Incremental file/symbol index of target repos, used to attach the source that stack frames reference
+"""
+import argparse
+import ast
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/repo_index.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.log_distiller import estimate_tokens
+
+INDEX_DIR = Path(__file__).parent.parent / 'cache' / 'index'
+
+# Bump when parsing changes so existing indexes are rebuilt
+INDEX_VERSION = 2
+
+MAX_PARSE_BYTES = 1024 * 1024
+MAX_BRACE_SCAN_LINES = 2000
+
+LANGUAGES = {
+    '.py': 'python',
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.ts': 'javascript', '.tsx': 'javascript',
+    '.go': 'go',
+    '.rs': 'rust',
+    '.java': 'java', '.cs': 'java', '.kt': 'java',
+    '.c': 'c', '.h': 'c', '.cc': 'c', '.cpp': 'c', '.cxx': 'c', '.hpp': 'c',
+    '.ps1': 'powershell', '.psm1': 'powershell',
+    '.sh': 'shell', '.bash': 'shell',
+    '.rb': 'ruby',
+}
+
+# Languages whose bodies are delimited by braces; the rest end where indentation returns
+BRACE_LANGUAGES = {'javascript', 'go', 'rust', 'java', 'c', 'powershell', 'shell'}
+
+_C_KEYWORDS = {'if', 'for', 'while', 'switch', 'return', 'sizeof', 'catch', 'else', 'do', 'new', 'delete'}
+
+SYMBOL_PATTERNS = {
+    'python': [
+        (re.compile(r'^\s*(?:async\s+)?def\s+([A-Za-z_]\w*)'), 'function'),
+        (re.compile(r'^\s*class\s+([A-Za-z_]\w*)'), 'class'),
+    ],
+    'javascript': [
+        (re.compile(r'^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)'), 'function'),
+        (re.compile(r'^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)'), 'class'),
+        (re.compile(r'^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?'
+                    r'(?:\([^)]*\)|[A-Za-z_$][\w$]*)\s*=>'), 'function'),
+    ],
+    'go': [
+        (re.compile(r'^func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)'), 'function'),
+        (re.compile(r'^type\s+([A-Za-z_]\w*)\s+(?:struct|interface)'), 'class'),
+    ],
+    'rust': [
+        (re.compile(r'^\s*(?:pub(?:\([^)]*\))?\s+)?(?:const\s+)?(?:async\s+)?(?:unsafe\s+)?fn\s+([A-Za-z_]\w*)'), 'function'),
+        (re.compile(r'^\s*(?:pub(?:\([^)]*\))?\s+)?(?:struct|enum|trait|impl(?:<[^>]*>)?)\s+([A-Za-z_]\w*)'), 'class'),
+    ],
+    'java': [
+        (re.compile(r'^\s*(?:(?:public|private|protected|internal|static|abstract|final|sealed|partial|data)\s+)*'
+                    r'(?:class|interface|enum|record|object)\s+([A-Za-z_]\w*)'), 'class'),
+        (re.compile(r'^\s*(?:(?:public|private|protected|internal|static|final|abstract|synchronized|async|'
+                    r'override|virtual)\s+)+[\w<>\[\],.? ]+?\s+([A-Za-z_]\w*)\s*\([^;]*$'), 'function'),
+    ],
+    'c': [
+        (re.compile(r'^(?:[A-Za-z_][\w:<>,*& ]*?[\s*&])?([A-Za-z_~][\w:~]*)\s*\([^;]*$'), 'function'),
+        (re.compile(r'^\s*(?:class|struct)\s+([A-Za-z_]\w*)\s*(?::[^{;]*)?\{?\s*$'), 'class'),
+    ],
+    'powershell': [
+        (re.compile(r'^\s*function\s+([\w-]+)', re.IGNORECASE), 'function'),
+    ],
+    'shell': [
+        (re.compile(r'^\s*(?:function\s+)?([A-Za-z_][\w-]*)\s*\(\)'), 'function'),
+        (re.compile(r'^\s*function\s+([A-Za-z_][\w-]*)'), 'function'),
+    ],
+    'ruby': [
+        (re.compile(r'^\s*def\s+((?:self\.)?[\w?!=]+)'), 'function'),
+        (re.compile(r'^\s*(?:class|module)\s+([A-Z]\w*(?:::\w+)*)'), 'class'),
+    ],
+}
+
+# Stack frame references: Python tracebacks, PowerShell, and the generic path:line[:col] form
+# used by compilers, pytest, Node and Go
+_FRAME_PATTERNS = [
+    re.compile(r'File "(?P<path>[^"]+)", line (?P<line>\d+)'),
+    re.compile(r'\bAt (?P<path>[^\s:]*(?::\\)?[^\s:]+):(?P<line>\d+) char:\d+'),
+    re.compile(r'(?P<path>(?:[A-Za-z]:)?[\w./\\-]*[\w-]\.(?:' +
+               '|'.join(sorted({ext[1:] for ext in LANGUAGES}, key=len, reverse=True)) +
+               r'))[:(](?P<line>\d+)'),
+]
+
+_UNSAFE_NAME_CHARS = re.compile(r'[^\w.-]')
+
+_LIBRARY_MARKERS = ('site-packages', 'dist-packages', 'node_modules', '/usr/lib/', '/usr/include/', '<frozen')
+
+
+def language_for(path: str):
+    """The index language for a path, or None for files that are not parsed."""
+    return LANGUAGES.get(os.path.splitext(path)[1].lower())
+
+
+def _python_symbols(source: str) -> list:
+    """Functions and classes with qualified names and exact line ranges, via ast."""
+    symbols = []
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                name = f"{prefix}{child.name}"
+                start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                kind = 'class' if isinstance(child, ast.ClassDef) else 'function'
+                symbols.append((name, kind, start, child.end_lineno))
+                visit(child, f"{name}.")
+
+    visit(ast.parse(source), '')
+    return symbols
+
+
+def _brace_end(lines: list, start: int) -> int:
+    """Last line (1-based) of the brace-delimited body opened at or just after `start`."""
+    depth = 0
+    opened = False
+    for offset, line in enumerate(lines[start - 1:start - 1 + MAX_BRACE_SCAN_LINES]):
+        depth += line.count('{') - line.count('}')
+        if '{' in line:
+            opened = True
+        if opened and depth <= 0:
+            return start + offset
+        if not opened and offset >= 5:
+            break
+    return start
+
+
+def _indent_end(lines: list, start: int) -> int:
+    """Last line (1-based) of the block whose header is at `start`, by indentation."""
+    header = lines[start - 1]
+    indent = len(header) - len(header.lstrip())
+    end = start
+    for number in range(start + 1, len(lines) + 1):
+        text = lines[number - 1]
+        if not text.strip():
+            continue
+        if len(text) - len(text.lstrip()) <= indent and not text.lstrip().startswith((')', ']', '}')):
+            if text.strip() == 'end':  # Ruby closes blocks with a dedented `end`
+                end = number
+            break
+        end = number
+    return end
+
+
+def _regex_symbols(source: str, language: str) -> list:
+    """Best-effort symbols for languages without a parser in the standard library."""
+    lines = source.splitlines()
+    symbols = []
+    for number, text in enumerate(lines, start=1):
+        for pattern, kind in SYMBOL_PATTERNS[language]:
+            match = pattern.match(text)
+            if not match or match.group(1) in _C_KEYWORDS:
+                continue
+            end = _brace_end(lines, number) if language in BRACE_LANGUAGES else _indent_end(lines, number)
+            symbols.append((match.group(1), kind, number, end))
+            break
+    return symbols
+
+
+def extract_imports(source: str, language: str) -> list:
+    """
+    Returns [(module, level), ...] imported by a Python file; `level` counts the
+    leading dots of a relative import. `from a import b` also yields `a.b`, which
+    test_impact resolves to a submodule when one exists. Other languages yield [].
+    """
+    if language != 'python':
+        return []
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError, RecursionError):
+        return []
+    imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update((alias.name, 0) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ''
+            imports.add((base, node.level))
+            imports.update((f"{base}.{alias.name}" if base else alias.name, node.level)
+                           for alias in node.names if alias.name != '*')
+    return sorted(imports)
+
+
+def extract_symbols(source: str, language: str) -> list:
+    """Returns [(name, kind, start_line, end_line), ...] for a file's source."""
+    if language == 'python':
+        try:
+            return _python_symbols(source)
+        except (SyntaxError, ValueError, RecursionError):
+            pass
+    return _regex_symbols(source, language)
+
+
+class RepoIndex:
+    """
+    SQLite index of one repository checkout.
+
+    `files` maps each tracked path to its git blob hash; `symbols` and `imports`
+    hold what was parsed from each blob, so update() only parses blobs it has not seen and
+    unchanged files (including renames and copies) cost nothing. Paths are looked up
+    by suffix, so absolute paths from CI runners resolve to repository files.
+    """
+
+    def __init__(self, name: str, repo_path, index_dir=INDEX_DIR):
+        self.name = name
+        self.repo_path = Path(repo_path).resolve()
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = index_dir / f"{_UNSAFE_NAME_CHARS.sub('_', name)}.sqlite"
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, blob TEXT NOT NULL, language TEXT);
+            CREATE TABLE IF NOT EXISTS blobs (blob TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS symbols (
+                blob TEXT NOT NULL, name TEXT NOT NULL, kind TEXT NOT NULL,
+                start_line INTEGER NOT NULL, end_line INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS symbols_by_blob ON symbols (blob, start_line);
+            CREATE INDEX IF NOT EXISTS symbols_by_name ON symbols (name);
+            CREATE TABLE IF NOT EXISTS imports (blob TEXT NOT NULL, module TEXT NOT NULL, level INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS imports_by_blob ON imports (blob);
+            CREATE TABLE IF NOT EXISTS coverage (path TEXT NOT NULL, test TEXT NOT NULL, PRIMARY KEY (path, test));
+        """)
+        if self._meta('version') != str(INDEX_VERSION):
+            with self.db:
+                self.db.execute("DELETE FROM files")
+                self.db.execute("DELETE FROM blobs")
+                self.db.execute("DELETE FROM symbols")
+                self.db.execute("DELETE FROM imports")
+                self.db.execute("DELETE FROM coverage")
+                self._set_meta('version', str(INDEX_VERSION))
+                self._set_meta('git_index_stamp', '')
+
+    def _meta(self, key: str):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _git_index_stamp(self) -> str:
+        """Changes whenever git's index (and so any tracked blob hash) changes."""
+        result = subprocess.run(['git', 'rev-parse', '--git-path', 'index'], cwd=self.repo_path,
+                                capture_output=True, text=True, check=True)
+        index_path = Path(result.stdout.strip())
+        if not index_path.is_absolute():
+            index_path = self.repo_path / index_path
+        stat = index_path.stat()
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def _tracked_files(self) -> dict:
+        """{path: blob} for every file in git's index."""
+        output = subprocess.run(['git', 'ls-files', '-s', '-z'], cwd=self.repo_path,
+                                capture_output=True, check=True).stdout
+        tracked = {}
+        for record in output.split(b'\0'):
+            if not record:
+                continue
+            info, path = record.split(b'\t', 1)
+            mode, blob, _ = info.split(b' ')
+            if mode.startswith(b'160'):  # submodule
+                continue
+            tracked[path.decode('utf-8', errors='surrogateescape')] = blob.decode('ascii')
+        return tracked
+
+    def _read_blobs(self, blobs: list):
+        """Yields (blob, text) for each blob through one `git cat-file --batch` process."""
+        if not blobs:
+            return
+        process = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=self.repo_path,
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        writer = threading.Thread(
+            target=lambda: (process.stdin.write(''.join(f"{b}\n" for b in blobs).encode()), process.stdin.close())
+        )
+        writer.start()
+        try:
+            for _ in blobs:
+                header = process.stdout.readline().split()
+                if len(header) < 3:
+                    continue
+                size = int(header[2])
+                data = process.stdout.read(size)
+                process.stdout.read(1)  # trailing newline
+                yield header[0].decode('ascii'), data.decode('utf-8', errors='replace')
+        finally:
+            writer.join()
+            process.stdout.close()
+            process.wait()
+
+    def update(self, force: bool = False) -> dict:
+        """
+        Bring the index in line with git's index, parsing only blobs not seen before.
+        With `force`, every tracked file is parsed again (e.g. after an extractor change).
+
+        Returns:
+            dict with files, parsed, removed and duration_ms
+        """
+        started = time.perf_counter()
+        with self._lock:
+            stamp = self._git_index_stamp()
+            if not force and stamp == self._meta('git_index_stamp'):
+                return {"files": None, "parsed": 0, "removed": 0, "skipped": True,
+                        "duration_ms": (time.perf_counter() - started) * 1000}
+
+            tracked = self._tracked_files()
+            indexed = dict(self.db.execute("SELECT path, blob FROM files"))
+            known_blobs = set() if force else {row[0] for row in self.db.execute("SELECT blob FROM blobs")}
+
+            removed = [path for path in indexed if path not in tracked]
+            changed = {path: blob for path, blob in tracked.items() if force or indexed.get(path) != blob}
+            to_parse = sorted({blob for path, blob in changed.items()
+                               if blob not in known_blobs and language_for(path)})
+            languages = {blob: language_for(path) for path, blob in changed.items() if blob in to_parse}
+
+            with self.db:
+                if force:
+                    # In the same transaction, so an interrupted rebuild leaves the old index
+                    for table in ('symbols', 'imports', 'blobs'):
+                        self.db.execute(f"DELETE FROM {table}")
+                self.db.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in removed))
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO files (path, blob, language) VALUES (?, ?, ?)",
+                    ((path, blob, language_for(path)) for path, blob in changed.items())
+                )
+                for blob, source in self._read_blobs(to_parse):
+                    if len(source) <= MAX_PARSE_BYTES:
+                        self.db.executemany(
+                            "INSERT INTO symbols (blob, name, kind, start_line, end_line) VALUES (?, ?, ?, ?, ?)",
+                            ((blob, *symbol) for symbol in extract_symbols(source, languages[blob]))
+                        )
+                        self.db.executemany(
+                            "INSERT INTO imports (blob, module, level) VALUES (?, ?, ?)",
+                            ((blob, *imported) for imported in extract_imports(source, languages[blob]))
+                        )
+                    self.db.execute("INSERT OR IGNORE INTO blobs (blob) VALUES (?)", (blob,))
+                if removed or changed:
+                    # Drop symbols of blobs no file refers to any more
+                    self.db.execute("DELETE FROM symbols WHERE blob NOT IN (SELECT blob FROM files)")
+                    self.db.execute("DELETE FROM imports WHERE blob NOT IN (SELECT blob FROM files)")
+                    self.db.execute("DELETE FROM blobs WHERE blob NOT IN (SELECT blob FROM files)")
+                self._set_meta('git_index_stamp', stamp)
+
+        return {"files": len(tracked), "parsed": len(to_parse), "removed": len(removed), "skipped": False,
+                "duration_ms": (time.perf_counter() - started) * 1000}
+
+    def resolve_path(self, frame_path: str):
+        """Map a path from a log (absolute, relative, either separator) to a tracked path, or None."""
+        parts = [part for part in frame_path.replace('\\', '/').split('/') if part and part != '.']
+        with self._lock:
+            for start in range(len(parts)):
+                candidate = '/'.join(parts[start:])
+                if self.db.execute("SELECT 1 FROM files WHERE path = ?", (candidate,)).fetchone():
+                    return candidate
+        return None
+
+    def enclosing_symbol(self, path: str, line: int):
+        """The innermost symbol in `path` containing `line` as (name, kind, start, end), or None."""
+        with self._lock:
+            return self.db.execute("""
+                SELECT s.name, s.kind, s.start_line, s.end_line
+                FROM files f JOIN symbols s ON s.blob = f.blob
+                WHERE f.path = ? AND s.start_line <= ? AND s.end_line >= ?
+                ORDER BY s.end_line - s.start_line LIMIT 1
+            """, (path, line, line)).fetchone()
+
+    def read_file(self, path: str) -> str:
+        """The text of `path` as indexed (its blob in git's index), so line numbers match the symbols."""
+        with self._lock:
+            row = self.db.execute("SELECT blob FROM files WHERE path = ?", (path,)).fetchone()
+        if not row:
+            return ''
+        return next((text for _, text in self._read_blobs([row[0]])), '')
+
+    def find_symbol(self, name: str) -> list:
+        """Every definition of `name` (or a qualified name ending in it) as (path, kind, start, end)."""
+        with self._lock:
+            return self.db.execute("""
+                SELECT f.path, s.kind, s.start_line, s.end_line
+                FROM symbols s JOIN files f ON f.blob = s.blob
+                WHERE s.name = ? OR s.name LIKE ?
+                ORDER BY f.path, s.start_line
+            """, (name, f"%.{name}")).fetchall()
+
+    def paths(self, language: str = None) -> list:
+        """Every indexed path, optionally only those of one language."""
+        with self._lock:
+            if language is None:
+                return [row[0] for row in self.db.execute("SELECT path FROM files ORDER BY path")]
+            return [row[0] for row in self.db.execute(
+                "SELECT path FROM files WHERE language = ? ORDER BY path", (language,))]
+
+    def imports(self) -> dict:
+        """{path: [(module, level), ...]} for every file that imports something."""
+        imported = {}
+        with self._lock:
+            for path, module, level in self.db.execute(
+                    "SELECT f.path, i.module, i.level FROM files f JOIN imports i ON i.blob = f.blob"):
+                imported.setdefault(path, []).append((module, level))
+        return imported
+
+    def set_coverage(self, mapping: dict):
+        """Replace the tests recorded as executing each path in `mapping` ({path: tests})."""
+        with self._lock, self.db:
+            self.db.executemany("DELETE FROM coverage WHERE path = ?", ((path,) for path in mapping))
+            self.db.executemany("INSERT OR IGNORE INTO coverage (path, test) VALUES (?, ?)",
+                                ((path, test) for path, tests in mapping.items() for test in tests))
+
+    def covering_tests(self, path: str) -> list:
+        """Tests the coverage map records as executing `path`."""
+        with self._lock:
+            return [row[0] for row in self.db.execute("SELECT test FROM coverage WHERE path = ?", (path,))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "repo": self.name,
+                "path": str(self.repo_path),
+                "files": self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0],
+                "blobs_parsed": self.db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0],
+                "symbols": self.db.execute("SELECT COUNT(*) FROM symbols").fetchone()[0],
+                "db_bytes": self.db_path.stat().st_size
+            }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_repo_index(name: str, repo_path) -> RepoIndex:
+    """Return the process-wide index for a repository, opening it on first use."""
+    key = (name, str(Path(repo_path).resolve()))
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = RepoIndex(name, repo_path)
+        return _indexes[key]
+
+
+def indexed_repos(config: dict) -> list:
+    """Indexes for every target repo with a local `path` configured."""
+    repos = []
+    for name, repo_config in (config.get('target_repos') or {}).items():
+        path = (repo_config or {}).get('path')
+        if path and Path(path).is_dir():
+            repos.append(get_repo_index(name, path))
+    return repos
+
+
+def stack_frames(text: str) -> list:
+    """[(path, line), ...] referenced by a log, in order of appearance, without library frames."""
+    frames = []
+    for line in text.splitlines():
+        for pattern in _FRAME_PATTERNS:
+            match = pattern.search(line)
+            if match:
+                path = match.group('path')
+                if not any(marker in path for marker in _LIBRARY_MARKERS):
+                    frames.append((path, int(match.group('line'))))
+                break
+    return frames
+
+
+def _read_region(repo: RepoIndex, path: str, start: int, end: int, sources: dict) -> str:
+    """Lines start..end of the indexed blob (not the working tree, which may be dirty)."""
+    if (repo, path) not in sources:
+        sources[repo, path] = repo.read_file(path).splitlines(keepends=True)
+    return ''.join(sources[repo, path][start - 1:end]).rstrip('\n')
+
+
+def build_source_context(error_logs: str, config: dict):
+    """
+    Collect the source regions that the log's stack frames point at.
+
+    Innermost (last) frames are taken first. Each frame contributes its enclosing
+    symbol, or `context_lines` around the line when there is none or it is too large.
+    Regions stop at `repo_context.token_budget` estimated tokens.
+
+    Returns:
+        (context_text, report) where context_text is '' when nothing was found
+    """
+    context_config = config.get('repo_context', {})
+    if not context_config.get('enabled', False):
+        return '', None
+    repos = indexed_repos(config)
+    if not repos:
+        return '', None
+
+    token_budget = context_config.get('token_budget', 1500)
+    max_regions = context_config.get('max_regions', 6)
+    context_lines = context_config.get('context_lines', 8)
+
+    update_ms = 0
+    for repo in repos:
+        update_ms += repo.update()['duration_ms']
+
+    started = time.perf_counter()
+    frames = stack_frames(error_logs)
+    regions = []
+    seen = set()
+    used_tokens = 0
+    sources = {}
+    for order, (frame_path, line) in reversed(list(enumerate(frames))):
+        if len(regions) >= max_regions:
+            break
+        for repo in repos:
+            path = repo.resolve_path(frame_path)
+            if path:
+                break
+        else:
+            continue
+
+        symbol = repo.enclosing_symbol(path, line)
+        label = f"{symbol[1]} {symbol[0]}" if symbol else None
+        start, end = (symbol[2], symbol[3]) if symbol else (line - context_lines, line + context_lines)
+        if symbol and estimate_tokens(_read_region(repo, path, start, end, sources)) > token_budget // 2:
+            start, end = line - context_lines, line + context_lines
+        start = max(start, 1)
+        if any(s_path == path and s_start <= line <= s_end for s_path, s_start, s_end in seen):
+            continue
+
+        text = _read_region(repo, path, start, end, sources)
+        if not text:
+            continue
+        end = start + text.count('\n')
+        tokens = estimate_tokens(text)
+        if used_tokens + tokens > token_budget:
+            continue
+        used_tokens += tokens
+        seen.add((path, start, end))
+        header = f"--- {path} (lines {start}-{end}{', ' + label if label else ''}) ---"
+        regions.append((order, f"{header}\n{text}"))
+
+    lookup_ms = (time.perf_counter() - started) * 1000
+    report = {
+        "source_frames": len(frames),
+        "source_regions": len(regions),
+        "source_context_tokens_est": used_tokens,
+        "index_update_ms": update_ms,
+        "index_lookup_ms": lookup_ms
+    }
+    return "\n\n".join(text for _, text in sorted(regions)), report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Repository Index Tool")
+    parser.add_argument("--repo", help="target_repos entry to index (default: every entry with a path).")
+    parser.add_argument("--rebuild", action="store_true", help="Re-read every tracked file.")
+    parser.add_argument("--lookup", help="Resolve a path:line reference to its enclosing symbol.")
+    parser.add_argument("--symbol", help="Find the definitions of a symbol name.")
+    parser.add_argument("--log-file", help="Print the source context that would be attached for this log.")
+    args = parser.parse_args()
+
+    from atlas_core.tools.generate_patch import load_llm_config
+    config = load_llm_config()
+    repos = [r for r in indexed_repos(config) if args.repo in (None, r.name)]
+    if not repos:
+        print("❌ No target_repos entry with a local `path` to index.", file=sys.stderr)
+        sys.exit(1)
+
+    for repo in repos:
+        result = repo.update(force=args.rebuild)
+        print(f"🗂️  {repo.name}: {json.dumps(dict(result, **repo.stats()))}")
+        if args.lookup:
+            frame_path, _, line = args.lookup.rpartition(':')
+            path = repo.resolve_path(frame_path)
+            print(f"   {args.lookup} → {path}: {repo.enclosing_symbol(path, int(line)) if path else None}")
+        if args.symbol:
+            for definition in repo.find_symbol(args.symbol):
+                print(f"   {args.symbol}: {definition}")
+
+    if args.log_file:
+        with open(args.log_file, 'r', encoding='utf-8', errors='replace') as f:
+            context, context_report = build_source_context(f.read(), dict(config, repo_context=dict(
+                config.get('repo_context', {}), enabled=True)))
+        print(context)
+        print(json.dumps(context_report))
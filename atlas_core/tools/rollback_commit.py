@@ -2,28 +2,15 @@
 Atlas Rollback Tool
 """
 import argparse
-import subprocess
 import sys
 from pathlib import Path
 
-def run_command(command, cwd):
-    """Runs a command and captures its output, streaming it live."""
-    process = subprocess.Popen(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        shell=True,
-        cwd=cwd
-    )
-    output = []
-    for line in iter(process.stdout.readline, ''):
-        print(line, end='') # Print to parent process stdout for live streaming
-        sys.stdout.flush()
-        output.append(line)
-    
-    process.wait()
-    return process.returncode, "".join(output)
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/rollback_commit.py` (used by the Streamlit app)
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.process_runner import run_command
+
 
 def rollback_commit(commit_hash: str, push: bool):
     """
@@ -0,0 +1,216 @@
+"""
+Atlas Speculative Proposal Tool
+Races several candidate proposals and keeps the first confident one that applies cleanly
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/speculative.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.generate_patch import (
+    _finish_proposal, _prepare_proposal, load_llm_config, log_performance_and_iteration, parse_model_output
+)
+from atlas_core.tools.llm_client import get_client
+from atlas_core.tools.process_runner import run_command_async
+
+DEFAULT_TEMPERATURES = [0.2, 0.5, 0.8]
+
+
+def candidate_variants(config: dict, candidates: int = None) -> list:
+    """
+    Build the sampling settings for each candidate.
+
+    Models and temperatures from the `speculative` config section are cycled so that
+    every candidate differs; each candidate also gets its own seed.
+    """
+    spec_config = config.get('speculative', {})
+    count = candidates or spec_config.get('candidates', 3)
+    models = spec_config.get('models') or [config['llm_endpoints']['local']['model']]
+    temperatures = spec_config.get('temperatures') or DEFAULT_TEMPERATURES
+    base_seed = spec_config.get('base_seed', 1)
+    return [
+        {
+            "model": models[index % len(models)],
+            "temperature": temperatures[index % len(temperatures)],
+            "seed": base_seed + index
+        }
+        for index in range(count)
+    ]
+
+
+async def git_apply_check(patch_diff: str, repo_path) -> bool:
+    """Return True if `patch_diff` applies cleanly to the working tree at `repo_path`."""
+    if not patch_diff or not patch_diff.strip():
+        return False
+    fd, patch_path = tempfile.mkstemp(suffix='.diff', prefix='atlas-candidate-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(patch_diff if patch_diff.endswith('\n') else patch_diff + '\n')
+        returncode, _ = await run_command_async(f'git apply --check "{patch_path}"', cwd=repo_path, echo=False)
+        return returncode == 0
+    finally:
+        os.unlink(patch_path)
+
+
+async def propose_speculative(error_log_path: str, config: dict, candidates: int = None, use_cache: bool = True,
+                              quiet: bool = True, on_score=None, repo_path=None):
+    """
+    Request several candidates concurrently and return the first acceptable one.
+
+    A candidate is accepted once its confidence_score reaches
+    `iteration.confidence_threshold` and its diff passes `git apply --check` against
+    `repo_path` (the Atlas repo root by default); the remaining requests are then
+    cancelled, which stops their generation on the server. If no candidate is accepted,
+    the most confident one that applies is chosen, falling back to the most confident.
+
+    on_score(index, variant, confidence) fires as each candidate streams its confidence.
+
+    Returns:
+        (patch_data, perf_entry, report) where report describes every candidate
+    """
+    threshold = config.get('iteration', {}).get('confidence_threshold', 0.5)
+    repo_path = repo_path or Path(__file__).resolve().parents[2]
+
+    proposal = await asyncio.to_thread(_prepare_proposal, error_log_path, config, use_cache, quiet)
+    config = proposal['config']
+    variants = candidate_variants(config, candidates)
+    if proposal['cached']:
+        patch_data, perf_entry = await asyncio.to_thread(_finish_proposal, proposal, config)
+        return patch_data, perf_entry, {"cache": "hit", "threshold": threshold, "winner": None, "candidates": []}
+
+    client = get_client(config)
+    messages = client.build_messages(proposal['prompt'])
+
+    async def run_candidate(index: int, variant: dict) -> dict:
+        def on_field(name, value):
+            if name == 'confidence_score' and on_score:
+                on_score(index, variant, value)
+
+        started = time.perf_counter()
+        content, raw_response, metrics = await client.achat(
+            messages, stream=True, on_field=on_field, model=variant['model'],
+            options={"temperature": variant['temperature'], "seed": variant['seed']}
+        )
+        candidate_metrics = dict(metrics, model=variant['model'], speculative_candidate=index,
+                                 temperature=variant['temperature'], seed=variant['seed'])
+        patch_data = await asyncio.to_thread(
+            parse_model_output, content, proposal['prompt'], raw_response, config, candidate_metrics
+        )
+        metrics['parse_status'] = candidate_metrics['parse_status']
+        applies = await git_apply_check(patch_data.get('patch_diff', ''), repo_path)
+        return {
+            "content": content,
+            "raw_response": raw_response,
+            "metrics": metrics,
+            "patch_data": patch_data,
+            "confidence_score": patch_data.get('confidence_score', 0),
+            "applies": applies,
+            "wall_ms": (time.perf_counter() - started) * 1000
+        }
+
+    race_started = time.perf_counter()
+    tasks = {asyncio.create_task(run_candidate(index, variant)): index for index, variant in enumerate(variants)}
+    pending = set(tasks)
+    results = {}
+    winner = None
+    while pending and winner is None:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            index = tasks[task]
+            try:
+                results[index] = task.result()
+            except Exception as e:
+                results[index] = {"error": str(e)}
+                continue
+            result = results[index]
+            if winner is None and result['applies'] and result['confidence_score'] >= threshold:
+                winner = index
+
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    time_to_winner_ms = (time.perf_counter() - race_started) * 1000
+
+    completed = {index: result for index, result in results.items() if 'error' not in result}
+    if not completed:
+        errors = "; ".join(f"#{index}: {result['error']}" for index, result in sorted(results.items()))
+        raise RuntimeError(f"All {len(variants)} candidates failed: {errors}")
+    accepted = winner is not None
+    if not accepted:
+        applying = {index: result for index, result in completed.items() if result['applies']}
+        pool = applying or completed
+        winner = max(pool, key=lambda index: pool[index]['confidence_score'])
+
+    candidate_reports = []
+    for index, variant in enumerate(variants):
+        result = results.get(index)
+        entry = dict(variant, index=index)
+        if result is None:
+            entry["status"] = "cancelled"
+        elif 'error' in result:
+            entry.update(status="error", error=result['error'])
+        else:
+            entry.update(
+                status="winner" if index == winner else "completed",
+                confidence_score=result['confidence_score'],
+                applies=result['applies'],
+                wall_ms=result['wall_ms']
+            )
+        candidate_reports.append(entry)
+
+    report = {
+        "threshold": threshold,
+        "winner": winner,
+        "accepted": accepted,
+        "time_to_winner_ms": time_to_winner_ms,
+        "cancelled": sum(1 for entry in candidate_reports if entry['status'] == 'cancelled'),
+        "candidates": candidate_reports
+    }
+
+    # Every finished candidate is logged; only the winner is parsed into the cache
+    for index, result in completed.items():
+        variant = variants[index]
+        speculative_metrics = dict(
+            result['metrics'], model=variant['model'], speculative_candidate=index,
+            temperature=variant['temperature'], seed=variant['seed'], applies=result['applies']
+        )
+        if index == winner:
+            speculative_metrics.update(
+                speculative_winner=True, speculative_candidates=len(variants),
+                speculative_cancelled=report['cancelled'], time_to_winner_ms=time_to_winner_ms
+            )
+            patch_data, perf_entry = await asyncio.to_thread(
+                _finish_proposal, proposal, config, result['content'], result['raw_response'], speculative_metrics
+            )
+        else:
+            await asyncio.to_thread(
+                log_performance_and_iteration, proposal['prompt'], result['patch_data'],
+                result['raw_response'], config, dict(speculative_metrics, speculative_winner=False)
+            )
+
+    return patch_data, perf_entry, report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Speculative Proposal Tool")
+    parser.add_argument("--log-file", required=True, help="Path to the error log file.")
+    parser.add_argument("--candidates", type=int, help="Number of candidates to race (default: speculative.candidates).")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache.")
+    args = parser.parse_args()
+
+    try:
+        patch_result, _, race_report = asyncio.run(propose_speculative(
+            args.log_file, load_llm_config(), candidates=args.candidates, use_cache=not args.no_cache
+        ))
+        print(json.dumps({"patch_data": patch_result, "report": race_report}, indent=2))
+    except Exception as e:
+        print(f"An error occurred: {e}", file=sys.stderr)
+        sys.exit(1)
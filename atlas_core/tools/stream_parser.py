@@ -0,0 +1,190 @@
+"""
+Atlas Incremental JSON Parser
+Reports top-level fields of a streamed JSON object as soon as each value is complete
+"""
+import json
+
+# How many earlier element boundaries repair_json() backs off to before giving up
+MAX_REPAIR_CUTS = 3
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for the structured patch response.
+
+    Model output arrives a few characters at a time. Each call to feed() scans only
+    the new text and returns the top-level fields whose values have just closed, so
+    `confidence_score` and `explanation` can be shown long before `patch_diff` ends.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.completed = {}
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+
+    def feed(self, text: str) -> list:
+        """Append a chunk of model output; returns a list of newly completed (field, value) pairs."""
+        self.buffer += text
+        newly_completed = []
+        buf = self.buffer
+
+        for i in range(self._pos, len(buf)):
+            c = buf[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._key_start is not None:
+                        self._key = json.loads(buf[self._key_start:i + 1])
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._key_start = i
+            elif c in '{[':
+                self._depth += 1
+            elif c in '}]':
+                if self._depth == 1 and c == '}':
+                    self._emit(i, newly_completed)
+                self._depth = max(self._depth - 1, 0)
+            elif c == ':' and self._depth == 1 and self._key is not None and self._value_start is None:
+                self._value_start = i + 1
+            elif c == ',' and self._depth == 1:
+                self._emit(i, newly_completed)
+
+        self._pos = len(buf)
+        return newly_completed
+
+    def in_progress(self):
+        """
+        Returns (field, partial_text) for the value currently being streamed, or (None, "").
+
+        String values are unescaped on a best-effort basis so a partially generated
+        `patch_diff` can be rendered while the model is still writing it.
+        """
+        if self._key is None or self._value_start is None:
+            return None, ""
+
+        raw = self.buffer[self._value_start:].lstrip()
+        if raw.startswith('"'):
+            raw = raw[1:]
+            # Drop a dangling backslash so the partial escape does not break decoding
+            if raw.endswith('\\') and not raw.endswith('\\\\'):
+                raw = raw[:-1]
+            try:
+                return self._key, json.loads(f'"{raw}"')
+            except json.JSONDecodeError:
+                return self._key, raw
+        return self._key, raw
+
+    def _emit(self, end: int, newly_completed: list):
+        """Decode the value that ends at `end` and reset the per-field state."""
+        if self._key is not None and self._value_start is not None:
+            raw = self.buffer[self._value_start:end].strip()
+            try:
+                value = json.loads(raw)
+            except json.JSONDecodeError:
+                value = None
+            if value is not None or raw == 'null':
+                self.completed[self._key] = value
+                newly_completed.append((self._key, value))
+
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+
+
+def repair_json(text: str):
+    """
+    Parse model output that should be a single JSON object, repairing common damage.
+
+    Markdown fences and prose around the object are skipped, trailing commas are
+    dropped, raw newlines inside strings are accepted, and an object cut off
+    mid-string, mid-array or mid-object is closed. If closing it as-is is not
+    valid JSON, the partial element after the last comma is dropped instead.
+
+    Returns (value, repaired); raises ValueError when no object can be recovered.
+    """
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError:
+        pass
+
+    fence = text.find('```')
+    start = text.find('{', fence if fence >= 0 else 0)
+    if start < 0:
+        start = text.find('{')
+    if start < 0:
+        raise ValueError("No JSON object in model output")
+
+    out = []
+    stack = []
+    cuts = []
+    in_string = escape = False
+    closed = False
+    for c in text[start:]:
+        if in_string:
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                in_string = False
+            out.append(c)
+            continue
+        if c == '"':
+            in_string = True
+        elif c in '{[':
+            stack.append('}' if c == '{' else ']')
+        elif c in '}]':
+            if c != stack[-1]:
+                break  # mismatched bracket: keep what was balanced so far
+            _drop_trailing_comma(out)
+            out.append(stack.pop())
+            if not stack:
+                closed = True
+                break
+            continue
+        elif c == ',':
+            cuts.append((len(out), list(stack)))
+        out.append(c)
+
+    if closed:
+        attempts = [''.join(out)]
+    else:
+        # Truncated: close the open string and brackets, else back off to an element boundary
+        tail = out[:-1] if escape else list(out)
+        if in_string:
+            tail.append('"')
+        _drop_trailing_comma(tail)
+        if tail and tail[-1] == ':':
+            tail.append('null')
+        attempts = [''.join(tail) + ''.join(reversed(stack))]
+        for length, open_brackets in reversed(cuts[-MAX_REPAIR_CUTS:]):
+            attempts.append(''.join(out[:length]) + ''.join(reversed(open_brackets)))
+
+    for attempt in attempts:
+        try:
+            return json.loads(attempt, strict=False), True
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("Model output is not valid JSON and could not be repaired")
+
+
+def _drop_trailing_comma(chars: list):
+    """Strip trailing whitespace and a dangling comma from a list of output characters."""
+    while chars and chars[-1].isspace():
+        chars.pop()
+    if chars and chars[-1] == ',':
+        chars.pop()
@@ -0,0 +1,241 @@
+"""
+Atlas Test Impact Analysis
+Maps the files a patch changes to the tests that import or cover them
+"""
+import argparse
+import json
+import re
+import shlex
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path, PurePosixPath
+
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/test_impact.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.patch_precheck import parse_unified_diff
+from atlas_core.tools.repo_index import get_repo_index
+
+TEST_FILE_PATTERN = re.compile(r'(?:^|/)(?:test_[^/]*|[^/]*_test)\.py$')
+CONFTEST = 'conftest.py'
+
+DEFAULT_MAX_TESTS = 200
+DEFAULT_IMPACT_COMMAND = "python -m pytest -x -q {tests}"
+
+
+def is_test_file(path: str) -> bool:
+    return bool(TEST_FILE_PATTERN.search(path))
+
+
+def _module_names(path: str) -> list:
+    """Dotted names a Python file can be imported as: `src/pkg/mod.py` → src.pkg.mod, pkg.mod, mod."""
+    parts = list(PurePosixPath(path).with_suffix('').parts)
+    if parts and parts[-1] == '__init__':
+        parts.pop()
+    return ['.'.join(parts[start:]) for start in range(len(parts))]
+
+
+def _module_map(paths: list) -> dict:
+    """{dotted name: [paths]}; a name shared by several files maps to all of them."""
+    modules = {}
+    for path in paths:
+        for name in _module_names(path):
+            modules.setdefault(name, []).append(path)
+    return modules
+
+
+def _resolve_import(importer: str, module: str, level: int, modules: dict) -> list:
+    """Repository files an import statement refers to (none for third-party modules)."""
+    if level:
+        package = list(PurePosixPath(importer).parent.parts)
+        if level > 1:
+            package = package[:-(level - 1)]
+        # Relative imports are unambiguous: resolve against the full path only
+        name = '.'.join(package + ([module] if module else []))
+        return [path for path in modules.get(name, []) if _module_names(path)[0] == name]
+    return modules.get(module, [])
+
+
+def import_graph(index) -> dict:
+    """{path: {repository files it imports}} for the Python files of a RepoIndex."""
+    modules = _module_map(index.paths('python'))
+    graph = {}
+    for importer, imported in index.imports().items():
+        for module, level in imported:
+            for path in _resolve_import(importer, module, level, modules):
+                if path != importer:
+                    graph.setdefault(importer, set()).add(path)
+    return graph
+
+
+def reverse_import_graph(index) -> dict:
+    """{path: {paths that import it}} for the Python files of a RepoIndex."""
+    importers = {}
+    for importer, imported in import_graph(index).items():
+        for path in imported:
+            importers.setdefault(path, set()).add(importer)
+    return importers
+
+
+def _closure(graph: dict, paths) -> set:
+    """`paths` and everything reachable from them in `graph`."""
+    seen = set(paths)
+    pending = list(seen)
+    while pending:
+        for path in graph.get(pending.pop(), ()):
+            if path not in seen:
+                seen.add(path)
+                pending.append(path)
+    return seen
+
+
+def import_closure(index, paths) -> list:
+    """
+    The files `paths` need to import: themselves, the repository modules they import
+    directly or transitively, and the `conftest.py` files above any test among them
+    (with what those import in turn).
+    """
+    conftests = {path for path in index.paths('python') if PurePosixPath(path).name == CONFTEST}
+    needed = set(paths)
+    for path in paths:
+        if is_test_file(path):
+            needed.update(conftest for conftest in conftests
+                          if PurePosixPath(conftest).parent in PurePosixPath(path).parents)
+    return sorted(_closure(import_graph(index), needed))
+
+
+def ingest_coverage(index, coverage_json) -> dict:
+    """
+    Add a per-test coverage map from `coverage json --show-contexts` output (run the
+    suite with `pytest --cov --cov-context=test`). Replaces the entries of every file
+    in the report; files it does not mention keep what an earlier report recorded.
+    """
+    with open(coverage_json, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    mapping = {}
+    for file_path, data in report.get('files', {}).items():
+        path = index.resolve_path(file_path)
+        if not path:
+            continue
+        tests = mapping.setdefault(path, set())
+        for contexts in (data.get('contexts') or {}).values():
+            for context in contexts:
+                test = context.split('::', 1)[0].split('|', 1)[0]
+                if test and is_test_file(test):
+                    tests.add(index.resolve_path(test) or test)
+    index.set_coverage(mapping)
+    return {"files": len(mapping), "pairs": sum(len(tests) for tests in mapping.values())}
+
+
+def patch_paths(patch_text: str) -> list:
+    """Every path a unified diff touches (old and new names of renames)."""
+    paths = []
+    for entry in parse_unified_diff(patch_text):
+        paths.extend(path for path in (entry['old_path'], entry['new_path']) if path and path not in paths)
+    return paths
+
+
+def removed_paths(patch_text: str) -> list:
+    """Paths that no longer exist once the diff is applied: deleted files and rename sources."""
+    return [entry['old_path'] for entry in parse_unified_diff(patch_text)
+            if entry['old_path'] and entry['old_path'] != entry['new_path']]
+
+
+def impacted_tests(index, changed_paths, update: bool = True, removed=()) -> dict:
+    """
+    Test files affected by changes to `changed_paths`.
+
+    A test is impacted when it was changed itself, imports a changed file directly or
+    through other repository modules, sits under a `conftest.py` that does, or is
+    recorded by the coverage map as executing a changed file. Test files in `removed`
+    (deleted or renamed by the patch) are left out, since there is nothing left to run.
+
+    Returns:
+        dict with tests (sorted paths), changed, unmapped (changed files no test
+        reaches), imports (import_closure() of the tests and the changed files that
+        remain), index_update_ms and duration_ms
+    """
+    update_ms = index.update()['duration_ms'] if update else 0
+    started = time.perf_counter()
+    changed = sorted({index.resolve_path(path) or path for path in changed_paths})
+    removed = {index.resolve_path(path) or path for path in removed}
+
+    importers = reverse_import_graph(index)
+    reached = {origin: _closure(importers, [origin]) for origin in changed}
+
+    test_paths = [path for path in index.paths('python') if is_test_file(path)]
+    tests = set()
+    unmapped = []
+    for origin, affected in reached.items():
+        found = {path for path in affected if is_test_file(path)}
+        for conftest in (path for path in affected if PurePosixPath(path).name == CONFTEST):
+            directory = str(PurePosixPath(conftest).parent)
+            found.update(path for path in test_paths
+                         if directory == '.' or path.startswith(directory + '/'))
+        found.update(index.covering_tests(origin))
+        found -= removed
+        if not found and not (origin in removed and is_test_file(origin)):
+            unmapped.append(origin)
+        tests |= found
+
+    return {
+        "tests": sorted(tests),
+        "changed": changed,
+        "unmapped": unmapped,
+        "imports": import_closure(index, sorted(tests | (set(changed) - removed))),
+        "index_update_ms": update_ms,
+        "duration_ms": (time.perf_counter() - started) * 1000
+    }
+
+
+def impact_command(repo_config: dict, tests: list) -> str:
+    """The target repo's `impact_test_command` with `{tests}` replaced by the quoted test paths."""
+    template = repo_config.get('impact_test_command', DEFAULT_IMPACT_COMMAND)
+    return template.format(tests=' '.join(shlex.quote(test) for test in tests))
+
+
+def get_impact_index(repo_root):
+    """The RepoIndex of the repository verification worktrees are checked out from."""
+    return get_repo_index(f"impact-{Path(repo_root).resolve().name}", repo_root)
+
+
+def impact_for_patch(repo_root, patch_text: str):
+    """impacted_tests() for the files a diff touches, or None when the index cannot be read."""
+    try:
+        return impacted_tests(get_impact_index(repo_root), patch_paths(patch_text),
+                              removed=removed_paths(patch_text))
+    except (OSError, sqlite3.Error, subprocess.CalledProcessError) as e:
+        print(f"⚠️ Test impact analysis unavailable: {e}", file=sys.stderr)
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Test Impact Analysis")
+    parser.add_argument("paths", nargs="*", help="Changed files to find the impacted tests of.")
+    parser.add_argument("--patch-file", help="Take the changed files from a unified diff.")
+    parser.add_argument("--repo", default=str(Path(__file__).resolve().parents[2]),
+                        help="Repository to analyse (default: this checkout).")
+    parser.add_argument("--ingest-coverage", metavar="JSON",
+                        help="Add the per-test map from `coverage json --show-contexts` output.")
+    args = parser.parse_args()
+
+    repo_index = get_impact_index(args.repo)
+    repo_index.update()
+    if args.ingest_coverage:
+        print(f"🧪 Coverage map: {json.dumps(ingest_coverage(repo_index, args.ingest_coverage))}")
+
+    changed_files = list(args.paths)
+    deleted_files = []
+    if args.patch_file:
+        with open(args.patch_file, 'r', encoding='utf-8', errors='replace') as f:
+            patch_text = f.read()
+        changed_files.extend(patch_paths(patch_text))
+        deleted_files = removed_paths(patch_text)
+    if changed_files:
+        impact = impacted_tests(repo_index, changed_files, update=False, removed=deleted_files)
+        for test_path in impact['tests']:
+            print(f"   {test_path}")
+        print(f"ATLAS_JSON_RESULT:{json.dumps(impact)}")
@@ -2,95 +2,319 @@
 Atlas Patch Verification Tool
 """
 import argparse
+import asyncio
 import json
 import subprocess
 import sys
+import time
+from datetime import datetime
 from pathlib import Path
 import yaml
 import tempfile
 import shutil
 
+if __package__ in (None, ''):
+    # Allow running as `python atlas_core/tools/verify_patch.py` (used by the Streamlit app)
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from atlas_core.tools.disk_cache import DiskCache, hash_key
+from atlas_core.tools.env_cache import environment_for, get_env_cache
+from atlas_core.tools.patch_normalizer import DEFAULT_FUZZ, format_adjustments, normalize_patch
+from atlas_core.tools.patch_precheck import format_report, precheck_patch
+from atlas_core.tools.process_runner import run_command_async, run_steps_async
+from atlas_core.tools.test_impact import DEFAULT_MAX_TESTS, impact_command, impact_for_patch, patch_paths
+from atlas_core.tools.worktree_pool import (DEFAULT_SPARSE_INCLUDE, add_worktree, get_worktree_pool, plan_checkout,
+                                           sparse_dirs, tmpfs_root)
+
 def load_config():
     """Loads the YAML configuration file."""
     config_path = Path(__file__).parent.parent / "config" / "llm_config.yaml"
     with open(config_path, 'r') as f:
         return yaml.safe_load(f)
 
-def run_command(command, cwd):
-    """Runs a command and captures its output, streaming it live."""
-    process = subprocess.Popen(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        shell=True,
-        cwd=cwd
-    )
-    output = []
-    for line in iter(process.stdout.readline, ''):
-        print(line, end='') # Print to parent process stdout for live streaming
-        sys.stdout.flush()
-        output.append(line)
-    
-    process.wait()
-    return process.returncode, "".join(output)
-
-def verify_patch(patch_file_path: str):
+# Bump when the verification steps change so earlier cached results are not reused
+VERIFY_CACHE_VERSION = 3
+
+# Settings besides the commands that can change a verification's outcome
+_OUTCOME_SETTINGS = ('build_timeout_seconds', 'test_timeout_seconds', 'limits', 'test_impact', 'env_cache', 'sparse')
+
+def get_verification_cache(config: dict):
+    """Return the on-disk verification result cache, or None when disabled in config."""
+    cache_config = config.get('verification', {}).get('cache', {})
+    if not cache_config.get('enabled', False):
+        return None
+    cache_dir = Path(__file__).parent.parent / 'cache' / 'verifications'
+    return DiskCache.from_config(cache_dir, cache_config)
+
+def verification_cache_key(tree: str, patch_text: str, target_repo_config: dict, verification_config: dict) -> str:
+    """Key a result by the base commit's tree, the (normalized) patch and the exact build/test setup."""
+    commands = {key: target_repo_config.get(key)
+                for key in ('build_command', 'test_commands', 'impact_test_command', 'env_setup_command')}
+    settings = {key: verification_config.get(key) for key in _OUTCOME_SETTINGS}
+    # Worktrees that keep ignored build outputs between leases are not hermetic
+    settings['clean_ignored'] = verification_config.get('worktree_pool', {}).get('clean_ignored', True)
+    return hash_key(VERIFY_CACHE_VERSION, tree, hash_key(patch_text),
+                    json.dumps(commands, sort_keys=True), json.dumps(settings, sort_keys=True))
+
+def _head_tree(repo_root) -> str:
+    return subprocess.run(['git', 'rev-parse', 'HEAD^{tree}'], cwd=repo_root,
+                          capture_output=True, text=True, check=True).stdout.strip()
+
+def verify_patch(patch_file_path: str, use_cache: bool = True) -> dict:
     """
     Verifies a patch in an isolated git worktree.
     Follows the logic from docs/patch_lifecycle.md.
+
+    Thin synchronous wrapper around verify_patch_async.
+    """
+    return asyncio.run(verify_patch_async(patch_file_path, use_cache))
+
+async def verify_patch_async(patch_file_path: str, use_cache: bool = True) -> dict:
+    """
+    Verifies a patch in an isolated git worktree without blocking the event loop,
+    so one process can verify while another patch is being proposed.
+
+    With `use_cache`, a patch already verified against the same base tree with the same
+    build and test commands returns the stored steps, each marked `cached`.
+
+    Returns:
+        The results dict also printed as ATLAS_JSON_RESULT
     """
     config = load_config()
+    verification_config = config.get("verification", {})
+    target_repo_key = list(config.get("target_repos", {}).keys())[0]
+    target_repo_config = config["target_repos"][target_repo_key]
     repo_root = Path(__file__).parent.parent.parent
+    cache = get_verification_cache(config) if use_cache else None
+    cache_key = None
     worktree_name = f"atlas-verify-{Path(patch_file_path).stem}"
     worktree_path = repo_root / worktree_name
+    env_cache = get_env_cache(config) if verification_config.get("env_cache", {}).get("enabled", False) else None
+    env_path = None
+    pool = get_worktree_pool(config) if verification_config.get("worktree_pool", {}).get("enabled", True) else None
+    lease = None
     results = {
         "verification_status": "fail",
         "steps": []
     }
 
     try:
-        # 1. Create isolated worktree
-        print(f"--- Creating temporary worktree: {worktree_name} ---")
-        if worktree_path.exists():
-            shutil.rmtree(worktree_path)
-        
-        code, out = run_command(f"git worktree add {worktree_name}", repo_root)
-        results["steps"].append({"name": "Create Worktree", "code": code, "log": out})
-        if code != 0:
-            raise RuntimeError("Failed to create git worktree.")
+        patch_text = await asyncio.to_thread(Path(patch_file_path).read_text)
+
+        # 0. Relocate hunks with wrong line numbers or whitespace drift, then reject
+        #    diffs that still cannot apply to HEAD before paying for a worktree
+        if verification_config.get("normalize", True):
+            normalized = await asyncio.to_thread(
+                normalize_patch, patch_text, repo_root, "HEAD", verification_config.get("fuzz", DEFAULT_FUZZ)
+            )
+            if normalized["changed"]:
+                report = format_adjustments(normalized)
+                print(f"--- Normalizing patch ---\n{report}", end='')
+                patch_text = normalized["patch"]
+                results["normalized"] = True
+                results["steps"].append({"name": "Normalize Patch", "code": 0, "log": report,
+                                         "adjustments": normalized["adjustments"]})
+
+        if verification_config.get("precheck", True):
+            print("--- Pre-checking patch against HEAD ---")
+            check = await asyncio.to_thread(precheck_patch, patch_text, repo_root)
+            report = format_report(check)
+            print(report, end='')
+            results["precheck_ms"] = check["duration_ms"]
+            results["steps"].append({"name": "Pre-check Patch", "code": 0 if check["ok"] else 1, "log": report,
+                                     "errors": check["errors"]})
+            if not check["ok"]:
+                raise RuntimeError("Patch does not apply to HEAD.")
+
+        # An identical verification (same tree, patch and commands) has already run
+        if cache:
+            started = time.perf_counter()
+            cache_key = verification_cache_key(await asyncio.to_thread(_head_tree, repo_root), patch_text,
+                                               target_repo_config, verification_config)
+            cached = await asyncio.to_thread(cache.get, cache_key)
+            if cached:
+                results["steps"].extend(dict(step, cached=True) for step in cached["steps"])
+                results["verification_status"] = cached["verification_status"]
+                scope = ""
+                if cached.get("full_suite_skipped"):
+                    # A sparse run: only the impacted tests were run
+                    results["full_suite_skipped"] = True
+                    scope = ", impacted tests only"
+                results["cached"] = {"verified_at": cached["verified_at"],
+                                     "lookup_ms": (time.perf_counter() - started) * 1000}
+                print(f"--- ⚡ Cached verification from {cached['verified_at']}: "
+                      f"{cached['verification_status']} ({results['cached']['lookup_ms']:.1f} ms{scope}) ---")
+                return results
+
+        # Map the changed files to their tests while the worktree is prepared
+        impact_config = verification_config.get("test_impact", {})
+        impact_task = None
+        if impact_config.get("enabled", True):
+            impact_task = asyncio.ensure_future(asyncio.to_thread(impact_for_patch, repo_root, patch_text))
+
+        # 1. Lease a pooled worktree reset to HEAD, or create an isolated one. Sparse mode
+        #    checks out only the directories of the changed files, the impacted tests, the
+        #    modules both import and `sparse.include`, and then runs only the impacted
+        #    tests; a checkout that fits the tmpfs budget goes to RAM
+        sparse = None
+        sparse_config = verification_config.get("sparse", {})
+        max_tests = impact_config.get("max_tests", DEFAULT_MAX_TESTS)
+        if sparse_config.get("enabled", False):
+            impact = await impact_task if impact_task else None
+            gated = impact and impact["tests"] and len(impact["tests"]) <= max_tests
+            if gated and target_repo_config.get("test_commands"):
+                sparse = sparse_dirs(patch_paths(patch_text) + impact["imports"],
+                                     sparse_config.get("include", DEFAULT_SPARSE_INCLUDE))
+            else:
+                print("⚠️ Full checkout: no impacted test gate applies, so the full suite runs on the whole tree")
+        try:
+            plan = await asyncio.to_thread(plan_checkout, config, repo_root, "HEAD", sparse)
+        except RuntimeError as e:
+            results["steps"].append({"name": "Plan Worktree", "code": 1, "log": f"{e}\n", "infra": True})
+            raise RuntimeError("Failed to plan the verification worktree.")
+        if plan["reason"]:
+            print(f"⚠️ Worktree on disk: {plan['reason']}")
+
+        step_name = "Lease Worktree" if pool else "Create Worktree"
+        for location in (["tmpfs", "disk"] if plan["location"] == "tmpfs" else ["disk"]):
+            started = time.perf_counter()
+            try:
+                if pool:
+                    print(f"--- Leasing verification worktree ({location}) ---")
+                    lease = await asyncio.to_thread(get_worktree_pool(config, location).acquire, "HEAD", None, sparse)
+                    worktree_path = lease.path
+                    action = "Reset" if lease.reused else "Created"
+                    out = (f"{action} {lease.slot} at {lease.base[:10]} in {lease.setup_ms:.0f} ms "
+                           f"(waited {lease.wait_ms:.0f} ms)\n")
+                    setup_ms = lease.setup_ms
+                else:
+                    worktree_path = (tmpfs_root(config) if location == "tmpfs" else repo_root) / worktree_name
+                    print(f"--- Creating temporary worktree: {worktree_path} ---")
+                    if worktree_path.exists():
+                        await asyncio.to_thread(shutil.rmtree, worktree_path)
+                    created = await asyncio.to_thread(add_worktree, repo_root, worktree_path, "HEAD", sparse)
+                    if created.returncode != 0:
+                        await asyncio.to_thread(shutil.rmtree, worktree_path, True)
+                        raise RuntimeError(created.stderr.strip())
+                    setup_ms = (time.perf_counter() - started) * 1000
+                    out = f"Created {worktree_name} in {setup_ms:.0f} ms\n"
+            except (RuntimeError, OSError) as e:
+                if location == "tmpfs":
+                    # A full tmpfs (ENOSPC) or a busy pool: the disk pool still works
+                    print(f"⚠️ tmpfs worktree failed, falling back to disk: {e}")
+                    plan["reason"] = str(e)
+                    continue
+                # `infra` marks failures of the verification setup rather than of the patch
+                results["steps"].append({"name": step_name, "code": 1, "log": f"{e}\n", "infra": True})
+                raise RuntimeError("Failed to lease a verification worktree." if pool
+                                   else "Failed to create git worktree.")
+            plan["location"] = location
+            break
+
+        checkout = {"location": plan["location"], "sparse": sparse, "checkout_bytes": plan["checkout_bytes"],
+                    "setup_ms": setup_ms, "fallback": plan["reason"]}
+        if plan["checkout_bytes"] is not None:
+            cone = f"sparse ({', '.join(sparse) or 'root files only'})" if sparse is not None else "full"
+            out += (f"{plan['location']}, {cone} checkout of {plan['checkout_bytes'] / (1024 * 1024):.1f} MB "
+                    f"in {setup_ms:.0f} ms\n")
+        print(out, end='')
+        results["worktree"] = checkout
+        results["worktree_setup_ms"] = setup_ms
+        results["steps"].append({"name": step_name, "code": 0, "log": out,
+                                 **{key: checkout[key] for key in ("location", "sparse", "checkout_bytes")}})
 
         # 2. Apply patch
         print(f"--- Applying patch: {patch_file_path} ---")
-        # We need to copy the patch file into the worktree to apply it
-        shutil.copy(patch_file_path, worktree_path)
+        # We need to write the (normalized) patch into the worktree to apply it
         patch_filename_in_worktree = Path(patch_file_path).name
+        await asyncio.to_thread((worktree_path / patch_filename_in_worktree).write_text, patch_text)
         
-        code, out = run_command(f"git apply {patch_filename_in_worktree}", worktree_path)
+        code, out = await run_command_async(f"git apply {patch_filename_in_worktree}", worktree_path)
+        apply_index = len(results["steps"])
         results["steps"].append({"name": "Apply Patch", "code": code, "log": out})
         if code != 0:
             raise RuntimeError("Failed to apply patch.")
 
+        # 2b. Link the shared dependency environment for this worktree's lockfiles
+        step_env = None
+        if env_cache:
+            print("--- Preparing dependency environment ---")
+            # Beside the cached environments on disk, so it can be hardlinked even for a tmpfs worktree
+            env_path = lease.env_path if lease else repo_root / f"{worktree_name}.env"
+            prepared = await asyncio.to_thread(env_cache.prepare, worktree_path, target_repo_config, env_path)
+            if prepared:
+                print(prepared["log"].splitlines()[-1])
+                results["steps"].append({"name": "Prepare Environment", **{key: prepared[key] for key in (
+                    "code", "log", "key", "hit", "setup_ms", "saved_ms")}})
+                if prepared["code"] != 0:
+                    raise RuntimeError("Environment setup failed.")
+                step_env = environment_for(env_path)
+
         # 3. Run build and test commands
-        target_repo_key = list(config.get("target_repos", {}).keys())[0]
-        target_repo_config = config["target_repos"][target_repo_key]
-        
         build_command = target_repo_config.get("build_command")
         test_commands = target_repo_config.get("test_commands", [])
 
+        # Test commands only need the build; independent ones run concurrently. Every
+        # step is killed with its process tree at its timeout
+        build_timeout = verification_config.get("build_timeout_seconds")
+        test_timeout = verification_config.get("test_timeout_seconds")
+        limits = verification_config.get("limits")
+        steps = []
         if build_command:
-            print(f"--- Running Build Command: {build_command} ---")
-            code, out = run_command(build_command, worktree_path)
-            results["steps"].append({"name": f"Build: {build_command}", "code": code, "log": out})
-            if code != 0:
-                raise RuntimeError("Build command failed.")
+            steps.append({"name": f"Build: {build_command}", "command": build_command, "needs": [],
+                          "timeout": build_timeout, "limits": limits})
+        build_needs = [steps[0]["name"]] if build_command else []
+
+        # The tests the patch can affect run first as a gate; the full suite only once they pass
+        gate = []
+        impact = await impact_task if impact_task and test_commands else None
+        if impact:
+            results["test_impact"] = impact
+            if impact["tests"] and len(impact["tests"]) <= max_tests:
+                print(f"--- {len(impact['tests'])} impacted test file(s) run first "
+                      f"(mapped in {impact['duration_ms']:.0f} ms) ---")
+                gate = [f"Impacted Tests ({len(impact['tests'])})"]
+                steps.append({"name": gate[0], "command": impact_command(target_repo_config, impact["tests"]),
+                              "needs": build_needs, "timeout": test_timeout, "limits": limits})
+            else:
+                print(f"--- Test impact: {len(impact['tests'])} impacted test file(s), running the full suite ---")
 
-        for cmd in test_commands:
-            print(f"--- Running Test Command: {cmd} ---")
-            code, out = run_command(cmd, worktree_path)
-            results["steps"].append({"name": f"Test: {cmd}", "code": code, "log": out})
-            if code != 0:
-                raise RuntimeError(f"Test command failed: {cmd}")
+        if sparse is not None:
+            # The configured suite expects the whole tree; a sparse worktree only has the gate's files
+            print(f"--- Sparse worktree: the full suite ({len(test_commands)} command(s)) is skipped ---")
+            results["full_suite_skipped"] = True
+            test_commands = []
+
+        for entry in test_commands:
+            # A test entry is a command string, or {command, needs: [other test commands]}
+            cmd = entry if isinstance(entry, str) else entry["command"]
+            needs = build_needs + gate
+            if isinstance(entry, dict):
+                needs += [f"Test: {need}" for need in entry.get("needs", [])]
+            steps.append({"name": f"Test: {cmd}", "command": cmd, "needs": needs,
+                          "timeout": test_timeout, "limits": limits})
+
+        max_parallel = verification_config.get("max_parallel", 0) if verification_config.get("parallel_tests", True) else 1
+        step_results = await run_steps_async(steps, worktree_path, max_parallel or None, env=step_env)
+        results["steps"].extend(step_results)
+        failed = next((step for step in step_results if step["code"] != 0 and not step.get("cancelled")), None)
+        # Timeouts may be load rather than the patch; everything else is reproducible
+        if cache and (not failed or (verification_config["cache"].get("cache_failures", False)
+                                     and not failed.get("timed_out"))):
+            await asyncio.to_thread(cache.put, cache_key, {
+                "verified_at": datetime.now().isoformat(),
+                "verification_status": "fail" if failed else "pass",
+                "full_suite_skipped": results.get("full_suite_skipped", False),
+                "steps": [results["steps"][apply_index]] + step_results
+            })
+        if failed:
+            if failed.get("timed_out"):
+                raise RuntimeError(f"{failed['name']} timed out.")
+            if failed["name"].startswith("Build: "):
+                raise RuntimeError("Build command failed.")
+            if gate and failed["name"] == gate[0]:
+                raise RuntimeError("Impacted tests failed.")
+            raise RuntimeError(f"Test command failed: {failed['name'][len('Test: '):]}")
 
         results["verification_status"] = "pass"
         print("--- ✅ Verification successful! ---")
@@ -100,24 +324,33 @@ def verify_patch(patch_file_path: str):
         # The error is already part of the results steps
 
     finally:
-        # 4. Clean up worktree
-        print(f"--- Cleaning up worktree: {worktree_name} ---")
-        if worktree_path.exists():
-            shutil.rmtree(worktree_path)
-        
-        # This command is needed to finalize the removal
-        run_command(f"git worktree prune", repo_root)
+        # 4. Return the pooled worktree (reset on its next lease) or clean up the temporary one
+        if lease:
+            print(f"--- Releasing worktree: {lease.slot} ---")
+            lease.release()
+        elif not pool:
+            print(f"--- Cleaning up worktree: {worktree_name} ---")
+            if worktree_path.exists():
+                await asyncio.to_thread(shutil.rmtree, worktree_path)
+            if env_path and env_path.exists():
+                await asyncio.to_thread(shutil.rmtree, env_path)
+            
+            # This command is needed to finalize the removal
+            await run_command_async(f"git worktree prune", repo_root)
         
         # Final JSON output for the UI
         print(f"ATLAS_JSON_RESULT:{json.dumps(results)}")
 
+    return results
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Atlas Patch Verification Tool")
     parser.add_argument("--patch-file", required=True, help="Path to the patch diff file to verify.")
+    parser.add_argument("--no-cache", action="store_true", help="Run the build and tests even if this patch was verified before.")
     args = parser.parse_args()
 
     try:
-        verify_patch(args.patch_file)
+        verify_patch(args.patch_file, use_cache=not args.no_cache)
     except Exception as e:
         print(f"An unhandled error occurred: {e}", file=sys.stderr)
         sys.exit(1)
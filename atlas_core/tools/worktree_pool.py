@@ -0,0 +1,431 @@
+"""
+Atlas Worktree Pool
+Pre-created verification worktrees that are leased, reset to the base commit and reused
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+
+POOL_DIR = Path(__file__).parent.parent / 'cache' / 'worktrees'
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+DEFAULT_SIZE = 2
+DEFAULT_LEASE_TIMEOUT_SECONDS = 3600
+DEFAULT_ACQUIRE_TIMEOUT_SECONDS = 600
+ACQUIRE_POLL_SECONDS = 0.2
+
+DEFAULT_TMPFS_PATH = '/dev/shm'
+DEFAULT_TMPFS_MAX_MB = 2048
+DEFAULT_TMPFS_MIN_FREE_MB = 512
+DEFAULT_SPARSE_INCLUDE = ['tests']
+
+
+def _git(args: list, cwd) -> subprocess.CompletedProcess:
+    return subprocess.run(['git'] + args, cwd=cwd, capture_output=True, text=True)
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == 'nt':
+        return True  # os.kill(pid, 0) would terminate it on Windows; stale leases expire by age instead
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def sparse_dirs(paths, include=()) -> list:
+    """
+    The cone-mode directories covering `paths` plus `include`: each file's directory,
+    with directories nested in another one dropped. Files at the root need no entry,
+    as a cone checkout always contains the root's files.
+    """
+    dirs = {PurePosixPath(path).as_posix().strip('/') for path in include}
+    dirs.update(PurePosixPath(path).parent.as_posix() for path in paths)
+    dirs = sorted(d for d in dirs if d not in ('', '.'))
+    return [d for d in dirs if not any(d.startswith(other + '/') for other in dirs)]
+
+
+def checkout_bytes(repo_root, base: str, dirs: list = None) -> int:
+    """Size of the files a checkout of `base` writes: all of them, or the root files plus `dirs`."""
+    if dirs is None:
+        listings = [['-r', base]]
+    else:
+        listings = [[base]] + ([['-r', base, '--'] + dirs] if dirs else [])
+    total = 0
+    for listing in listings:
+        result = _git(['ls-tree', '-l', '-z'] + listing, repo_root)
+        if result.returncode != 0:
+            raise RuntimeError(f"Cannot list {base}: {result.stderr.strip()}")
+        for entry in result.stdout.split('\0'):
+            fields = entry.split(None, 4)
+            if len(fields) == 5 and fields[1] == 'blob' and fields[3] != '-':
+                total += int(fields[3])
+    return total
+
+
+def tmpfs_root(config: dict):
+    """The configured tmpfs directory when RAM-backed worktrees are enabled and it is usable, else None."""
+    tmpfs_config = (config or {}).get('verification', {}).get('tmpfs', {})
+    if not tmpfs_config.get('enabled', False) or os.name == 'nt':
+        return None
+    path = Path(tmpfs_config.get('path', DEFAULT_TMPFS_PATH))
+    return path if path.is_dir() and os.access(path, os.W_OK | os.X_OK) else None
+
+
+def plan_checkout(config: dict, repo_root, base: str, sparse: list = None) -> dict:
+    """
+    Where a verification worktree of `base` goes: on the tmpfs when one is enabled and
+    the checkout (limited to `sparse` directories, if given) fits `max_mb` while leaving
+    `min_free_mb` of it free, on disk otherwise.
+
+    Returns:
+        dict with location ("tmpfs" or "disk"), sparse, checkout_bytes and the reason
+        for a disk placement when a tmpfs was wanted
+    """
+    tmpfs_config = (config or {}).get('verification', {}).get('tmpfs', {})
+    plan = {"location": "disk", "sparse": sparse, "checkout_bytes": None, "reason": None}
+    if not tmpfs_config.get('enabled', False) and sparse is None:
+        return plan
+    plan["checkout_bytes"] = checkout_bytes(repo_root, base, sparse)
+    if not tmpfs_config.get('enabled', False):
+        return plan
+    root = tmpfs_root(config)
+    max_bytes = tmpfs_config.get('max_mb', DEFAULT_TMPFS_MAX_MB) * 1024 * 1024
+    if root is None:
+        plan["reason"] = f"{tmpfs_config.get('path', DEFAULT_TMPFS_PATH)} is not a writable directory"
+    elif plan["checkout_bytes"] > max_bytes:
+        plan["reason"] = f"checkout exceeds the {tmpfs_config.get('max_mb', DEFAULT_TMPFS_MAX_MB)} MB budget"
+    else:
+        free = shutil.disk_usage(root).free
+        if free - plan["checkout_bytes"] < tmpfs_config.get('min_free_mb', DEFAULT_TMPFS_MIN_FREE_MB) * 1024 * 1024:
+            plan["reason"] = f"only {free // (1024 * 1024)} MB free on {root}"
+        else:
+            plan["location"] = "tmpfs"
+    return plan
+
+
+def tmpfs_pool_dir(config: dict, repo_root=None) -> Path:
+    """This repository's pool directory on the tmpfs (several checkouts may share one tmpfs)."""
+    tmpfs_config = (config or {}).get('verification', {}).get('tmpfs', {})
+    digest = hashlib.sha256(str(Path(repo_root or REPO_ROOT).resolve()).encode()).hexdigest()[:12]
+    return Path(tmpfs_config.get('path', DEFAULT_TMPFS_PATH)) / f"atlas-worktrees-{digest}"
+
+
+def add_worktree(repo_root, path: Path, base: str, sparse: list = None) -> subprocess.CompletedProcess:
+    """`git worktree add --detach`; with `sparse`, a cone-mode sparse checkout of those directories."""
+    if sparse is None:
+        return _git(['worktree', 'add', '--detach', '--force', str(path), base], repo_root)
+    result = _git(['worktree', 'add', '--detach', '--force', '--no-checkout', str(path), base], repo_root)
+    if result.returncode == 0:
+        result = set_sparse(path, sparse)
+    if result.returncode == 0:
+        result = _git(['reset', '--hard', '-q', base], path)
+    return result
+
+
+def set_sparse(path: Path, sparse: list = None) -> subprocess.CompletedProcess:
+    """Limit the worktree's checkout to `sparse` directories, or restore the full checkout for None."""
+    if sparse is None:
+        return _git(['sparse-checkout', 'disable'], path)
+    # Per-worktree setting: the main checkout and the other worktrees stay full
+    return _git(['sparse-checkout', 'set', '--cone'] + sparse, path)
+
+
+class Lease:
+    """A worktree leased from the pool; release() hands it back (also on leaving a `with` block)."""
+
+    def __init__(self, pool, slot: str, path: Path, base: str, reused: bool, wait_ms: float, setup_ms: float,
+                 sparse: list = None):
+        self.pool = pool
+        self.slot = slot
+        self.path = path
+        self.base = base
+        self.reused = reused
+        self.wait_ms = wait_ms
+        self.setup_ms = setup_ms
+        self.sparse = sparse
+
+    @property
+    def env_path(self) -> Path:
+        return self.pool.env_path(self.slot)
+
+    def release(self):
+        self.pool.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class WorktreePool:
+    """
+    A fixed set of git worktrees under atlas_core/cache/worktrees, named
+    `<worktree_prefix><n>` and checked out detached.
+
+    A lease is a `<name>.lease` file created exclusively, so verification jobs in
+    different processes never share a worktree. Leasing resets the worktree to the
+    requested commit (`git reset --hard` plus `git clean`) instead of checking out a new
+    one; a worktree that fails its health check is removed and re-created. A lease
+    whose process has exited, or that is older than `lease_timeout_seconds`, is
+    treated as stale and taken over.
+
+    A pool may live elsewhere, e.g. on a tmpfs (see tmpfs_pool_dir()), and its
+    worktrees may be sparse: each remembers its cone in `<name>.sparse` so a reset
+    only changes it when the next lease asks for different directories.
+    """
+
+    def __init__(self, config: dict = None, repo_root=REPO_ROOT, pool_dir=POOL_DIR):
+        verification_config = (config or {}).get('verification', {})
+        pool_config = verification_config.get('worktree_pool', {})
+        self.repo_root = Path(repo_root)
+        self.pool_dir = Path(pool_dir)
+        self.prefix = verification_config.get('worktree_prefix', 'atlas-verify-')
+        self.size = pool_config.get('size', DEFAULT_SIZE)
+        self.lease_timeout = pool_config.get('lease_timeout_seconds', DEFAULT_LEASE_TIMEOUT_SECONDS)
+        self.acquire_timeout = pool_config.get('acquire_timeout_seconds', DEFAULT_ACQUIRE_TIMEOUT_SECONDS)
+        # Ignored files (build outputs) are deleted on reset by default, so one patch's
+        # artifacts cannot affect the next verification; false keeps incremental builds warm
+        self.clean_args = ['clean', '-fdqx'] if pool_config.get('clean_ignored', True) else ['clean', '-fdq']
+
+    def slots(self) -> list:
+        return [f"{self.prefix}{index}" for index in range(self.size)]
+
+    def _lease_path(self, slot: str) -> Path:
+        return self.pool_dir / f"{slot}.lease"
+
+    def _sparse_path(self, slot: str) -> Path:
+        return self.pool_dir / f"{slot}.sparse"
+
+    def env_path(self, slot: str) -> Path:
+        """Where the slot's linked dependency environment goes: always on disk, beside the cached environments."""
+        name = slot if self.pool_dir == POOL_DIR else f"{self.pool_dir.name}-{slot}"
+        return POOL_DIR / f"{name}.env"
+
+    def _read_sparse(self, slot: str):
+        try:
+            return json.loads(self._sparse_path(slot).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_sparse(self, slot: str, sparse: list = None):
+        if sparse is None:
+            self._sparse_path(slot).unlink(missing_ok=True)
+        else:
+            self._sparse_path(slot).write_text(json.dumps(sparse))
+
+    def _read_lease(self, slot: str):
+        try:
+            return json.loads(self._lease_path(slot).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _is_stale(self, lease: dict) -> bool:
+        if lease is None:
+            return True  # unreadable: being written, or left half-written by a crash
+        if time.time() - lease.get('acquired_at', 0) > self.lease_timeout:
+            return True
+        return lease.get('host') == socket.gethostname() and not _pid_alive(lease.get('pid', 0))
+
+    def _try_lease(self, slot: str, base: str) -> bool:
+        """Create the slot's lease file, taking over a stale one; False if the slot is busy."""
+        lease_path = self._lease_path(slot)
+        for _ in range(2):
+            try:
+                fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                current = self._read_lease(slot)
+                try:
+                    if current is None and time.time() - lease_path.stat().st_mtime < 5:
+                        return False  # another process is still writing it
+                except FileNotFoundError:
+                    continue  # released meanwhile
+                if not self._is_stale(current):
+                    return False
+                # Rename first so two processes cannot both take over the same stale lease
+                try:
+                    os.replace(lease_path, lease_path.with_suffix(f'.stale-{os.getpid()}'))
+                except FileNotFoundError:
+                    return False
+                lease_path.with_suffix(f'.stale-{os.getpid()}').unlink()
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"pid": os.getpid(), "host": socket.gethostname(), "acquired_at": time.time(),
+                           "acquired": datetime.now().isoformat(), "base": base}, f)
+            return True
+        return False
+
+    def _healthy(self, path: Path) -> bool:
+        """The worktree exists and git sees it as its own checkout of this repository."""
+        if not (path / '.git').exists():
+            return False
+        result = _git(['rev-parse', '--show-toplevel'], path)
+        return result.returncode == 0 and Path(result.stdout.strip()).resolve() == path.resolve()
+
+    def _create(self, path: Path, base: str, sparse: list = None):
+        if path.exists():
+            shutil.rmtree(path)
+        _git(['worktree', 'prune'], self.repo_root)
+        self._write_sparse(path.name, None)
+        result = add_worktree(self.repo_root, path, base, sparse)
+        if result.returncode != 0:
+            # A half-written checkout (e.g. a full tmpfs) would otherwise hold its space until the next lease
+            shutil.rmtree(path, ignore_errors=True)
+            _git(['worktree', 'prune'], self.repo_root)
+            raise RuntimeError(f"Failed to create worktree {path.name}: {result.stderr.strip()}")
+        self._write_sparse(path.name, sparse)
+
+    def _reset(self, path: Path, base: str, sparse: list = None) -> bool:
+        for args in (['reset', '--hard', '-q', base], self.clean_args):
+            if _git(args, path).returncode != 0:
+                return False
+        if self._read_sparse(path.name) != sparse:
+            self._write_sparse(path.name, None)
+            if set_sparse(path, sparse).returncode != 0:
+                return False
+            self._write_sparse(path.name, sparse)
+        return True
+
+    def resolve(self, base: str = 'HEAD') -> str:
+        result = _git(['rev-parse', '--verify', f'{base}^{{commit}}'], self.repo_root)
+        if result.returncode != 0:
+            raise RuntimeError(f"Unknown base commit {base}: {result.stderr.strip()}")
+        return result.stdout.strip()
+
+    def acquire(self, base: str = 'HEAD', timeout: float = None, sparse: list = None) -> Lease:
+        """
+        Lease a worktree checked out at `base` (resolved to a commit), waiting up to
+        `timeout` seconds (default `acquire_timeout_seconds`) for one to free up. With
+        `sparse`, only the root files and those directories are checked out.
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        commit = self.resolve(base)
+        self.pool_dir.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        while True:
+            for slot in self.slots():
+                if not self._try_lease(slot, commit):
+                    continue
+                leased = time.perf_counter()
+                path = self.pool_dir / slot
+                try:
+                    reused = self._healthy(path) and self._reset(path, commit, sparse)
+                    if not reused:
+                        self._create(path, commit, sparse)
+                except Exception:
+                    self._lease_path(slot).unlink(missing_ok=True)
+                    raise
+                return Lease(self, slot, path, commit, reused, (leased - started) * 1000,
+                             (time.perf_counter() - leased) * 1000, sparse)
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"No verification worktree free after {timeout}s "
+                                   f"(pool size {self.size})")
+            time.sleep(ACQUIRE_POLL_SECONDS)
+
+    def release(self, lease: Lease):
+        """Hand the worktree back; it is reset when next leased."""
+        current = self._read_lease(lease.slot)
+        if current and current.get('pid') == os.getpid():
+            self._lease_path(lease.slot).unlink(missing_ok=True)
+
+    def warm(self, base: str = 'HEAD') -> list:
+        """Create (or reset) every free worktree ahead of the first verification."""
+        warmed = []
+        for _ in self.slots():
+            try:
+                lease = self.acquire(base, timeout=0)
+            except TimeoutError:
+                break
+            warmed.append(lease)
+        for lease in warmed:
+            lease.release()
+        return warmed
+
+    def status(self) -> list:
+        """One entry per slot: whether it exists and is healthy, and its current lease."""
+        entries = []
+        for slot in self.slots():
+            path = self.pool_dir / slot
+            lease = self._read_lease(slot)
+            entries.append({
+                "slot": slot,
+                "exists": path.exists(),
+                "healthy": self._healthy(path),
+                "lease": lease,
+                "sparse": self._read_sparse(slot),
+                "stale": lease is not None and self._is_stale(lease)
+            })
+        return entries
+
+    def remove(self):
+        """Delete every free worktree of the pool (leased ones are left alone)."""
+        removed = []
+        for slot in self.slots():
+            if not self._try_lease(slot, 'remove'):
+                continue
+            path = self.pool_dir / slot
+            if path.exists():
+                _git(['worktree', 'remove', '--force', str(path)], self.repo_root)
+                shutil.rmtree(path, ignore_errors=True)
+            shutil.rmtree(self.env_path(slot), ignore_errors=True)  # linked dependency environment
+            self._sparse_path(slot).unlink(missing_ok=True)
+            self._lease_path(slot).unlink(missing_ok=True)
+            removed.append(slot)
+        _git(['worktree', 'prune'], self.repo_root)
+        if self.pool_dir != POOL_DIR and self.pool_dir.exists() and not any(self.pool_dir.iterdir()):
+            self.pool_dir.rmdir()  # give the tmpfs back
+        return removed
+
+
+_pools = {}
+
+
+def get_worktree_pool(config: dict, location: str = 'disk') -> WorktreePool:
+    """The process-wide pool for this config's prefix and size, on disk or on the tmpfs."""
+    pool_dir = tmpfs_pool_dir(config) if location == 'tmpfs' else POOL_DIR
+    pool = WorktreePool(config, pool_dir=pool_dir)
+    key = (pool.prefix, pool.size, str(pool.pool_dir))
+    return _pools.setdefault(key, pool)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atlas Worktree Pool")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--warm", action="store_true", help="Create or reset every free worktree now.")
+    group.add_argument("--remove", action="store_true", help="Delete every free worktree of the pool.")
+    parser.add_argument("--base", default="HEAD", help="Commit to check the worktrees out at (with --warm).")
+    parser.add_argument("--tmpfs", action="store_true", help="Act on the pool on the configured tmpfs.")
+    args = parser.parse_args()
+
+    if __package__ in (None, ''):
+        sys.path.insert(0, str(REPO_ROOT))
+    from atlas_core.tools.verify_patch import load_config
+
+    atlas_config = load_config()
+    worktree_pool = get_worktree_pool(atlas_config, 'tmpfs' if args.tmpfs else 'disk')
+    if args.warm:
+        for warmed_lease in worktree_pool.warm(args.base):
+            action = "reset" if warmed_lease.reused else "created"
+            print(f"🌲 {warmed_lease.slot}: {action} at {warmed_lease.base[:10]} in {warmed_lease.setup_ms:.0f} ms")
+    elif args.remove:
+        print(f"🧹 Removed: {', '.join(worktree_pool.remove()) or 'nothing'}")
+        # The tmpfs pool goes too (even once disabled): it only holds copies, and its RAM is better freed
+        tmpfs_dir = tmpfs_pool_dir(atlas_config)
+        if not args.tmpfs and tmpfs_dir.exists():
+            removed_tmpfs = get_worktree_pool(atlas_config, 'tmpfs').remove()
+            print(f"🧹 Removed from {tmpfs_dir}: {', '.join(removed_tmpfs) or 'nothing'}")
+    for slot_status in worktree_pool.status():
+        print(f"ATLAS_JSON_RESULT:{json.dumps(slot_status)}")
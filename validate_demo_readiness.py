@@ -3,6 +3,8 @@ Atlas Pre-Demo Validation Script
 Run this before class to ensure everything is working
 """
 
+import argparse
+import os
 import sys
 from pathlib import Path
 
@@ -44,7 +46,7 @@ def check_config():
         config = yaml.safe_load(f)
     
     local_endpoint = config.get('llm_endpoints', {}).get('local', {})
-    url = local_endpoint.get('url', '')
+    url = os.environ.get('ATLAS_LLM_URL') or local_endpoint.get('url', '')
     
     if '<HTPC_IP_ADDRESS>' in url:
         print(f"  ⚠️  HTPC IP not configured!")
@@ -72,6 +74,7 @@ def test_llm_connection():
         config = yaml.safe_load(f)
     
     endpoint = config['llm_endpoints']['local']
+    endpoint['url'] = os.environ.get('ATLAS_LLM_URL') or endpoint['url']
     
     if not endpoint['enabled']:
         print("  ⚠️  Local endpoint disabled in config")
@@ -162,13 +165,37 @@ def test_patch_generation():
         print("\n❌ Patch generation failed\n")
         return False
 
+def start_mock_server():
+    """Serve canned responses locally so the checks run without a GPU box"""
+    from atlas_core.tools.mock_ollama import MockOllamaServer
+    
+    import yaml
+    
+    config_path = Path(__file__).parent / 'atlas_core' / 'config' / 'llm_config.yaml'
+    with open(config_path, 'r') as f:
+        url = yaml.safe_load(f)['llm_endpoints']['local']['url']
+    route = '/v1/chat/completions' if '/v1/' in url else '/api/chat'
+    
+    server = MockOllamaServer().start()
+    os.environ['ATLAS_LLM_URL'] = f"{server.base_url}{route}"
+    print(f"🧪 Using mock LLM server: {os.environ['ATLAS_LLM_URL']}\n")
+    return server
+
 def main():
     """Run all validation checks"""
+    parser = argparse.ArgumentParser(description="Atlas Pre-Demo Validation")
+    parser.add_argument('--mock', action='store_true',
+                        help='Check against the bundled mock LLM server instead of the configured endpoint')
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("Atlas Pre-Demo Validation")
     print("=" * 60)
     print()
     
+    if args.mock:
+        start_mock_server()
+    
     checks = [
         ("Dependencies", check_dependencies),
         ("Configuration", check_config),